@@ -1,32 +1,84 @@
-from flask import Flask
-import logging
+from typing import TYPE_CHECKING, Any, Mapping, Optional
 
-from .core.database_manager import DatabaseManager
-from .core.cache_manager import CacheManager
-from .core.task_manager import TaskManager
-from .tasks.callbacks import initialize_callback_manager
-from .api.routes import create_routes
+if TYPE_CHECKING:
+    from flask import Flask
+    from quart import Quart
+    from .core.task_manager import TaskManager
 
 
-def create_app(config_name: str) -> Flask:
+def _create_task_manager(config: Mapping[str, Any]) -> 'TaskManager':
+    # The managers shared by both app factories, and the logging they configure
+    from .core.database_manager import DatabaseManager
+    from .core.cache_manager import CacheManager
+    from .core.task_manager import TaskManager
+    from .core.metrics import metrics
+    from .core.log_setup import configure_logging
+    from .tasks.callbacks import initialize_callback_manager
+    from .tasks.instrumentation import connect_task_metrics
+    from .tasks import task_functions  # noqa: F401 - registers the tasks in the task registry
+
+    # Initialize managers
+    db_manager = DatabaseManager(config)
+    cache_manager = CacheManager(config)
+    initialize_callback_manager(db_manager, cache_manager)
+    metrics.configure(cache_manager, config['METRICS_KEY'], config['METRICS_FLUSH_INTERVAL'])
+    connect_task_metrics()
+    task_manager = TaskManager(config, db_manager, cache_manager)
+    if config['TASK_PUBLISH_MODE'] == 'outbox' and config['OUTBOX_RELAY_AT_STARTUP']:
+        # Relay the messages left unpublished by a crash or a restart, even before the first submission
+        task_manager.outbox_relay.start()
+
+    # Set up logging, written to LOG_FILE by a background thread
+    configure_logging(config)
+
+    return task_manager
+
+
+def create_app(config_name: Optional[str] = None) -> 'Flask':
+    # Flask and the API are imported here rather than at module level, so importing the app package
+    # (as the Celery worker does for the task modules) doesn't load them
+    from flask import Flask
+    from config import config_name as default_config_name
+    from .api.routes import create_routes
+
+    config_name = config_name or default_config_name()
     app = Flask(__name__)
     
     # Load configuration
     app.config.from_object(f'config.{config_name}.{config_name.capitalize()}Config')
     
-    # Initialize managers
-    db_manager = DatabaseManager(app.config)
-    cache_manager = CacheManager(app.config)
-    initialize_callback_manager(db_manager, cache_manager)
-    task_manager = TaskManager(app.config, db_manager, cache_manager)
-    
-    # Set up logging
-    logging.basicConfig(level=app.config['LOG_LEVEL'],
-                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                        filename='logs/app.log',
-                        filemode='a')
+    task_manager = _create_task_manager(app.config)
     
     # Register blueprints
     app.register_blueprint(create_routes(task_manager))
     
     return app
+
+
+def create_asgi_app(config_name: Optional[str] = None) -> 'Quart':
+    # The same API as an ASGI app, to serve with an asyncio server (e.g. hypercorn run_asgi:app)
+    # Needs the packages of requirements-async.txt
+    from quart import Quart
+    from config import config_name as default_config_name
+    from .core.async_database_manager import AsyncDatabaseManager
+    from .core.async_cache_manager import AsyncCacheManager
+    from .core.async_task_manager import AsyncTaskManager
+    from .api.async_routes import create_async_routes
+
+    config_name = config_name or default_config_name()
+    app = Quart(__name__)
+
+    # Load configuration
+    app.config.from_object(f'config.{config_name}.{config_name.capitalize()}Config')
+
+    task_manager = AsyncTaskManager(_create_task_manager(app.config), AsyncDatabaseManager(app.config),
+                                    AsyncCacheManager(app.config))
+
+    # Register blueprints
+    app.register_blueprint(create_async_routes(task_manager))
+
+    @app.after_serving
+    async def close_connections() -> None:
+        await task_manager.close()
+
+    return app
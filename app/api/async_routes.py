@@ -0,0 +1,172 @@
+from typing import Tuple, AsyncIterator, Optional, Dict, Any
+import asyncio
+import time
+
+from quart import Blueprint, request, jsonify, Response, g
+from ..core.async_task_manager import AsyncTaskManager
+from ..models.task import TERMINAL_STATUSES
+from ..core.blob_store import BlobNotFoundError
+from ..core.metrics import metrics, REQUEST_DURATION, CONTENT_TYPE
+from ..tasks.validation import ValidationError
+from .common import (NOT_FOUND, BLOB_EXPIRED, INTERNAL_ERROR, SSE_HEADERS, SSE_KEEP_ALIVE, SSE_INTERNAL_ERROR,
+                     OUTPUT_STREAM_END, output_stream_start, output_stream_chunk, run_task_args, run_tasks_args,
+                     task_uuids_arg, limit_arg, wait_arg, sse_timeout_arg, status_event, task_outputs_body)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def stream_task_output(output: Dict[str, Any], chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    yield output_stream_start(output)
+    async for chunk in chunks:
+        yield output_stream_chunk(chunk)
+    yield OUTPUT_STREAM_END
+
+
+def create_async_routes(task_manager: AsyncTaskManager) -> Blueprint:
+    # The routes of create_routes for the ASGI app, with the same paths, parameters, responses and status codes,
+    # validated and built by the helpers of common.py
+    bp = Blueprint('api', __name__)
+
+    @bp.before_request
+    async def start_timer() -> None:
+        g.request_started_at = time.perf_counter()
+
+    @bp.after_request
+    async def record_duration(response: Response) -> Response:
+        # Labelled by route pattern rather than path, so the task UUIDs don't create a series each
+        started_at = g.get('request_started_at')
+        if started_at is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_DURATION.observe(time.perf_counter() - started_at, request.method, route, str(response.status_code))
+        return response
+
+    @bp.route('/metrics', methods=['GET'])
+    async def get_metrics() -> Tuple[Response, int]:
+        # Reading the aggregated metrics is a blocking Redis call, made in a thread
+        try:
+            return Response(await asyncio.to_thread(metrics.exposition), content_type=CONTENT_TYPE), 200
+        except Exception as e:
+            logger.exception("Error in get_metrics")
+            return jsonify({'error': str(e)}), 500
+
+    @bp.route('/run-task', methods=['POST'])
+    async def run_task() -> Tuple[Response, int]:
+        try:
+            task_name, task_parameters = run_task_args(await request.get_json(silent=True))
+            idempotency_key: Optional[str] = request.headers.get('Idempotency-Key')
+            result: Dict[str, Any] = await task_manager.submit_task(task_name, task_parameters, idempotency_key)
+            return jsonify(result), 200
+
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except Exception as e:
+            logger.exception("Error in run_task")
+            return jsonify({'error': str(e)}), 500
+
+    @bp.route('/run-tasks', methods=['POST'])
+    async def run_tasks() -> Tuple[Response, int]:
+        try:
+            results = await task_manager.create_tasks(run_tasks_args(await request.get_json(silent=True)))
+            return jsonify({'results': results}), 200
+
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except Exception as e:
+            logger.exception("Error in run_tasks")
+            return jsonify({'error': str(e)}), 500
+
+    @bp.route('/tasks', methods=['GET'])
+    async def list_tasks() -> Tuple[Response, int]:
+        try:
+            page = await task_manager.list_tasks(request.args.get('task_name'), request.args.get('status'),
+                                                 limit_arg(request.args), request.args.get('cursor'))
+            return jsonify(page), 200
+
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except Exception as e:
+            logger.exception("Error in list_tasks. Error: %s", e)
+            return jsonify(INTERNAL_ERROR), 500
+
+    @bp.route('/get-task-output', methods=['GET'])
+    async def get_task_output() -> Tuple[Response, int]:
+        try:
+            task_uuid: str = request.args.get('task_uuid')
+            wait = wait_arg(request.args, task_manager.config)
+
+            if wait:
+                output = await task_manager.wait_for_task_output(task_uuid, wait)
+            else:
+                output = await task_manager.get_task_output(task_uuid)
+
+            if output is None:
+                return jsonify(NOT_FOUND), 404
+
+            chunks = await task_manager.iter_result_text(output)
+            if chunks is not None:
+                return Response(stream_task_output(output, chunks), mimetype='application/json'), 200
+
+            return jsonify({'task_output': output}), 200
+
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except BlobNotFoundError:
+            return jsonify(BLOB_EXPIRED), 410
+
+        except Exception as e:
+            logger.exception("Error in get_task_output. Error: %s", e)
+            return jsonify(INTERNAL_ERROR), 500
+
+    @bp.route('/task-events', methods=['GET'])
+    async def task_events() -> Response:
+        task_uuid: str = request.args.get('task_uuid')
+        timeout = sse_timeout_arg(request.args, task_manager.config)
+        heartbeat: float = task_manager.config['SSE_HEARTBEAT_INTERVAL']
+
+        async def events() -> AsyncIterator[str]:
+            deadline = time.monotonic() + timeout
+            try:
+                output = await task_manager.get_task_output(task_uuid)
+                yield status_event(await task_manager.load_result(output))
+                while output is not None and output['status'] not in TERMINAL_STATUSES:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    latest = await task_manager.wait_for_task_output(task_uuid, min(heartbeat, remaining))
+                    if latest != output:
+                        output = latest
+                        yield status_event(await task_manager.load_result(output))
+                    else:
+                        yield SSE_KEEP_ALIVE
+            except Exception as e:
+                logger.exception("Error in task_events. Error: %s", e)
+                yield SSE_INTERNAL_ERROR
+
+        return Response(events(), mimetype='text/event-stream',
+                        headers=SSE_HEADERS)
+
+    @bp.route('/get-task-outputs', methods=['POST'])
+    async def get_task_outputs() -> Tuple[Response, int]:
+        try:
+            task_uuids = task_uuids_arg(await request.get_json(silent=True))
+            outputs = await task_manager.get_task_outputs(task_uuids)
+
+            return jsonify(task_outputs_body(task_uuids,
+                                             [await task_manager.load_result(output) for output in outputs])), 200
+
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except BlobNotFoundError:
+            return jsonify(BLOB_EXPIRED), 410
+
+        except Exception as e:
+            logger.exception("Error in get_task_outputs. Error: %s", e)
+            return jsonify(INTERNAL_ERROR), 500
+
+    return bp
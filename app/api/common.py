@@ -0,0 +1,95 @@
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+import json
+
+from werkzeug.datastructures import MultiDict
+
+from ..tasks.validation import ValidationError
+
+# Request validation and response bodies shared by the Flask routes and the ASGI ones, which only differ
+# in how they call the task manager. Invalid requests raise ValidationError, answered with a 400
+
+NOT_FOUND: Dict[str, str] = {'error': 'Task not found'}
+BLOB_EXPIRED: Dict[str, str] = {'error': 'Task output is no longer available'}
+INTERNAL_ERROR: Dict[str, str] = {'Error': 'Internal Server Error'}
+
+SSE_HEADERS: Dict[str, str] = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+SSE_KEEP_ALIVE = ": keep-alive\n\n"
+SSE_INTERNAL_ERROR = f"event: error\ndata: {json.dumps({'error': 'Internal Server Error'})}\n\n"
+
+# {"task_output": ...} with a large result string written chunk by chunk, instead of building it in memory
+# Each chunk is escaped on its own, which is valid as JSON escapes never span two characters
+OUTPUT_STREAM_END = '"}}'
+
+
+def output_stream_start(output: Dict[str, Any]) -> str:
+    return '{"task_output": {"status": %s, "error": %s, "result": "' % (json.dumps(output['status']),
+                                                                       json.dumps(output['error']))
+
+
+def output_stream_chunk(chunk: str) -> str:
+    return json.dumps(chunk)[1:-1]
+
+
+def run_task_args(payload: Any) -> Tuple[str, Dict[str, Any]]:
+    # The task name and parameters of a /run-task body
+    if not isinstance(payload, dict) or 'task_name' not in payload or 'task_parameters' not in payload:
+        raise ValidationError("Request body must be an object with 'task_name' and 'task_parameters'")
+    return payload['task_name'], payload['task_parameters']
+
+
+def run_tasks_args(payload: Any) -> List[Dict[str, Any]]:
+    # The task specs of a /run-tasks body
+    task_specs = payload.get('tasks') if isinstance(payload, dict) else None
+    if not isinstance(task_specs, list):
+        raise ValidationError("'tasks' must be a list")
+    return task_specs
+
+
+def task_uuids_arg(payload: Any) -> List[str]:
+    # The task UUIDs of a /get-task-outputs body
+    task_uuids = payload.get('task_uuids') if isinstance(payload, dict) else None
+    if not isinstance(task_uuids, list) or not all(isinstance(task_uuid, str) for task_uuid in task_uuids):
+        raise ValidationError("'task_uuids' must be a list of strings")
+    return task_uuids
+
+
+def limit_arg(args: MultiDict) -> Optional[int]:
+    # The ?limit= of /tasks, None if not given
+    limit = args.get('limit', type=int)
+    if 'limit' in args and limit is None:
+        raise ValidationError("'limit' must be an integer")
+    return limit
+
+
+def wait_arg(args: MultiDict, config: Mapping[str, Any]) -> float:
+    # The ?wait= of /get-task-output in seconds, capped at LONG_POLL_MAX_WAIT, 0 to answer at once
+    # Parsed explicitly, args.get(type=float) would turn a value that isn't a number into the default
+    error = ValidationError("'wait' must be a non-negative number of seconds")
+    try:
+        wait = float(args['wait']) if 'wait' in args else 0.0
+    except ValueError:
+        raise error from None
+    if not wait >= 0:
+        raise error
+    return min(wait, config['LONG_POLL_MAX_WAIT'])
+
+
+def sse_timeout_arg(args: MultiDict, config: Mapping[str, Any]) -> float:
+    # The ?timeout= of /task-events in seconds, capped at SSE_MAX_DURATION
+    return min(args.get('timeout', type=float, default=config['SSE_MAX_DURATION']), config['SSE_MAX_DURATION'])
+
+
+def status_event(output: Optional[Dict[str, Any]]) -> str:
+    # A /task-events event for an output with its result loaded, or for a task not found (None)
+    if output is None:
+        return f"event: error\ndata: {json.dumps(NOT_FOUND)}\n\n"
+    return f"event: status\ndata: {json.dumps({'task_output': output})}\n\n"
+
+
+def task_outputs_body(task_uuids: List[str], outputs: List[Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    # The /get-task-outputs response for outputs with their results loaded, unknown tasks are marked as not found
+    return {'task_outputs': [
+        {'task_uuid': task_uuid, 'task_output': output} if output is not None
+        else {'task_uuid': task_uuid, 'error': NOT_FOUND['error']}
+        for task_uuid, output in zip(task_uuids, outputs)
+    ]}
@@ -1,44 +1,182 @@
-from typing import Tuple
+from typing import Tuple, Iterator, Optional, Dict, Any
+import time
 
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, request, jsonify, Response, g, stream_with_context
 from ..core.task_manager import TaskManager
+from ..models.task import TERMINAL_STATUSES
+from ..core.blob_store import BlobNotFoundError
+from ..core.metrics import metrics, REQUEST_DURATION, CONTENT_TYPE
+from ..tasks.validation import ValidationError
+from .common import (NOT_FOUND, BLOB_EXPIRED, INTERNAL_ERROR, SSE_HEADERS, SSE_KEEP_ALIVE, SSE_INTERNAL_ERROR,
+                     OUTPUT_STREAM_END, output_stream_start, output_stream_chunk, run_task_args, run_tasks_args,
+                     task_uuids_arg, limit_arg, wait_arg, sse_timeout_arg, status_event, task_outputs_body)
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def stream_task_output(output: Dict[str, Any], chunks: Iterator[str]) -> Iterator[str]:
+    yield output_stream_start(output)
+    for chunk in chunks:
+        yield output_stream_chunk(chunk)
+    yield OUTPUT_STREAM_END
+
+
 def create_routes(task_manager: TaskManager) -> Blueprint:
     bp = Blueprint('api', __name__)
 
+    @bp.before_request
+    def start_timer() -> None:
+        g.request_started_at = time.perf_counter()
+
+    @bp.after_request
+    def record_duration(response: Response) -> Response:
+        # Labelled by route pattern rather than path, so the task UUIDs don't create a series each
+        # Streamed responses are timed until their first chunk is ready
+        started_at = g.get('request_started_at')
+        if started_at is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_DURATION.observe(time.perf_counter() - started_at, request.method, route, str(response.status_code))
+        return response
+
+    @bp.route('/metrics', methods=['GET'])
+    def get_metrics() -> Tuple[Response, int]:
+        # Counters and histograms of all web and worker processes in the Prometheus text format
+        try:
+            return Response(metrics.exposition(), content_type=CONTENT_TYPE), 200
+        except Exception as e:
+            logger.exception("Error in get_metrics")
+            return jsonify({'error': str(e)}), 500
+
     @bp.route('/run-task', methods=['POST'])
     def run_task() -> Tuple[Response, int]:
-        # TODO: Add input validation
         try:
-            task_name: str = request.json['task_name']
-            task_parameters: dict = request.json['task_parameters']
+            task_name, task_parameters = run_task_args(request.get_json(silent=True))
             
-            task_uuid: str = task_manager.create_task(task_name, task_parameters)
+            # Resubmissions with the same Idempotency-Key return the existing task instead of creating a new one
+            idempotency_key: Optional[str] = request.headers.get('Idempotency-Key')
+
+            result: Dict[str, Any] = task_manager.submit_task(task_name, task_parameters, idempotency_key)
             
-            return jsonify({'task_uuid': task_uuid}), 200
+            return jsonify(result), 200
+
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
         
         except Exception as e:
             logger.exception("Error in run_task")
             return jsonify({'error': str(e)}), 500
 
+    @bp.route('/run-tasks', methods=['POST'])
+    def run_tasks() -> Tuple[Response, int]:
+        # Submit a batch of tasks, errors are reported per item without failing the whole batch
+        try:
+            results = task_manager.create_tasks(run_tasks_args(request.get_json(silent=True)))
+
+            return jsonify({'results': results}), 200
+
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except Exception as e:
+            logger.exception("Error in run_tasks")
+            return jsonify({'error': str(e)}), 500
+
+    @bp.route('/tasks', methods=['GET'])
+    def list_tasks() -> Tuple[Response, int]:
+        # List tasks from the most recent, filtered by ?task_name= and ?status=, paginated with ?cursor=
+        try:
+            page = task_manager.list_tasks(request.args.get('task_name'), request.args.get('status'),
+                                           limit_arg(request.args), request.args.get('cursor'))
+
+            return jsonify(page), 200
+
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except Exception as e:
+            logger.exception("Error in list_tasks. Error: %s", e)
+            return jsonify(INTERNAL_ERROR), 500
+
     @bp.route('/get-task-output', methods=['GET'])
     def get_task_output() -> Tuple[Response, int]:
         try:
             task_uuid: str = request.args.get('task_uuid')
-            
-            output = task_manager.get_task_output(task_uuid)
+            wait = wait_arg(request.args, task_manager.config)
+
+            if wait:
+                # Long-poll: return as soon as the task finishes, or its current state after the wait
+                output = task_manager.wait_for_task_output(task_uuid, wait)
+            else:
+                output = task_manager.get_task_output(task_uuid)
             
             if output is None:
-                return jsonify({'error': 'Task not found'}), 404
+                return jsonify(NOT_FOUND), 404
+
+            # Results stored in the blob store are streamed back
+            chunks = task_manager.iter_result_text(output)
+            if chunks is not None:
+                return Response(stream_with_context(stream_task_output(output, chunks)),
+                                mimetype='application/json'), 200
             
             return jsonify({'task_output': output}), 200
+
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except BlobNotFoundError:
+            return jsonify(BLOB_EXPIRED), 410
         
         except Exception as e:
-            logger.exception(f"Error in get_task_output. Error: {str(e)}")
-            return jsonify({'Error': 'Internal Server Error'}), 500
+            logger.exception("Error in get_task_output. Error: %s", e)
+            return jsonify(INTERNAL_ERROR), 500
+
+    @bp.route('/task-events', methods=['GET'])
+    def task_events() -> Response:
+        # Stream the task status as server-sent events until the task finishes or the stream times out
+        task_uuid: str = request.args.get('task_uuid')
+        timeout = sse_timeout_arg(request.args, task_manager.config)
+        heartbeat: float = task_manager.config['SSE_HEARTBEAT_INTERVAL']
+
+        def events() -> Iterator[str]:
+            deadline = time.monotonic() + timeout
+            try:
+                output = task_manager.get_task_output(task_uuid)
+                yield status_event(task_manager.load_result(output))
+                while output is not None and output['status'] not in TERMINAL_STATUSES:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    latest = task_manager.wait_for_task_output(task_uuid, min(heartbeat, remaining))
+                    if latest != output:
+                        output = latest
+                        yield status_event(task_manager.load_result(output))
+                    else:
+                        yield SSE_KEEP_ALIVE
+            except Exception as e:
+                logger.exception("Error in task_events. Error: %s", e)
+                yield SSE_INTERNAL_ERROR
+
+        return Response(stream_with_context(events()), mimetype='text/event-stream',
+                        headers=SSE_HEADERS)
+
+    @bp.route('/get-task-outputs', methods=['POST'])
+    def get_task_outputs() -> Tuple[Response, int]:
+        # Get the outputs of several tasks in one request, unknown tasks are marked as not found
+        try:
+            task_uuids = task_uuids_arg(request.get_json(silent=True))
+            outputs = task_manager.get_task_outputs(task_uuids)
+
+            return jsonify(task_outputs_body(task_uuids, [task_manager.load_result(output) for output in outputs])), 200
+
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except BlobNotFoundError:
+            return jsonify(BLOB_EXPIRED), 410
+
+        except Exception as e:
+            logger.exception("Error in get_task_outputs. Error: %s", e)
+            return jsonify(INTERNAL_ERROR), 500
 
     return bp
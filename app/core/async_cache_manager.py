@@ -0,0 +1,55 @@
+from typing import Any, Dict, List, Mapping, Optional
+
+from redis.asyncio import Redis, BlockingConnectionPool
+from redis.asyncio.client import PubSub
+
+from .codec import Codec
+from .metrics import REDIS_COMMAND_DURATION
+
+
+class AsyncCacheManager:
+    # asyncio counterpart of CacheManager for the ASGI app, with the commands of the status lookups
+    # Values are encoded with the same codec, so both read what the other and the workers write
+    # Connections are made in the event loop serving the app, on first use
+    def __init__(self, config: Mapping[str, Any]) -> None:
+        self.config: Mapping[str, Any] = config
+        self.pool: BlockingConnectionPool = BlockingConnectionPool(
+            host=self.config['REDIS_HOST'],
+            port=self.config['REDIS_PORT'],
+            db=0,
+            max_connections=self.config['REDIS_POOL_SIZE'],
+            timeout=self.config['REDIS_POOL_TIMEOUT']
+        )
+        self.redis: Redis = Redis(connection_pool=self.pool)
+        self.codec: Codec = Codec(self.config['CACHE_CODEC'], self.config['CACHE_COMPRESS_THRESHOLD'])
+
+    @REDIS_COMMAND_DURATION.time('get')
+    async def get(self, key: str) -> Optional[bytes]:
+        # Get the value from the cache based on the key
+        return await self.redis.get(key)
+
+    @REDIS_COMMAND_DURATION.time('mget')
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        # Get the values of several keys in one round trip, missing keys are returned as None
+        if not keys:
+            return []
+        return await self.redis.mget(keys)
+
+    @REDIS_COMMAND_DURATION.time('mset')
+    async def set_many(self, mapping: Dict[str, Any], expire: Optional[int] = None) -> None:
+        # Set several keys in one round trip with an optional expiration time
+        if not mapping:
+            return
+        if not expire:
+            await self.redis.mset(mapping)
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.setex(key, expire, value)
+            await pipe.execute()
+
+    def pubsub(self) -> PubSub:
+        return self.redis.pubsub()
+
+    async def close(self) -> None:
+        await self.pool.disconnect()
@@ -0,0 +1,88 @@
+from typing import TYPE_CHECKING, Dict, Optional, Set
+import asyncio
+import logging
+
+from redis.exceptions import RedisError
+
+if TYPE_CHECKING:
+    from .async_cache_manager import AsyncCacheManager
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCompletionListener:
+    # asyncio counterpart of CompletionListener for the ASGI app: a single subscription read by a background
+    # task of the event loop wakes up the local waiters, each of which only costs an asyncio Event
+    def __init__(self, cache_manager: 'AsyncCacheManager', channel: str) -> None:
+        self.cache_manager: 'AsyncCacheManager' = cache_manager
+        self.channel: str = channel
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._subscribed: Optional[asyncio.Event] = None
+
+    async def subscribe(self, task_uuid: str) -> asyncio.Event:
+        # Register interest in a task, subscribe before checking the task status to avoid missing the message
+        await self._ensure_running()
+        event = asyncio.Event()
+        self._waiters.setdefault(task_uuid, set()).add(event)
+        return event
+
+    def unsubscribe(self, task_uuid: str, event: asyncio.Event) -> None:
+        events = self._waiters.get(task_uuid)
+        if events is not None:
+            events.discard(event)
+            if not events:
+                del self._waiters[task_uuid]
+
+    def _notify(self, task_uuid: str) -> None:
+        for event in self._waiters.get(task_uuid, ()):
+            event.set()
+
+    def _notify_all(self) -> None:
+        # Wake every waiter so it re-checks the task status, used when messages may have been lost
+        for events in self._waiters.values():
+            for event in events:
+                event.set()
+
+    async def _ensure_running(self) -> None:
+        # Start the listener task on first use, and again if it stopped
+        if self._task is None or self._task.done():
+            self._subscribed = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        # Wait briefly for the subscription to be confirmed so the first waiter can't miss its message
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), timeout=1)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                pubsub = self.cache_manager.pubsub()
+                try:
+                    await pubsub.subscribe(self.channel)
+                    while True:
+                        message = await pubsub.get_message(timeout=1.0)
+                        if message is None:
+                            continue
+                        if message['type'] == 'subscribe':
+                            self._subscribed.set()
+                        elif message['type'] == 'message':
+                            data = message['data']
+                            self._notify(data.decode() if isinstance(data, bytes) else data)
+                finally:
+                    await pubsub.aclose()
+            except RedisError:
+                logger.exception("Completion listener lost its connection, reconnecting")
+            self._subscribed.clear()
+            self._notify_all()
+            await asyncio.sleep(1)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,80 @@
+from typing import Any, Dict, List, Mapping, Optional
+import asyncio
+
+from psycopg import AsyncConnection
+from psycopg.adapt import Loader
+from psycopg.rows import dict_row
+from psycopg.types.json import set_json_loads
+from psycopg_pool import AsyncConnectionPool
+
+from .codec import json_loads
+from .metrics import DB_QUERY_DURATION
+
+
+class _UUIDTextLoader(Loader):
+    # Load UUID columns as strings, as psycopg2 does, so the rows match the ones of DatabaseManager
+    def load(self, data: Any) -> str:
+        return bytes(data).decode()
+
+
+class AsyncDatabaseManager:
+    # asyncio counterpart of DatabaseManager for the ASGI app, on psycopg 3 and its connection pool
+    # Queries take the same %s parameters and return the same dict rows, so the Task queries are shared
+    # The pool is opened in the event loop serving the app, on first use
+    def __init__(self, config: Mapping[str, Any]) -> None:
+        self.config: Mapping[str, Any] = config
+        self.pool: Optional[AsyncConnectionPool] = None
+        self._opening: Optional[asyncio.Future] = None
+
+    @staticmethod
+    async def _configure(connection: AsyncConnection) -> None:
+        # UUIDs as strings, and JSONB columns parsed with the shared codec (orjson when available)
+        connection.adapters.register_loader('uuid', _UUIDTextLoader)
+        set_json_loads(json_loads, connection)
+
+    async def open(self) -> None:
+        # Concurrent first uses share the same opening
+        if self._opening is None:
+            self._opening = asyncio.ensure_future(self._open_pool())
+        await self._opening
+
+    async def _open_pool(self) -> None:
+        pool = AsyncConnectionPool(
+            kwargs={
+                'host': self.config['DB_HOST'],
+                'dbname': self.config['DB_NAME'],
+                'user': self.config['DB_USER'],
+                'password': self.config['DB_PASSWORD'],
+                'row_factory': dict_row,
+            },
+            min_size=1,
+            max_size=self.config['DB_POOL_SIZE'],
+            max_idle=self.config['DB_POOL_MAX_IDLE'],
+            timeout=self.config['DB_POOL_TIMEOUT'],
+            configure=self._configure,
+            open=False
+        )
+        try:
+            await pool.open()
+        except Exception:
+            self._opening = None
+            raise
+        self.pool = pool
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+        self.pool = None
+        self._opening = None
+
+    @DB_QUERY_DURATION.time('execute')
+    async def execute(self, query: str, params: Optional[tuple] = None) -> Optional[List[Dict[str, Any]]]:
+        # Execute a query with optional parameters and return the results if any
+        # The transaction is committed when the connection goes back to the pool
+        if self.pool is None:
+            await self.open()
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(query, params)
+            if cur.description:
+                return await cur.fetchall()
+            return None
@@ -0,0 +1,145 @@
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple
+import asyncio
+import logging
+import time
+
+from redis.exceptions import RedisError
+
+from ..models.task import Task, TERMINAL_STATUSES, canonical_uuid
+from .task_manager import TaskManager
+from .blob_store import blob_id_of
+from .output_lookup import OutputLookup, cache_keys
+from .async_completion_listener import AsyncCompletionListener
+
+if TYPE_CHECKING:
+    from .async_database_manager import AsyncDatabaseManager
+    from .async_cache_manager import AsyncCacheManager
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTaskManager:
+    # asyncio front of TaskManager for the ASGI app, with the same methods as coroutines
+    # Status lookups, which polling clients repeat the most, run on the event loop with the async Redis and
+    # Postgres clients, so a request waiting on them costs a coroutine rather than a worker. Submissions, listings
+    # and blob reads run the TaskManager code in a thread, they share its local cache and its outbox relay
+    def __init__(self, task_manager: TaskManager, db_manager: 'AsyncDatabaseManager',
+                 cache_manager: 'AsyncCacheManager') -> None:
+        self.task_manager: TaskManager = task_manager
+        self.config: Mapping[str, Any] = task_manager.config
+        self.db_manager: 'AsyncDatabaseManager' = db_manager
+        self.cache_manager: 'AsyncCacheManager' = cache_manager
+        self.output_lookup: OutputLookup = task_manager.output_lookup
+        self.completion_listener: AsyncCompletionListener = AsyncCompletionListener(
+            cache_manager, self.config['TASK_COMPLETION_CHANNEL'])
+        # Database lookups of tasks missing from the caches, by task UUID
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    async def submit_task(self, task_name: str, task_parameters: Dict[str, Any],
+                          idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.task_manager.submit_task, task_name, task_parameters, idempotency_key)
+
+    async def create_tasks(self, task_specs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.task_manager.create_tasks, task_specs)
+
+    async def list_tasks(self, task_name: Optional[str] = None, status: Optional[str] = None,
+                         limit: Optional[int] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.task_manager.list_tasks, task_name, status, limit, cursor)
+
+    async def load_result(self, output: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        # Only results stored in the blob store need a thread to be loaded
+        if not output or blob_id_of(output.get('result')) is None:
+            return output
+        return await asyncio.to_thread(self.task_manager.load_result, output)
+
+    async def iter_result_text(self, output: Dict[str, Any]) -> Optional[AsyncIterator[str]]:
+        # Chunks of a result stored in the blob store, or None if the result is inline
+        # Raises BlobNotFoundError if the blob has expired
+        chunks = await asyncio.to_thread(self.task_manager.iter_result_text, output)
+        if chunks is None:
+            return None
+
+        async def read() -> AsyncIterator[str]:
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        return read()
+
+    async def _cache_loaded(self, finished: List[Tuple[Task, Dict[str, Any]]],
+                            states: Dict[str, Optional[Dict[str, Any]]]) -> None:
+        # Write the outputs read from the database back to the caches, so that later lookups don't query it again
+        try:
+            for ttl, entries in self.output_lookup.loaded_entries(finished, states).items():
+                await self.cache_manager.set_many(entries, expire=ttl)
+        except RedisError:
+            logger.warning("Failed to write task outputs back to the cache", exc_info=True)
+
+    async def _load_output(self, task_uuid: str) -> Optional[Dict[str, Any]]:
+        # Read the output of a task missing from the caches from the database, and write it back to them
+        task = await Task.get_async(self.db_manager, canonical_uuid(task_uuid))
+        if task is None:
+            logger.warning("Task not found in database: %s", task_uuid)
+        outputs: List[Optional[Dict[str, Any]]] = [None]
+        await self._cache_loaded(*self.output_lookup.apply_loaded(outputs, {task_uuid: [0]},
+                                                                  {task_uuid: task} if task else {}))
+        return outputs[0]
+
+    async def get_task_output(self, task_uuid: str) -> Optional[Dict[str, Any]]:
+        # Get the status and output of a task from the in-process cache, then Redis, and finally the database,
+        # as TaskManager.get_task_output does. Concurrent misses of the same task share a single query
+        keys, outputs, remote = self.output_lookup.lookup_local([task_uuid])
+        if not remote:
+            return outputs[0]
+
+        values = await self.cache_manager.get_many(cache_keys(keys, remote))
+        if not self.output_lookup.apply_cached(keys, outputs, remote, values):
+            return outputs[0]
+
+        key = keys[0]
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = self._loading[key] = asyncio.ensure_future(self._load_output(key))
+            loading.add_done_callback(lambda _: self._loading.pop(key, None))
+        # A caller going away doesn't cancel the query the others wait for
+        return await asyncio.shield(loading)
+
+    async def wait_for_task_output(self, task_uuid: str, timeout: float) -> Optional[Dict[str, Any]]:
+        # Get the output of a task, waiting up to timeout seconds for it to finish if it is still pending
+        event = await self.completion_listener.subscribe(task_uuid)
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                output = await self.get_task_output(task_uuid)
+                if output is None or output['status'] in TERMINAL_STATUSES:
+                    return output
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return output
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    return output
+                event.clear()
+        finally:
+            self.completion_listener.unsubscribe(task_uuid, event)
+
+    async def get_task_outputs(self, task_uuids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        # Get the status and output of several tasks, in the order of the UUIDs provided, with a single MGET
+        # and a single query for the cache misses, tasks that don't exist are returned as None
+        if len(task_uuids) > self.config['MAX_BATCH_SIZE']:
+            raise ValueError(f"Batch size exceeds the limit of {self.config['MAX_BATCH_SIZE']} tasks")
+
+        keys, outputs, remote = self.output_lookup.lookup_local(task_uuids)
+        values = await self.cache_manager.get_many(cache_keys(keys, remote))
+        misses = self.output_lookup.apply_cached(keys, outputs, remote, values)
+        if misses:
+            tasks = await Task.get_many_async(self.db_manager, list(misses))
+            await self._cache_loaded(*self.output_lookup.apply_loaded(outputs, misses, tasks))
+        return outputs
+
+    async def close(self) -> None:
+        await self.completion_listener.close()
+        await self.cache_manager.close()
+        await self.db_manager.close()
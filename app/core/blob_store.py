@@ -0,0 +1,167 @@
+from typing import Any, Dict, Iterator, Mapping, Optional
+from abc import ABC, abstractmethod
+import codecs
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+from .cache_manager import CacheManager
+
+# Large task parameters and results are stored once in the blob store, and replaced everywhere else
+# (broker messages, the tasks table, the result cache) by a reference: {'$blob': <sha256 of the text>}
+BLOB_REF_KEY = '$blob'
+_BLOB_ID = re.compile(r'[0-9a-f]{64}')
+CHUNK_SIZE = 64 * 1024
+
+
+class BlobNotFoundError(LookupError):
+    pass
+
+
+def blob_ref(blob_id: str) -> Dict[str, str]:
+    return {BLOB_REF_KEY: blob_id}
+
+
+def blob_id_of(value: Any) -> Optional[str]:
+    # The blob ID of a reference, or None if the value isn't one
+    if isinstance(value, dict) and len(value) == 1:
+        blob_id = value.get(BLOB_REF_KEY)
+        if isinstance(blob_id, str) and _BLOB_ID.fullmatch(blob_id):
+            return blob_id
+    return None
+
+
+class BlobStore(ABC):
+    # Content-addressed store of large texts, identical texts are stored once
+    def put_text(self, text: str) -> str:
+        data = text.encode()
+        blob_id = hashlib.sha256(data).hexdigest()
+        self._put(blob_id, data)
+        return blob_id
+
+    def offload_text(self, value: Any, threshold: int) -> Any:
+        # Replace a text of at least threshold bytes by a reference to it in the store (0 disables it)
+        # UTF-8 takes at most 4 bytes per character, so short texts are never encoded to be measured
+        if not threshold or not isinstance(value, str) or len(value) * 4 < threshold:
+            return value
+        if len(value) < threshold and len(value.encode()) < threshold:
+            return value
+        return blob_ref(self.put_text(value))
+
+    def get_text(self, blob_id: str) -> str:
+        return ''.join(self.iter_text(blob_id))
+
+    def iter_text(self, blob_id: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+        # Read a text in chunks of bytes without loading it whole, raises BlobNotFoundError before the first chunk
+        # The incremental decoder keeps the characters split across two chunks
+        chunks = self._iter_bytes(blob_id, chunk_size)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+
+        def decode() -> Iterator[str]:
+            for data in chunks:
+                text = decoder.decode(data)
+                if text:
+                    yield text
+            text = decoder.decode(b'', final=True)
+            if text:
+                yield text
+        return decode()
+
+    @abstractmethod
+    def _put(self, blob_id: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def _iter_bytes(self, blob_id: str, chunk_size: int) -> Iterator[bytes]:
+        # The chunks of a blob, raises BlobNotFoundError before the first one if it doesn't exist
+        ...
+
+
+class RedisBlobStore(BlobStore):
+    # Blobs kept in Redis for ttl seconds (0 keeps them forever), shared by all web and worker nodes
+    def __init__(self, cache_manager: CacheManager, ttl: int) -> None:
+        self.cache_manager: CacheManager = cache_manager
+        self.ttl: int = ttl
+
+    @staticmethod
+    def key(blob_id: str) -> str:
+        return f'task-blob-{blob_id}'
+
+    def _put(self, blob_id: str, data: bytes) -> None:
+        self.cache_manager.set(self.key(blob_id), data, self.ttl)
+
+    def _iter_bytes(self, blob_id: str, chunk_size: int) -> Iterator[bytes]:
+        key = self.key(blob_id)
+        with self.cache_manager.get_connection() as redis:
+            size = redis.strlen(key)
+        if not size:
+            raise BlobNotFoundError(blob_id)
+
+        def read() -> Iterator[bytes]:
+            with self.cache_manager.get_connection() as redis:
+                for start in range(0, size, chunk_size):
+                    yield redis.getrange(key, start, start + chunk_size - 1)
+        return read()
+
+
+class FileBlobStore(BlobStore):
+    # Blobs kept as files under root, which must be shared by the web and worker nodes (e.g. a volume)
+    def __init__(self, root: str) -> None:
+        self.root: str = root
+
+    def path(self, blob_id: str) -> str:
+        return os.path.join(self.root, blob_id[:2], blob_id)
+
+    def _put(self, blob_id: str, data: bytes) -> None:
+        path = self.path(blob_id)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename it, so readers never see a partial blob
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def _iter_bytes(self, blob_id: str, chunk_size: int) -> Iterator[bytes]:
+        try:
+            file = open(self.path(blob_id), 'rb')
+        except FileNotFoundError:
+            raise BlobNotFoundError(blob_id) from None
+
+        def read() -> Iterator[bytes]:
+            with file:
+                while True:
+                    data = file.read(chunk_size)
+                    if not data:
+                        return
+                    yield data
+        return read()
+
+
+def create_blob_store(config: Mapping[str, Any], cache_manager: Optional[CacheManager] = None) -> BlobStore:
+    if config['BLOB_STORE'] == 'file':
+        return FileBlobStore(config['BLOB_DIR'])
+    if config['BLOB_STORE'] == 'redis':
+        return RedisBlobStore(cache_manager or CacheManager(config), config['BLOB_TTL'])
+    raise ValueError(f"Unknown blob store: {config['BLOB_STORE']}")
+
+
+_store: Optional[BlobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store(config: Mapping[str, Any]) -> BlobStore:
+    # Return the blob store of this worker, created on first use from the Celery app config
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_blob_store(config)
+    return _store
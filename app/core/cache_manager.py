@@ -1,30 +1,111 @@
-from typing import Optional, Any
-from redis import Redis
+from typing import Optional, Any, Dict, List, Mapping, Tuple
+from redis import Redis, BlockingConnectionPool
 from contextlib import contextmanager
-from flask import Config
+from datetime import datetime
+import threading
+
+from .codec import Codec
+from .metrics import REDIS_COMMAND_DURATION
+
+# Connection pools are shared by every CacheManager in the process, keyed by server address.
+# redis-py pools detect fork() themselves, so children never reuse the parent's sockets.
+_pools: Dict[Tuple[str, int, int], BlockingConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(host: str, port: int, db: int = 0, max_connections: int = 50,
+                        timeout: float = 10) -> BlockingConnectionPool:
+    # Return the process-wide connection pool for the given Redis server, creating it on first use
+    key = (host, port, db)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = BlockingConnectionPool(host=host, port=port, db=db,
+                                              max_connections=max_connections, timeout=timeout)
+                _pools[key] = pool
+    return pool
+
+
+# Returns the current value of KEYS[1], or sets it to ARGV[1] with a TTL of ARGV[2] seconds if it doesn't exist,
+# along with KEYS[2] (if given) to ARGV[3] with a TTL of ARGV[4] seconds
+_CLAIM_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    return current
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+if KEYS[2] then
+    redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[4])
+end
+return false
+"""
+
+
+def result_key(task_uuid: str) -> str:
+    # Key of a task result, shared with the Celery result backend
+    return f'celery-task-meta-{task_uuid}'
+
+
+def state_key(task_uuid: str) -> str:
+    # Key of the short-lived state of a task that hasn't finished or doesn't exist
+    return f'task-state-{task_uuid}'
+
+
+def build_result_meta(task_uuid: str, status: str, result: Any, traceback: Optional[str] = None) -> Dict[str, Any]:
+    # Task result meta with the same fields the Celery result backend stores, so AsyncResult can still read it
+    return {
+        'status': status,
+        'result': result,
+        'traceback': traceback,
+        'children': [],
+        'date_done': datetime.utcnow().isoformat(),
+        'task_id': task_uuid,
+    }
 
 
 class CacheManager:
-    def __init__(self, config: Config) -> None:
-        self.config: Config = config
+    def __init__(self, config: Mapping[str, Any]) -> None:
+        self.config: Mapping[str, Any] = config
+        self.pool: BlockingConnectionPool = get_connection_pool(
+            self.config['REDIS_HOST'],
+            self.config['REDIS_PORT'],
+            db=0,
+            max_connections=self.config['REDIS_POOL_SIZE'],
+            timeout=self.config['REDIS_POOL_TIMEOUT']
+        )
+        self.codec: Codec = Codec(self.config['CACHE_CODEC'], self.config['CACHE_COMPRESS_THRESHOLD'])
+        self._claim_script = Redis(connection_pool=self.pool).register_script(_CLAIM_SCRIPT)
 
     @contextmanager
     def get_connection(self):
-        redis = Redis(
-            host=self.config['REDIS_HOST'],
-            port=self.config['REDIS_PORT'],
-            db=0
-        )
-        try:
-            yield redis
-        finally:
-            redis.close()
+        # The client is a thin wrapper, connections are borrowed from the shared pool per command
+        yield Redis(connection_pool=self.pool)
 
+    @contextmanager
+    def pipeline(self, transaction: bool = False):
+        # Batch several commands into a single round trip, call execute() on the pipeline to send them
+        # The time spent in the block is recorded, which covers building and executing the pipeline
+        with self.get_connection() as redis, REDIS_COMMAND_DURATION.time('pipeline'):
+            with redis.pipeline(transaction=transaction) as pipe:
+                yield pipe
+
+    @REDIS_COMMAND_DURATION.time('get')
     def get(self, key: str) -> Optional[bytes]:
         # Get the value from the cache based on the key
         with self.get_connection() as redis:
             return redis.get(key)
 
+    @REDIS_COMMAND_DURATION.time('mget')
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        # Get the values of several keys in one round trip, missing keys are returned as None
+        if not keys:
+            return []
+        with self.get_connection() as redis:
+            return redis.mget(keys)
+
+    @REDIS_COMMAND_DURATION.time('set')
     def set(self, key: str, value: Any, expire: Optional[int] = None) -> None:
         # Set the value in the cache based on the key with an optional expiration time
         with self.get_connection() as redis:
@@ -32,3 +113,52 @@ class CacheManager:
                 redis.setex(key, expire, value)
             else:
                 redis.set(key, value)
+
+    @REDIS_COMMAND_DURATION.time('mset')
+    def set_many(self, mapping: Dict[str, Any], expire: Optional[int] = None) -> None:
+        # Set several keys in one round trip with an optional expiration time
+        if not mapping:
+            return
+        if not expire:
+            with self.get_connection() as redis:
+                redis.mset(mapping)
+            return
+        with self.pipeline() as pipe:
+            for key, value in mapping.items():
+                pipe.setex(key, expire, value)
+            pipe.execute()
+
+    @REDIS_COMMAND_DURATION.time('delete')
+    def delete(self, key: str) -> None:
+        # Delete the key from the cache
+        with self.get_connection() as redis:
+            redis.delete(key)
+
+    @REDIS_COMMAND_DURATION.time('claim')
+    def claim(self, key: str, value: str, expire: int,
+              placeholder: Optional[Tuple[str, bytes, int]] = None) -> Optional[bytes]:
+        # Set the key to value if it doesn't exist, in a single round trip, along with a placeholder
+        # (key, value, expire) written only if the claim succeeds
+        # Returns None if the key was claimed, or the value of the existing key otherwise
+        keys, args = [key], [value, expire]
+        if placeholder is not None:
+            keys.append(placeholder[0])
+            args += placeholder[1:]
+        with self.get_connection() as redis:
+            return self._claim_script(keys=keys, args=args, client=redis)
+
+    def get_object(self, key: str) -> Optional[Any]:
+        # Get a value stored with set_object, decoded with the cache codec
+        return self.codec.decode(self.get(key))
+
+    def get_objects(self, keys: List[str]) -> List[Optional[Any]]:
+        # Get several values stored with set_object in one round trip, missing keys are returned as None
+        return [self.codec.decode(value) for value in self.get_many(keys)]
+
+    def set_object(self, key: str, value: Any, expire: Optional[int] = None) -> None:
+        # Set a value encoded with the cache codec
+        self.set(key, self.codec.encode(value), expire)
+
+    def set_objects(self, mapping: Dict[str, Any], expire: Optional[int] = None) -> None:
+        # Set several values encoded with the cache codec in one round trip
+        self.set_many({key: self.codec.encode(value) for key, value in mapping.items()}, expire)
@@ -0,0 +1,88 @@
+from typing import Any, Optional
+import json
+import zlib
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is optional
+    msgpack = None
+
+# Encoded values that aren't plain JSON start with a NUL byte, which can never start a JSON document,
+# followed by a flags byte. Plain JSON stays unframed so the Celery result backend can still read it.
+_MAGIC = b'\x00'
+_FLAG_MSGPACK = 0x01
+_FLAG_ZLIB = 0x02
+
+
+def json_dumps(value: Any) -> str:
+    # Serialize to a JSON string, with orjson when available
+    # orjson rejects some values the standard library accepts (e.g. integers over 64 bits), fall back for those
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode()
+        except TypeError:
+            pass
+    return json.dumps(value)
+
+
+def json_dumpb(value: Any, sort_keys: bool = False) -> bytes:
+    # Serialize to JSON bytes, sort_keys gives a canonical form of equal values (e.g. for hashing)
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_SORT_KEYS if sort_keys else None)
+        except TypeError:
+            pass
+    return json.dumps(value, sort_keys=sort_keys, separators=(',', ':')).encode()
+
+
+def json_loads(data: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Codec:
+    # Encodes cached values as JSON or msgpack, compressing them with zlib above compress_threshold bytes
+    # (0 disables compression). Decoding detects the format, so values written with other settings still load.
+    def __init__(self, format: str = 'json', compress_threshold: int = 0, compress_level: int = 1) -> None:
+        if format not in ('json', 'msgpack'):
+            raise ValueError(f"Unknown codec format: {format}")
+        if format == 'msgpack' and msgpack is None:
+            raise ValueError("The msgpack codec requires the msgpack package")
+        self.format: str = format
+        self.compress_threshold: int = compress_threshold
+        self.compress_level: int = compress_level
+
+    def encode(self, value: Any) -> bytes:
+        flags = 0
+        if self.format == 'msgpack':
+            data = msgpack.packb(value, use_bin_type=True)
+            flags |= _FLAG_MSGPACK
+        else:
+            data = json_dumpb(value)
+        if self.compress_threshold and len(data) > self.compress_threshold:
+            data = zlib.compress(data, self.compress_level)
+            flags |= _FLAG_ZLIB
+        if not flags:
+            return data
+        return _MAGIC + bytes((flags, )) + data
+
+    def decode(self, data: Optional[bytes]) -> Any:
+        if data is None:
+            return None
+        if data[:1] != _MAGIC:
+            return json_loads(data)
+        flags = data[1]
+        data = data[2:]
+        if flags & _FLAG_ZLIB:
+            data = zlib.decompress(data)
+        if flags & _FLAG_MSGPACK:
+            if msgpack is None:
+                raise ValueError("Cannot decode a msgpack value without the msgpack package")
+            return msgpack.unpackb(data, raw=False)
+        return json_loads(data)
@@ -0,0 +1,95 @@
+from typing import Dict, Optional, Set
+import logging
+import os
+import threading
+import time
+
+from redis.exceptions import RedisError
+
+from .cache_manager import CacheManager
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionListener:
+    # Listens for task completion messages on a Redis pub/sub channel and wakes up local waiters.
+    # A single subscription (one connection and one thread) is shared by every waiter in the process,
+    # so a waiter only costs an Event, which keeps thousands of long-polls per web node cheap,
+    # including under gevent where the thread is a greenlet.
+    def __init__(self, cache_manager: CacheManager, channel: str) -> None:
+        self.cache_manager: CacheManager = cache_manager
+        self.channel: str = channel
+        self._pid: int = 0
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, Set[threading.Event]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._subscribed = threading.Event()
+
+    def subscribe(self, task_uuid: str) -> threading.Event:
+        # Register interest in a task, subscribe before checking the task status to avoid missing the message
+        self._ensure_running()
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(task_uuid, set()).add(event)
+        return event
+
+    def unsubscribe(self, task_uuid: str, event: threading.Event) -> None:
+        with self._lock:
+            events = self._waiters.get(task_uuid)
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self._waiters[task_uuid]
+
+    def _notify(self, task_uuid: str) -> None:
+        with self._lock:
+            events = list(self._waiters.get(task_uuid, ()))
+        for event in events:
+            event.set()
+
+    def _notify_all(self) -> None:
+        # Wake every waiter so it re-checks the task status, used when messages may have been lost
+        with self._lock:
+            events = [event for events in self._waiters.values() for event in events]
+        for event in events:
+            event.set()
+
+    def _ensure_running(self) -> None:
+        # Start the listener thread on first use, and again in a forked child since threads don't survive fork()
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._waiters = {}
+                self._thread = None
+                self._subscribed = threading.Event()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='completion-listener', daemon=True)
+                self._thread.start()
+        # Wait briefly for the subscription to be confirmed so the first waiter can't miss its message
+        self._subscribed.wait(timeout=1)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                with self.cache_manager.get_connection() as redis:
+                    pubsub = redis.pubsub()
+                    try:
+                        pubsub.subscribe(self.channel)
+                        while True:
+                            message = pubsub.get_message(timeout=1.0)
+                            if message is None:
+                                continue
+                            if message['type'] == 'subscribe':
+                                self._subscribed.set()
+                            elif message['type'] == 'message':
+                                data = message['data']
+                                self._notify(data.decode() if isinstance(data, bytes) else data)
+                    finally:
+                        pubsub.close()
+            except RedisError:
+                logger.exception("Completion listener lost its connection, reconnecting")
+            self._subscribed.clear()
+            self._notify_all()
+            time.sleep(1)
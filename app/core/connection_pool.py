@@ -0,0 +1,150 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import os
+import threading
+import time
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ConnectionPool:
+    # A bounded, thread-safe pool of connections created by the given factory.
+    # Idle connections are kept LIFO so the warmest connection is reused first, connections are
+    # validated on checkout, and the pool resets itself in a forked child so that gunicorn and
+    # Celery prefork workers never share sockets inherited from their parent.
+    def __init__(self,
+                 connect: Callable[[], Any],
+                 max_size: int,
+                 max_idle: float,
+                 timeout: float,
+                 check: Optional[Callable[[Any, float], bool]] = None,
+                 reset: Optional[Callable[[Any], bool]] = None) -> None:
+        self._connect = connect
+        self._check = check
+        self._reset = reset
+        self.max_size: int = max_size
+        self.max_idle: float = max_idle
+        self.timeout: float = timeout
+        self._init_state()
+
+    def _init_state(self) -> None:
+        self._pid: int = os.getpid()
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle: List[Tuple[Any, float]] = []
+        self._size: int = 0
+        self._stats: Dict[str, float] = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'connections_opened': 0,
+            'connections_discarded': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def _ensure_pid(self) -> None:
+        # Connections inherited across fork() are dropped without being closed, closing them here
+        # would terminate the session that still belongs to the parent process
+        if self._pid != os.getpid():
+            self._init_state()
+
+    def acquire(self) -> Any:
+        # Check out a connection, waiting up to the pool timeout for one to become available
+        self._ensure_pid()
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._available:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(f"Timed out after {self.timeout}s waiting for a connection")
+                self._available.wait(remaining)
+
+            waited = time.monotonic() - start
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += waited
+            if waited > self._stats['wait_time_max']:
+                self._stats['wait_time_max'] = waited
+
+            if self._idle:
+                connection, released_at = self._idle.pop()
+            else:
+                connection, released_at = None, None
+                # Reserve the slot before connecting so concurrent callers can't overshoot max_size
+                self._size += 1
+
+        if connection is not None:
+            connection = self._validate(connection, time.monotonic() - released_at)
+        if connection is None:
+            connection = self._open()
+        return connection
+
+    def release(self, connection: Any, discard: bool = False) -> None:
+        # Return a connection to the pool, or close it if it is broken or no longer reusable
+        if self._pid != os.getpid():
+            return
+        if not discard and self._reset is not None and not self._reset(connection):
+            discard = True
+        if discard:
+            self._discard(connection)
+            return
+        with self._available:
+            self._idle.append((connection, time.monotonic()))
+            self._available.notify()
+
+    def stats(self) -> Dict[str, float]:
+        # Snapshot of the pool counters, used to size the pool
+        self._ensure_pid()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['max_size'] = self.max_size
+        return stats
+
+    def close(self) -> None:
+        # Close all idle connections, connections currently checked out are closed on release
+        self._ensure_pid()
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+    def _validate(self, connection: Any, idle_for: float) -> Optional[Any]:
+        # Drop connections that sat idle past max_idle or fail the health check, the caller opens a new one
+        if idle_for > self.max_idle or (self._check is not None and not self._check(connection, idle_for)):
+            self._close_quietly(connection)
+            with self._lock:
+                self._stats['connections_discarded'] += 1
+            return None
+        return connection
+
+    def _open(self) -> Any:
+        try:
+            connection = self._connect()
+        except Exception:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+        with self._lock:
+            self._stats['connections_opened'] += 1
+        return connection
+
+    def _discard(self, connection: Any) -> None:
+        self._close_quietly(connection)
+        with self._available:
+            self._size -= 1
+            self._stats['connections_discarded'] += 1
+            self._available.notify()
+
+    @staticmethod
+    def _close_quietly(connection: Any) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
@@ -1,16 +1,27 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Mapping
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor, execute_values, register_default_jsonb
 from contextlib import contextmanager
-from flask import Config
+
+from .connection_pool import ConnectionPool
+from .codec import json_loads
+from .metrics import DB_QUERY_DURATION
 
 
 class DatabaseManager:
-    def __init__(self, config: Config) -> None:
-        self.config: Config = config
+    def __init__(self, config: Mapping[str, Any]) -> None:
+        self.config: Mapping[str, Any] = config
+        self.pool: ConnectionPool = ConnectionPool(
+            self._connect,
+            max_size=self.config['DB_POOL_SIZE'],
+            max_idle=self.config['DB_POOL_MAX_IDLE'],
+            timeout=self.config['DB_POOL_TIMEOUT'],
+            check=self._check_connection,
+            reset=self._reset_connection
+        )
 
-    @contextmanager
-    def get_connection(self):
+    def _connect(self):
         connection = psycopg2.connect(
             host=self.config['DB_HOST'],
             database=self.config['DB_NAME'],
@@ -18,11 +29,55 @@ class DatabaseManager:
             password=self.config['DB_PASSWORD'],
             cursor_factory=RealDictCursor
         )
+        # Parse JSONB columns with the shared codec (orjson when available)
+        register_default_jsonb(connection, loads=json_loads)
+        return connection
+
+    def _check_connection(self, connection, idle_for: float) -> bool:
+        # Cheap local checks first, only ping the server if the connection has been idle for a while
+        if connection.closed:
+            return False
+        if connection.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if idle_for > self.config['DB_POOL_PING_AFTER']:
+            try:
+                with connection.cursor() as cur:
+                    cur.execute("SELECT 1")
+                connection.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    @staticmethod
+    def _reset_connection(connection) -> bool:
+        # Make sure a connection goes back to the pool without an open transaction
+        if connection.closed:
+            return False
+        try:
+            if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    @contextmanager
+    def get_connection(self):
+        connection = self.pool.acquire()
+        broken = False
         try:
             yield connection
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # The connection may be dead, drop it so the next checkout gets a fresh one
+            broken = True
+            raise
         finally:
-            connection.close()
+            self.pool.release(connection, discard=broken)
 
+    def pool_stats(self) -> Dict[str, float]:
+        # Return the connection pool counters (checkouts, wait time, size) to help size the pool
+        return self.pool.stats()
+
+    @DB_QUERY_DURATION.time('execute')
     def execute(self, query: str, params: Optional[tuple] = None) -> Optional[List[Dict[str, Any]]]:
         # Execute a query with optional parameters and return the results if any
         with self.get_connection() as conn:
@@ -32,3 +87,17 @@ class DatabaseManager:
                 if cur.description:
                     return cur.fetchall()
                 return None
+
+    @DB_QUERY_DURATION.time('execute_values')
+    def execute_values(self, query: str, argslist: List[tuple], template: Optional[str] = None,
+                       fetch: bool = False) -> Optional[List[Dict[str, Any]]]:
+        # Execute a query with a single VALUES %s placeholder expanded to all rows of argslist,
+        # so the whole batch is sent as one multi-row statement
+        if not argslist:
+            return [] if fetch else None
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                result = execute_values(cur, query, argslist, template=template,
+                                        page_size=len(argslist), fetch=fetch)
+                conn.commit()
+                return result if fetch else None
@@ -0,0 +1,84 @@
+from typing import Any, Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+import threading
+import time
+import weakref
+
+from .metrics import metrics, LOCAL_CACHE_EVENTS, LOCAL_CACHE_BYTES, LOCAL_CACHE_ITEMS
+
+# The caches of this process, whose stats are exported to the metrics
+_caches: 'weakref.WeakSet[LocalCache]' = weakref.WeakSet()
+
+
+class LocalCache:
+    # Bounded in-process LRU cache with a per-entry TTL, sized by the byte size callers report for each value
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes: int = max_bytes
+        self.ttl: float = ttl
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, int, float]]' = OrderedDict()
+        self._bytes: int = 0
+        self._stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+        self._exported: Dict[str, int] = dict(self._stats)
+        _caches.add(self)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, size: int) -> None:
+        # Values larger than the whole cache are not stored
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats['evictions'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['items'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['max_bytes'] = self.max_bytes
+        return stats
+
+    def export_stats(self) -> Tuple[Dict[str, int], int, int]:
+        # The events counted since the previous export, and the items and bytes currently held
+        with self._lock:
+            events = {name: count - self._exported[name] for name, count in self._stats.items()}
+            self._exported = dict(self._stats)
+            return events, len(self._entries), self._bytes
+
+
+@metrics.collector
+def _collect_metrics() -> None:
+    items = held_bytes = 0
+    for cache in list(_caches):
+        events, cache_items, cache_bytes = cache.export_stats()
+        for event, count in events.items():
+            if count:
+                LOCAL_CACHE_EVENTS.inc(event, amount=count)
+        items += cache_items
+        held_bytes += cache_bytes
+    LOCAL_CACHE_ITEMS.set(items)
+    LOCAL_CACHE_BYTES.set(held_bytes)
@@ -0,0 +1,140 @@
+from typing import Any, Dict, List, Mapping, Tuple
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import logging
+import os
+import queue
+import random
+
+from .metrics import LOG_RECORDS_DROPPED
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+_formatter = logging.Formatter()
+
+# The queue handlers installed in this process, with the listeners writing their records
+_installed: List[Tuple['TruncatingQueueHandler', QueueListener]] = []
+
+
+def truncate(value: Any, limit: int) -> Any:
+    # Cut a long string to limit characters, keeping its length, other values are returned as they are
+    if isinstance(value, str) and len(value) > limit:
+        return f'{value[:limit]}... [{len(value)} chars]'
+    return value
+
+
+class TruncatingQueueHandler(QueueHandler):
+    # Hands the records to a QueueListener thread which formats and writes them, so the calling thread never waits
+    # on the disk. Records are dropped rather than waited on when the queue is full
+    def __init__(self, log_queue: queue.Queue, max_arg_length: int, max_message_length: int) -> None:
+        super().__init__(log_queue)
+        self.max_arg_length: int = max_arg_length
+        self.max_message_length: int = max_message_length
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike QueueHandler.prepare, the record isn't copied nor formatted here: the calling thread only cuts
+        # the string arguments longer than max_arg_length and the message to max_message_length, and renders
+        # the traceback, whose frames don't outlive the call. The message is merged by the listener thread,
+        # so the other arguments must not be changed after being logged, as with any deferred logging
+        args = record.args
+        if args:
+            if isinstance(args, Mapping):
+                record.args = {key: truncate(value, self.max_arg_length) for key, value in args.items()}
+            else:
+                record.args = tuple(truncate(arg, self.max_arg_length) for arg in args)
+        record.msg = truncate(record.msg, self.max_message_length)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = truncate(_formatter.formatException(record.exc_info), self.max_message_length)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class SamplingFilter(logging.Filter):
+    # Keeps the records below WARNING of the loggers in rates (and of their children) at the given rate,
+    # for the info lines logged on every request or task. Warnings and errors are always kept
+    def __init__(self, rates: Mapping[str, float]) -> None:
+        super().__init__()
+        self.rates: Dict[str, float] = dict(rates)
+        # Sample rate by logger name, resolved once per logger
+        self._resolved: Dict[str, float] = {}
+
+    def rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, candidate = 1.0, name
+            while candidate:
+                if candidate in self.rates:
+                    rate = self.rates[candidate]
+                    break
+                candidate = candidate.rpartition('.')[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+def install_queue_logging(logger: logging.Logger, config: Mapping[str, Any]) -> None:
+    # Move the handlers of logger behind a queue written by a listener thread, with the truncation and sampling
+    # of LOG_MAX_ARG_LENGTH, LOG_MAX_MESSAGE_LENGTH and LOG_SAMPLE_RATES. Does nothing if it is already done
+    if any(isinstance(handler, TruncatingQueueHandler) for handler in logger.handlers):
+        return
+    handlers = list(logger.handlers)
+    log_queue: queue.Queue = queue.Queue(config['LOG_QUEUE_SIZE'])
+    queue_handler = TruncatingQueueHandler(log_queue, config['LOG_MAX_ARG_LENGTH'], config['LOG_MAX_MESSAGE_LENGTH'])
+    queue_handler.addFilter(SamplingFilter(config['LOG_SAMPLE_RATES']))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    listener.start()
+    if not _installed:
+        atexit.register(stop_queue_logging)
+    _installed.append((queue_handler, listener))
+
+
+def configure_logging(config: Mapping[str, Any]) -> None:
+    # Log to LOG_FILE through a queue, in place of logging.basicConfig
+    # Like basicConfig it does nothing if the root logger already has handlers
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    file_handler = logging.FileHandler(config['LOG_FILE'], mode='a')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root.addHandler(file_handler)
+    root.setLevel(config['LOG_LEVEL'])
+    install_queue_logging(root, config)
+
+
+def stop_queue_logging() -> None:
+    # Write the queued records and stop the listeners, prefork children exit without running the atexit handlers
+    # and call it on shutdown
+    while _installed:
+        _, listener = _installed.pop()
+        try:
+            listener.stop()
+        except Exception:
+            pass
+
+
+def _restart_listeners() -> None:
+    # The listener threads don't survive fork(), a forked process (gunicorn and prefork workers) writes its records
+    # with listeners of its own. The records the parent had not written yet are left to the parent
+    for index, (queue_handler, listener) in enumerate(_installed):
+        queue_handler.queue = queue.Queue(queue_handler.queue.maxsize)
+        listener = QueueListener(queue_handler.queue, *listener.handlers, respect_handler_level=True)
+        listener.start()
+        _installed[index] = (queue_handler, listener)
+
+
+os.register_at_fork(after_in_child=_restart_listeners)
@@ -0,0 +1,365 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from functools import wraps
+import atexit
+import inspect
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Prometheus-style counters and histograms kept in process. Recording an observation takes a lock held for a few
+# dict operations and no I/O, so the metrics stay on in production. Every process (gunicorn workers, Celery
+# prefork children) periodically adds what it recorded since the last flush to a Redis hash, which the /metrics
+# endpoint renders, so the values are aggregated across all of them
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TASK_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+_SEPARATOR = '\x1f'
+
+# Values of one metric by label values: [value] for a counter, the count of each bucket then the sum for a histogram,
+# [value, time it was set] for a gauge
+Values = Dict[Tuple[str, ...], List[float]]
+
+
+class Metric(ABC):
+    type: str = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, documentation: str,
+                 labelnames: Sequence[str] = ()) -> None:
+        self.registry: MetricsRegistry = registry
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: Tuple[str, ...] = tuple(labelnames)
+        self.size: int = 1
+        self._lock = threading.Lock()
+        self._values: Values = {}
+
+    def _add(self, labelvalues: Tuple[str, ...], slot: int, amount: float, total: Optional[float] = None) -> None:
+        if self.registry.pending_start:
+            self.registry.start_flusher()
+        with self._lock:
+            values = self._values.get(labelvalues)
+            if values is None:
+                values = self._values[labelvalues] = [0.0] * self.size
+            values[slot] += amount
+            if total is not None:
+                values[-1] += total
+
+    def drain(self) -> Values:
+        # Take the values recorded since the last drain
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: Values) -> None:
+        # Add back values that couldn't be flushed
+        with self._lock:
+            for labelvalues, counts in values.items():
+                current = self._values.setdefault(labelvalues, [0.0] * self.size)
+                for slot, count in enumerate(counts):
+                    current[slot] += count
+
+    def snapshot(self) -> Values:
+        with self._lock:
+            return {labelvalues: list(values) for labelvalues, values in self._values.items()}
+
+    @abstractmethod
+    def render(self, values: Values) -> Iterable[str]:
+        # The sample lines of the values in the Prometheus text format
+        ...
+
+    def _labels(self, labelvalues: Tuple[str, ...], extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labelvalues)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self._add(labelvalues, 0, amount)
+
+    def render(self, values: Values) -> Iterable[str]:
+        for labelvalues, (value, ) in sorted(values.items()):
+            yield f'{self.name}_total{self._labels(labelvalues)} {_number(value)}'
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, documentation: str,
+                 labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        # One slot per bucket, one for +Inf and one for the sum
+        self.size = len(self.buckets) + 2
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        # Buckets hold the observations up to their bound, they are only made cumulative when rendered
+        self._add(labelvalues, bisect_left(self.buckets, value), 1, value)
+
+    def time(self, *labelvalues: str) -> '_Timer':
+        # Time a block (with histogram.time(...):) or every call of a function (@histogram.time(...))
+        return _Timer(self, labelvalues)
+
+    def render(self, values: Values) -> Iterable[str]:
+        bounds = [_number(bound) for bound in self.buckets] + ['+Inf']
+        for labelvalues, counts in sorted(values.items()):
+            cumulative = 0.0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = self._labels(labelvalues, 'le="%s"' % bound)
+                yield f'{self.name}_bucket{labels} {_number(cumulative)}'
+            yield f'{self.name}_sum{self._labels(labelvalues)} {_number(counts[-1])}'
+            yield f'{self.name}_count{self._labels(labelvalues)} {_number(cumulative)}'
+
+
+class Gauge(Metric):
+    # A value of this process, set by a collector rather than incremented: each process overwrites its own value in
+    # Redis along with the time it was set, labelled with its pid, and the values of the processes that stopped
+    # flushing are left out
+    type = 'gauge'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, documentation: str,
+                 labelnames: Sequence[str] = ()) -> None:
+        super().__init__(registry, name, documentation, ('process', ) + tuple(labelnames))
+        self.size = 2
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        if self.registry.pending_start:
+            self.registry.start_flusher()
+        with self._lock:
+            self._values[(str(os.getpid()), ) + labelvalues] = [value, time.time()]
+
+    def merge(self, values: Values) -> None:
+        # Values set since the failed flush are newer
+        with self._lock:
+            for labelvalues, current in values.items():
+                self._values.setdefault(labelvalues, current)
+
+    def render(self, values: Values) -> Iterable[str]:
+        for labelvalues, (value, _) in sorted(values.items()):
+            yield f'{self.name}{self._labels(labelvalues)} {_number(value)}'
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labelvalues: Tuple[str, ...]) -> None:
+        self.histogram: Histogram = histogram
+        self.labelvalues: Tuple[str, ...] = labelvalues
+        self.start: float = 0.0
+
+    def __enter__(self) -> '_Timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+    def __call__(self, func: Callable) -> Callable:
+        histogram, labelvalues = self.histogram, self.labelvalues
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def timed_async(*args: Any, **kwargs: Any) -> Any:
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start, *labelvalues)
+            return timed_async
+
+        @wraps(func)
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *labelvalues)
+        return timed
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        # Called before the values are flushed or rendered, to record the values kept elsewhere
+        self._collectors: List[Callable[[], None]] = []
+        self.cache_manager: Any = None
+        self.key: str = ''
+        self.flush_interval: float = 0
+        # Set while the flusher thread of this process has to be started, checked on every observation
+        self.pending_start: bool = False
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def collector(self, func: Callable[[], None]) -> Callable[[], None]:
+        self._collectors.append(func)
+        return func
+
+    def collect(self) -> None:
+        for func in self._collectors:
+            try:
+                func()
+            except Exception:
+                logger.warning("Failed to collect the metrics of %s", func.__qualname__, exc_info=True)
+
+    def _register(self, metric: Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def configure(self, cache_manager: Any, key: str, flush_interval: float) -> None:
+        # Aggregate the metrics of all processes in the Redis hash key, flushed every flush_interval seconds
+        # (0 keeps them in process, /metrics then only shows the process serving it)
+        self.cache_manager = cache_manager
+        self.key = key
+        self.flush_interval = flush_interval
+        self.pending_start = bool(flush_interval) and self._thread is None
+
+    def start_flusher(self) -> None:
+        with self._start_lock:
+            if not self.pending_start:
+                return
+            self.pending_start = False
+            self._thread = threading.Thread(target=self._run, name='metrics-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _after_fork(self) -> None:
+        # The values inherited from the parent are flushed by the parent, and its flusher thread is gone
+        for metric in self._metrics.values():
+            metric.drain()
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self.pending_start = bool(self.flush_interval)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.warning("Failed to flush the metrics", exc_info=True)
+
+    def flush(self) -> None:
+        # Add the values recorded since the last flush to the Redis hash in a single round trip,
+        # they are kept for the next flush if Redis is unavailable
+        if not self.flush_interval:
+            return
+        self.collect()
+        with self._flush_lock:
+            drained = [(metric, metric.drain()) for metric in self._metrics.values()]
+            try:
+                with self.cache_manager.get_connection() as redis:
+                    pipe = redis.pipeline(transaction=False)
+                    for metric, values in drained:
+                        for labelvalues, counts in values.items():
+                            labels = _SEPARATOR.join(labelvalues)
+                            for slot, count in enumerate(counts):
+                                field = f'{metric.name}{_SEPARATOR}{slot}{_SEPARATOR}{labels}'
+                                if isinstance(metric, Gauge):
+                                    pipe.hset(self.key, field, count)
+                                elif count:
+                                    pipe.hincrbyfloat(self.key, field, count)
+                    pipe.execute()
+            except Exception:
+                for metric, values in drained:
+                    metric.merge(values)
+                raise
+
+    def _load(self) -> Dict[str, Values]:
+        # The aggregated values of all processes from the Redis hash
+        with self.cache_manager.get_connection() as redis:
+            fields = redis.hgetall(self.key)
+        collected: Dict[str, Values] = {}
+        for field, value in fields.items():
+            name, slot, labels = field.decode().split(_SEPARATOR, 2)
+            metric = self._metrics.get(name)
+            if metric is None or int(slot) >= metric.size:
+                continue
+            labelvalues = tuple(labels.split(_SEPARATOR)) if metric.labelnames else ()
+            values = collected.setdefault(name, {}).setdefault(labelvalues, [0.0] * metric.size)
+            values[int(slot)] = float(value)
+        # Drop the gauges of the processes that haven't flushed for a few intervals, they are gone
+        stale_before = time.time() - 3 * self.flush_interval
+        stale = []
+        for name, values_by_labels in collected.items():
+            metric = self._metrics[name]
+            if isinstance(metric, Gauge):
+                for labelvalues in [labels for labels, values in values_by_labels.items() if values[1] < stale_before]:
+                    del values_by_labels[labelvalues]
+                    labels = _SEPARATOR.join(labelvalues)
+                    stale.extend(f'{name}{_SEPARATOR}{slot}{_SEPARATOR}{labels}' for slot in range(metric.size))
+        if stale:
+            with self.cache_manager.get_connection() as redis:
+                redis.hdel(self.key, *stale)
+        return collected
+
+    def exposition(self) -> str:
+        # The metrics in the Prometheus text format, aggregated across processes when flushing to Redis
+        if self.flush_interval:
+            self.flush()
+            collected = self._load()
+        else:
+            self.collect()
+            collected = {name: metric.snapshot() for name, metric in self._metrics.items()}
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.render(collected.get(name, {})))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+REQUEST_DURATION = metrics.histogram('tasker_http_request_duration_seconds', "Duration of the API requests",
+                                     ('method', 'route', 'status'))
+OUTPUT_LOOKUPS = metrics.counter('tasker_task_output_lookups', "Task output lookups by where they were found "
+                                 "(local, redis, state, database, missing or invalid)", ('source', ))
+DB_QUERY_DURATION = metrics.histogram('tasker_db_query_duration_seconds', "Duration of the database calls",
+                                      ('operation', ))
+REDIS_COMMAND_DURATION = metrics.histogram('tasker_redis_command_duration_seconds', "Duration of the Redis calls",
+                                           ('command', ))
+PUBLISH_DURATION = metrics.histogram('tasker_broker_publish_duration_seconds',
+                                     "Duration of publishing tasks to the broker", ('task_name', ))
+TASK_QUEUE_WAIT = metrics.histogram('tasker_task_queue_wait_seconds',
+                                    "Time between publishing a task and a worker starting it", ('task_name', ),
+                                    TASK_BUCKETS)
+TASK_RUN_DURATION = metrics.histogram('tasker_task_run_duration_seconds', "Duration of the task runs by final state",
+                                      ('task_name', 'state'), TASK_BUCKETS)
+CALLBACK_DURATION = metrics.histogram('tasker_callback_duration_seconds',
+                                      "Duration of the task completion callbacks", ('callback', ))
+LOCAL_CACHE_EVENTS = metrics.counter('tasker_local_cache_events', "Events of the in-process output caches "
+                                     "(hits, misses, evictions or expirations)", ('event', ))
+LOCAL_CACHE_BYTES = metrics.gauge('tasker_local_cache_bytes', "Bytes held by the in-process output caches")
+LOCAL_CACHE_ITEMS = metrics.gauge('tasker_local_cache_items', "Entries held by the in-process output caches")
+LOG_RECORDS_DROPPED = metrics.counter('tasker_log_records_dropped',
+                                      "Log records dropped because the queue of the log writer was full")
@@ -0,0 +1,93 @@
+from typing import Any, Dict, List, Optional
+import logging
+import os
+import threading
+
+from celery import Celery
+
+from .database_manager import DatabaseManager
+from .metrics import PUBLISH_DURATION
+from ..tasks.registry import registry
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    # Publishes the task messages of the task_outbox table to the broker, in batches off the request path
+    # Submissions wake the relay thread up, which publishes everything pending over a single producer and
+    # deletes the entries in the same transaction. It also checks the table every poll_interval seconds for
+    # the entries of processes that stopped before publishing them
+    # Entries are locked with SKIP LOCKED, so the relays of all web processes share the work. Delivery is
+    # at least once: a message can be published again if the relay dies before committing the batch
+    def __init__(self, db_manager: DatabaseManager, celery: Celery, batch_size: int, poll_interval: float) -> None:
+        self.db_manager: DatabaseManager = db_manager
+        self.celery: Celery = celery
+        self.batch_size: int = batch_size
+        self.poll_interval: float = poll_interval
+        self._pid: int = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        # Start the relay thread of this process, called when the app starts so the entries left by processes
+        # that stopped before publishing them are relayed without waiting for a new submission
+        # The thread doesn't survive fork(), it is started again in forked children
+        if self._pid != os.getpid() or self._thread is None:
+            with self._lock:
+                if self._pid != os.getpid() or self._thread is None:
+                    self._pid = os.getpid()
+                    self._wakeup = threading.Event()
+                    self._thread = threading.Thread(target=self._run, name='outbox-relay', daemon=True)
+                    self._thread.start()
+
+    def notify(self) -> None:
+        # Called after committing new entries, wakes the relay thread up (starting it if needed)
+        self.start()
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                while self.relay_batch() == self.batch_size:
+                    pass
+            except Exception:
+                logger.warning("Failed to relay the task outbox, will retry", exc_info=True)
+
+    def relay_batch(self) -> int:
+        # Publish up to batch_size pending messages in one transaction, returns how many were published
+        # Messages published before a broker failure are deleted, the rest stay for the next attempt
+        published: List[int] = []
+        with self.db_manager.get_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT id, task_uuid, celery_name, args, options FROM task_outbox "
+                        "ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED",
+                        (self.batch_size, )
+                    )
+                    entries = cur.fetchall()
+                    if not entries:
+                        conn.rollback()
+                        return 0
+                    try:
+                        with self.celery.producer_or_acquire() as producer:
+                            for entry in entries:
+                                self._publish(entry, producer)
+                                published.append(entry['id'])
+                    finally:
+                        if published:
+                            cur.execute("DELETE FROM task_outbox WHERE id = ANY(%s)", (published, ))
+                            conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return len(published)
+
+    def _publish(self, entry: Dict[str, Any], producer: Any) -> None:
+        spec = registry.get_by_celery_name(entry['celery_name'])
+        with PUBLISH_DURATION.time(spec.name if spec else entry['celery_name']):
+            self.celery.send_task(entry['celery_name'], args=entry['args'], task_id=str(entry['task_uuid']),
+                                  producer=producer, **entry['options'])
@@ -0,0 +1,135 @@
+from typing import Dict, Any, Mapping, Optional, List, Tuple
+
+from ..models.task import Task, TERMINAL_STATUSES, canonical_uuid
+from .cache_manager import result_key, state_key, build_result_meta
+from .codec import Codec, json_dumpb
+from .local_cache import LocalCache
+from .metrics import OUTPUT_LOOKUPS
+from ..tasks.registry import registry, DEFAULT_RESULT_TTL
+
+
+def output_from_meta(task_meta: Dict[str, Any]) -> Dict[str, Any]:
+    # Build the task output from the Celery result meta stored in the cache
+    return {
+        'status': 'COMPLETED' if task_meta['status'] == 'SUCCESS' else 'FAILED',
+        'result': task_meta['result'] if task_meta['status'] == 'SUCCESS' else None,
+        'error': task_meta['result'] if task_meta['status'] == 'FAILURE' else None
+    }
+
+
+def output_from_task(task: Task) -> Dict[str, Any]:
+    # Build the task output from the task stored in the database
+    return {
+        'status': task.status,
+        'result': task.output if task.status == 'COMPLETED' else None,
+        'error': task.output.get('error') if task.status in ['FAILED', 'ERROR'] else None
+    }
+
+
+def cache_keys(keys: List[Optional[str]], remote: List[int]) -> List[str]:
+    # The result keys then the state keys of the canonical UUIDs to look up in Redis, read with a single MGET
+    return [result_key(keys[index]) for index in remote] + [state_key(keys[index]) for index in remote]
+
+
+class OutputLookup:
+    # The steps of a task output lookup, from the in-process cache, then Redis, and finally the database, without
+    # the Redis and database calls themselves: TaskManager makes them with the blocking clients and
+    # AsyncTaskManager with the asyncio ones, both with the same local cache
+    def __init__(self, config: Mapping[str, Any], codec: Codec, local_cache: LocalCache) -> None:
+        self.config: Mapping[str, Any] = config
+        self.codec: Codec = codec
+        self.local_cache: LocalCache = local_cache
+
+    def lookup_local(self, task_uuids: List[str]
+                     ) -> Tuple[List[Optional[str]], List[Optional[Dict[str, Any]]], List[int]]:
+        # The canonical form of the UUIDs, which all the caches are keyed by, the outputs found in the in-process
+        # cache, and the indexes of the UUIDs to look up in Redis
+        # Malformed UUIDs can't match any task, they are left as None without any lookup
+        keys: List[Optional[str]] = [canonical_uuid(task_uuid) for task_uuid in task_uuids]
+        outputs: List[Optional[Dict[str, Any]]] = [None] * len(task_uuids)
+        remote: List[int] = []
+        invalid = 0
+        for index, key in enumerate(keys):
+            if key is None:
+                invalid += 1
+                continue
+            outputs[index] = self.local_cache.get(key)
+            if outputs[index] is None:
+                remote.append(index)
+        OUTPUT_LOOKUPS.inc('invalid', amount=invalid)
+        OUTPUT_LOOKUPS.inc('local', amount=len(task_uuids) - invalid - len(remote))
+        return keys, outputs, remote
+
+    def apply_cached(self, keys: List[Optional[str]], outputs: List[Optional[Dict[str, Any]]], remote: List[int],
+                     values: List[Optional[bytes]]) -> Dict[str, List[int]]:
+        # Fill in the outputs found in Redis, from a result or a cached state, returns the indexes of the misses by
+        # canonical UUID
+        misses: Dict[str, List[int]] = {}
+        results = states = 0
+        for index, cached_output, cached_state in zip(remote, values[:len(remote)], values[len(remote):]):
+            if cached_output:
+                outputs[index] = output_from_meta(self.codec.decode(cached_output))
+                self.local_cache.set(keys[index], outputs[index], len(cached_output))
+                results += 1
+            elif cached_state is not None:
+                outputs[index] = self.codec.decode(cached_state)
+                states += 1
+            else:
+                misses.setdefault(keys[index], []).append(index)
+        OUTPUT_LOOKUPS.inc('redis', amount=results)
+        OUTPUT_LOOKUPS.inc('state', amount=states)
+        return misses
+
+    def apply_loaded(self, outputs: List[Optional[Dict[str, Any]]], misses: Dict[str, List[int]],
+                     tasks: Dict[str, Task]
+                     ) -> Tuple[List[Tuple[Task, Dict[str, Any]]], Dict[str, Optional[Dict[str, Any]]]]:
+        # Fill in the outputs of the misses from the tasks read from the database, returns the finished tasks
+        # and the states of the unfinished and unknown ones, to write back to the caches
+        finished: List[Tuple[Task, Dict[str, Any]]] = []
+        states: Dict[str, Optional[Dict[str, Any]]] = {}
+        found = missing = 0
+        for task_uuid, indexes in misses.items():
+            task = tasks.get(task_uuid)
+            output = output_from_task(task) if task is not None else None
+            for index in indexes:
+                outputs[index] = output
+            if output is not None and output['status'] in TERMINAL_STATUSES:
+                finished.append((task, output))
+            else:
+                states[task_uuid] = output
+            if output is None:
+                missing += len(indexes)
+            else:
+                found += len(indexes)
+        OUTPUT_LOOKUPS.inc('database', amount=found)
+        OUTPUT_LOOKUPS.inc('missing', amount=missing)
+        return finished, states
+
+    def loaded_entries(self, finished: List[Tuple[Task, Dict[str, Any]]],
+                       states: Dict[str, Optional[Dict[str, Any]]]) -> Dict[int, Dict[str, bytes]]:
+        # The Redis entries of outputs read from the database, grouped by TTL: the result meta of finished tasks,
+        # also added to the local cache, and the short-lived state of the unfinished (output) and unknown (None) ones
+        entries = self.finished_metas(finished)
+        for task_uuid, output in states.items():
+            ttl = self.config['TASK_PENDING_CACHE_TTL'] if output is not None else self.config['TASK_MISSING_CACHE_TTL']
+            if ttl:
+                entries.setdefault(ttl, {})[state_key(task_uuid)] = self.codec.encode(output)
+        return entries
+
+    def finished_metas(self, finished: List[Tuple[Task, Dict[str, Any]]]) -> Dict[int, Dict[str, bytes]]:
+        # Add the outputs of finished tasks to the local cache, and return their encoded result metas to write
+        # to Redis, grouped by TTL. Errors aren't results and are only kept locally
+        metas_by_ttl: Dict[int, Dict[str, bytes]] = {}
+        for task, output in finished:
+            spec = registry.get(task.name)
+            ttl = spec.result_ttl if spec else DEFAULT_RESULT_TTL
+            if output['status'] == 'COMPLETED':
+                encoded_meta = self.codec.encode(build_result_meta(task.uuid, 'SUCCESS', output['result']))
+            elif output['status'] == 'FAILED':
+                encoded_meta = self.codec.encode(build_result_meta(task.uuid, 'FAILURE', output['error']))
+            else:
+                self.local_cache.set(task.uuid, output, len(json_dumpb(output)))
+                continue
+            self.local_cache.set(task.uuid, output, len(encoded_meta))
+            metas_by_ttl.setdefault(ttl, {})[result_key(task.uuid)] = encoded_meta
+        return metas_by_ttl
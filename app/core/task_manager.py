@@ -1,72 +1,387 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Mapping, Optional, List, Tuple
 from celery import Celery
 from celery.result import AsyncResult
-import json
+from redis.exceptions import RedisError
+import base64
+import binascii
+import hashlib
 import logging
-from flask import Config
+import time
+import uuid
 
-from ..models.task import Task
+from ..models.task import Task, OutboxMessage, DuplicateSubmissionError, TERMINAL_STATUSES, canonical_uuid
 from .database_manager import DatabaseManager
-from .cache_manager import CacheManager
+from .cache_manager import CacheManager, state_key
+from .local_cache import LocalCache
+from .output_lookup import OutputLookup, cache_keys
+from .codec import json_dumpb, json_loads
+from .completion_listener import CompletionListener
+from .outbox_relay import OutboxRelay
+from .single_flight import SingleFlight
+from .blob_store import BlobStore, blob_id_of, create_blob_store
+from .metrics import PUBLISH_DURATION
+from ..tasks.registry import registry, TaskSpec
+from ..tasks.routing import celery_settings
+from ..tasks.validation import ValidationError
 
 logger = logging.getLogger(__name__)
 
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+# Output of a task whose row isn't inserted yet, or not picked up by a worker
+PENDING_OUTPUT: Dict[str, Any] = {'status': 'PENDING', 'result': None, 'error': None}
+
 
 class TaskManager:
-    def __init__(self, config: Config, db_manager: DatabaseManager, cache_manager: CacheManager) -> None:
-        self.config: Config = config
+    def __init__(self, config: Mapping[str, Any], db_manager: DatabaseManager, cache_manager: CacheManager) -> None:
+        self.config: Mapping[str, Any] = config
         self.db_manager: DatabaseManager = db_manager
         self.cache_manager: CacheManager = cache_manager
         self.celery: Celery = Celery(__name__)
         self.celery.conf.update(config)
+        self.celery.conf.update(celery_settings(config))
+        registry.compile_validators(config['TASK_PARAMETER_LIMITS'])
+        self.completion_listener: CompletionListener = CompletionListener(cache_manager,
+                                                                          config['TASK_COMPLETION_CHANNEL'])
+        # Outputs of finished tasks never change, so they are kept in process in front of Redis
+        self.local_cache: LocalCache = LocalCache(config['LOCAL_RESULT_CACHE_MAX_BYTES'],
+                                                  config['LOCAL_RESULT_CACHE_TTL'])
+        self.output_lookup: OutputLookup = OutputLookup(config, cache_manager.codec, self.local_cache)
+        self.blob_store: BlobStore = create_blob_store(config, cache_manager)
+        self.outbox_relay: OutboxRelay = OutboxRelay(db_manager, self.celery, config['OUTBOX_BATCH_SIZE'],
+                                                     config['OUTBOX_POLL_INTERVAL'])
+        # Database lookups of tasks missing from the caches, by task UUID
+        self._single_flight: SingleFlight = SingleFlight()
+
+    def _resolve_task(self, task_name: str, task_parameters: Dict[str, Any]) -> Tuple[TaskSpec, List[Any]]:
+        # Look up the task in the registry, validate its parameters and build the positional arguments
+        # of its Celery task, raises ValidationError before any broker or database work
+        spec = registry.get(task_name) if isinstance(task_name, str) else None
+        if spec is None:
+            logger.error("Invalid task name: %s", task_name)
+            raise ValidationError("Invalid task name")
+        spec.validate(task_parameters)
+        return spec, spec.build_args(task_parameters)
+
+    def _offload_parameters(self, spec: TaskSpec, task_parameters: Dict[str, Any],
+                            args: List[Any]) -> Tuple[Dict[str, Any], List[Any]]:
+        # Store large text parameters once in the blob store, the broker message and the tasks table only get
+        # a reference to them. Returns the parameters and arguments to send, unchanged if nothing was offloaded
+        threshold = self.config['BLOB_THRESHOLD']
+        offloaded = {name: self.blob_store.offload_text(value, threshold) for name, value in task_parameters.items()}
+        if all(offloaded[name] is value for name, value in task_parameters.items()):
+            return task_parameters, args
+        return offloaded, spec.build_args(offloaded)
+
+    def _dedup_key(self, spec: TaskSpec, task_parameters: Dict[str, Any],
+                   idempotency_key: Optional[str]) -> Optional[str]:
+        # Key identifying a submission for deduplication, or None if it shouldn't be deduplicated
+        # An idempotency key is scoped to the task name, in content mode deterministic tasks are identified
+        # by their parameters, serialized with sorted keys so the order in the request body doesn't matter
+        mode = self.config['TASK_DEDUP_MODE']
+        if mode == 'off':
+            return None
+        if idempotency_key is not None:
+            if not isinstance(idempotency_key, str) or not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+                raise ValidationError(f"Idempotency key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters long")
+            identity = f'key\0{spec.name}\0{idempotency_key}'.encode()
+        elif mode == 'content' and spec.deterministic:
+            identity = f'content\0{spec.name}\0'.encode() + json_dumpb(task_parameters, sort_keys=True)
+        else:
+            return None
+        return 'task-dedup-' + hashlib.sha256(identity).hexdigest()
+
+    def _claim_submission(self, dedup_key: str, task_uuid: str) -> Optional[str]:
+        # Claim the deduplication key for a new task with a single Redis round trip, which also caches the state
+        # of the task as PENDING until its row is inserted, so a duplicate polling it right away doesn't get a 404
+        # Returns the UUID of the task owning the key, or None if Redis is unavailable, the key is then claimed
+        # in the database by the insert of the task
+        placeholder = (state_key(task_uuid), self.cache_manager.codec.encode(PENDING_OUTPUT),
+                       self.config['TASK_DEDUP_PENDING_TTL'])
+        try:
+            owner = self.cache_manager.claim(dedup_key, task_uuid, self.config['TASK_DEDUP_WINDOW'], placeholder)
+            return owner.decode() if owner is not None else task_uuid
+        except RedisError:
+            logger.warning("Failed to claim the deduplication key in the cache, using the database", exc_info=True)
+            return None
+
+    def _release_submission(self, dedup_key: str, task_uuid: str, in_database: bool) -> None:
+        # Release the deduplication key of a task that couldn't be submitted, so a retry can go through
+        try:
+            if in_database:
+                Task.release_dedup_key(self.db_manager, dedup_key, task_uuid)
+            else:
+                self.cache_manager.delete(dedup_key)
+        except Exception:
+            logger.warning("Failed to release the deduplication key of task: %s", task_uuid, exc_info=True)
+        if not in_database:
+            self._drop_state(task_uuid)
+
+    def _create_and_publish(self, task_uuid: str, task_name: str, spec: TaskSpec, task_parameters: Dict[str, Any],
+                            args: List[Any], dedup: Optional[Tuple[str, int]] = None) -> Task:
+        # Insert the task before its message can reach a worker, so the completion callbacks always find the row
+        # In outbox mode the message is committed with the row and published by the relay, otherwise it is
+        # published right after the insert, and the task is marked as ERROR if that fails
+        # With dedup, the deduplication key is claimed by the insert (see Task.create)
+        if self.config['TASK_PUBLISH_MODE'] == 'outbox':
+            task = Task.create(self.db_manager, task_uuid, task_name, task_parameters,
+                               OutboxMessage(spec.celery_name, args, spec.options), dedup=dedup)
+            self.outbox_relay.notify()
+            return task
 
-    def create_task(self, task_name: str, task_parameters: Dict[str, Any]) -> str:
+        task = Task.create(self.db_manager, task_uuid, task_name, task_parameters, dedup=dedup)
+        try:
+            with PUBLISH_DURATION.time(task_name):
+                self.celery.send_task(spec.celery_name, args=args, task_id=task_uuid, **spec.options)
+        except Exception as e:
+            logger.exception("Failed to publish task: %s", task_uuid)
+            Task.mark_finished(self.db_manager, task_uuid, 'ERROR', {'error': f"Failed to publish the task: {e}"})
+            self._drop_state(task_uuid)
+            raise
+        return task
+
+    def _drop_state(self, task_uuid: str) -> None:
+        # Drop the cached state of a task, when it is outdated and no result in Redis takes precedence over it
+        try:
+            self.cache_manager.delete(state_key(task_uuid))
+        except RedisError:
+            logger.warning("Failed to drop the cached state of task: %s", task_uuid, exc_info=True)
+
+    def submit_task(self, task_name: str, task_parameters: Dict[str, Any],
+                    idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        # Create a new task unless the same submission was made within the deduplication window
+        # A duplicate returns the UUID of the existing task, and its output if it has already finished,
+        # without publishing anything to the broker
+        spec, args = self._resolve_task(task_name, task_parameters)
+        dedup_key = self._dedup_key(spec, task_parameters, idempotency_key)
+        if dedup_key is None:
+            task_parameters, args = self._offload_parameters(spec, task_parameters, args)
+            task = self._create_and_publish(str(uuid.uuid4()), task_name, spec, task_parameters, args)
+            logger.info("Task created: %s", task.uuid)
+            return {'task_uuid': task.uuid}
+
+        task_uuid = str(uuid.uuid4())
+        owner = self._claim_submission(dedup_key, task_uuid)
+        if owner is not None and owner != task_uuid:
+            return self._duplicate_submission(owner)
+
+        in_database = owner is None
+        try:
+            task_parameters, args = self._offload_parameters(spec, task_parameters, args)
+            task = self._create_and_publish(task_uuid, task_name, spec, task_parameters, args,
+                                            (dedup_key, self.config['TASK_DEDUP_WINDOW']) if in_database else None)
+        except DuplicateSubmissionError as e:
+            return self._duplicate_submission(e.owner)
+        except Exception:
+            self._release_submission(dedup_key, task_uuid, in_database)
+            raise
+        # Duplicates may have the UUID before the row exists, the state cached for it meanwhile (the placeholder
+        # of the claim, or a miss cached by a lookup) is dropped so the next lookup reads the row
+        self._drop_state(task_uuid)
+        logger.info("Task created: %s", task.uuid)
+        return {'task_uuid': task.uuid}
+
+    def _duplicate_submission(self, owner: str) -> Dict[str, Any]:
+        # The response to a duplicate submission: the UUID of the existing task, and its output if it has finished
+        logger.info("Duplicate submission of task: %s", owner)
+        result: Dict[str, Any] = {'task_uuid': owner, 'deduplicated': True}
+        output = self._get_cached_output(owner)
+        if output is not None and output['status'] in TERMINAL_STATUSES:
+            result['task_output'] = self.load_result(output)
+        return result
+
+    def create_task(self, task_name: str, task_parameters: Dict[str, Any],
+                    idempotency_key: Optional[str] = None) -> str:
         # Create a new task based on the task name and parameters provided, and send it to Celery for execution
         # The task UUID returned can be used to query the status and output of the task
-        if task_name == 'sum_two_numbers':
-            celery_task = self.celery.send_task('app.tasks.task_functions.sum_two_numbers', 
-                                                args=[task_parameters['a'], task_parameters['b']])
-        elif task_name == 'query_chatgpt':
-            celery_task = self.celery.send_task('app.tasks.task_functions.query_chatgpt', 
-                                                args=[task_parameters['prompt'], self.config['OPENAI_API_KEY']])
-        elif task_name == 'find_longest_consecutive_letters':
-            celery_task = self.celery.send_task('app.tasks.task_functions.find_longest_consecutive_letters',
-                                                args=[task_parameters['string']])
+        return self.submit_task(task_name, task_parameters, idempotency_key)['task_uuid']
+
+    def create_tasks(self, task_specs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Create a batch of tasks from a list of {'task_name': ..., 'task_parameters': ...} specs
+        # All valid tasks are inserted with one multi-row INSERT, then published over a single broker connection
+        # (in outbox mode their messages are inserted by the same statement and published by the relay)
+        # Returns one entry per spec, in order, holding either the task UUID or the validation error
+        # (or both, for a task that was inserted but couldn't be published in direct mode)
+        if len(task_specs) > self.config['MAX_BATCH_SIZE']:
+            raise ValueError(f"Batch size exceeds the limit of {self.config['MAX_BATCH_SIZE']} tasks")
+
+        results: List[Dict[str, Any]] = []
+        resolved: List[Tuple[int, str, Dict[str, Any], TaskSpec, List[Any]]] = []
+        for index, spec in enumerate(task_specs):
+            try:
+                task_name = spec['task_name']
+                task_parameters = spec['task_parameters']
+                spec, args = self._resolve_task(task_name, task_parameters)
+            except KeyError as e:
+                results.append({'error': f"Missing field: {e.args[0]}"})
+                continue
+            except TypeError:
+                results.append({'error': 'Invalid task spec'})
+                continue
+            except ValueError as e:
+                results.append({'error': str(e)})
+                continue
+            results.append({})
+            task_parameters, args = self._offload_parameters(spec, task_parameters, args)
+            resolved.append((index, task_name, task_parameters, spec, args))
+
+        if not resolved:
+            return results
+
+        rows = []
+        for index, task_name, task_parameters, spec, args in resolved:
+            task_uuid = str(uuid.uuid4())
+            results[index]['task_uuid'] = task_uuid
+            rows.append((task_uuid, task_name, task_parameters))
+
+        if self.config['TASK_PUBLISH_MODE'] == 'outbox':
+            Task.create_many(self.db_manager, rows, [OutboxMessage(spec.celery_name, args, spec.options)
+                                                     for _, _, _, spec, args in resolved])
+            self.outbox_relay.notify()
         else:
-            logger.error(f"Invalid task name: {task_name}")
-            raise ValueError("Invalid task name")
+            Task.create_many(self.db_manager, rows)
+            published = 0
+            try:
+                with self.celery.producer_or_acquire() as producer:
+                    for (task_uuid, task_name, _), (_, _, _, spec, args) in zip(rows, resolved):
+                        with PUBLISH_DURATION.time(task_name):
+                            self.celery.send_task(spec.celery_name, args=args, task_id=task_uuid, producer=producer,
+                                                  **spec.options)
+                        published += 1
+            except Exception as e:
+                # As for a single task, the tasks that couldn't be published are marked as ERROR rather than left
+                # PENDING, and their entries hold the error next to their UUID
+                logger.exception("Failed to publish %d tasks of the batch", len(rows) - published)
+                error = f"Failed to publish the task: {e}"
+                for (task_uuid, _, _), (index, *_) in zip(rows[published:], resolved[published:]):
+                    Task.mark_finished(self.db_manager, task_uuid, 'ERROR', {'error': error})
+                    self._drop_state(task_uuid)
+                    results[index]['error'] = error
 
-        task_uuid = celery_task.id
-        task = Task.create(self.db_manager, task_uuid, task_name, task_parameters)
+        logger.info("Batch of %d tasks created", len(rows))
+        return results
 
-        logger.info(f"Task created: {task.uuid}")
-        return task.uuid
+    @staticmethod
+    def _encode_cursor(task: Task) -> str:
+        # Opaque cursor holding the sort key of the last task of a page
+        return base64.urlsafe_b64encode(json_dumpb([task.created_at.isoformat(), task.uuid])).decode()
 
-    def get_task_output(self, task_uuid: str) -> (Dict[str, Any], ):
-        # Get the status and output of a task based on the task UUID
-        # First, try to get the output from the cache, if not found, get it from the database
-        logger.info(f"Fetching output for task: {task_uuid}")
-
-        # Try to get from cache first
-        cache_key = f'celery-task-meta-{task_uuid}'
-        cached_output = self.cache_manager.get(cache_key)
-        if cached_output:
-            logger.info(f"Cache hit for task: {task_uuid}")
-            task_meta = json.loads(cached_output)
-            return {
-                'status': 'COMPLETED' if task_meta['status'] == 'SUCCESS' else 'FAILED',
-                'result': task_meta['result'] if task_meta['status'] == 'SUCCESS' else None,
-                'error': task_meta['result'] if task_meta['status'] == 'FAILURE' else None
-            }
-
-        # If not in cache, get from database
-        task = Task.get(self.db_manager, task_uuid)
-        if task is None:
-            logger.warning(f"Task not found in database: {task_uuid}")
-            return None
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[str, str]:
+        try:
+            created_at, task_uuid = json_loads(base64.urlsafe_b64decode(cursor.encode()))
+            uuid.UUID(task_uuid)
+            return created_at, task_uuid
+        except (binascii.Error, TypeError, ValueError, AttributeError):
+            raise ValidationError("Invalid cursor") from None
+
+    def list_tasks(self, task_name: Optional[str] = None, status: Optional[str] = None,
+                   limit: Optional[int] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+        # List tasks from the most recent, optionally filtered by name and status, one page at a time
+        # Returns the tasks of the page and the cursor of the next one, None on the last page
+        limit = self.config['TASK_LIST_DEFAULT_LIMIT'] if limit is None else limit
+        if not 0 < limit <= self.config['TASK_LIST_MAX_LIMIT']:
+            raise ValidationError(f"Limit must be between 1 and {self.config['TASK_LIST_MAX_LIMIT']}")
+        after = self._decode_cursor(cursor) if cursor else None
 
+        # One extra row tells whether there is a next page
+        tasks = Task.list_page(self.db_manager, task_name, status, limit + 1, after)
+        next_cursor = self._encode_cursor(tasks[limit - 1]) if len(tasks) > limit else None
         return {
-            'status': task.status,
-            'result': task.output if task.status == 'COMPLETED' else None,
-            'error': task.output.get('error') if task.status in ['FAILED', 'ERROR'] else None
+            'tasks': [{
+                'task_uuid': task.uuid,
+                'task_name': task.name,
+                'status': task.status,
+                'created_at': task.created_at.isoformat(),
+                'finished_at': task.finished_at.isoformat() if task.finished_at else None,
+            } for task in tasks[:limit]],
+            'next_cursor': next_cursor,
         }
+
+    def iter_result_text(self, output: Dict[str, Any]) -> Optional[Iterator[str]]:
+        # Chunks of a result stored in the blob store, or None if the result is inline
+        # Raises BlobNotFoundError if the blob has expired
+        blob_id = blob_id_of(output.get('result'))
+        return None if blob_id is None else self.blob_store.iter_text(blob_id)
+
+    def load_result(self, output: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        # The output with a result stored in the blob store loaded inline, for responses that can't stream it
+        blob_id = blob_id_of(output.get('result')) if output else None
+        if blob_id is None:
+            return output
+        return dict(output, result=self.blob_store.get_text(blob_id))
+
+    def _cache_loaded(self, finished: List[Tuple[Task, Dict[str, Any]]],
+                      states: Dict[str, Optional[Dict[str, Any]]]) -> None:
+        # Write the outputs read from the database back to the caches, so that later lookups don't query it again
+        try:
+            for ttl, entries in self.output_lookup.loaded_entries(finished, states).items():
+                self.cache_manager.set_many(entries, expire=ttl)
+        except RedisError:
+            logger.warning("Failed to write task outputs back to the cache", exc_info=True)
+
+    def _get_cached_output(self, task_uuid: str) -> Optional[Dict[str, Any]]:
+        # Get the output of a task from the in-process cache or from Redis, without touching the database
+        keys, outputs, remote = self.output_lookup.lookup_local([task_uuid])
+        if remote:
+            self.output_lookup.apply_cached(keys, outputs, remote, self.cache_manager.get_many(cache_keys(keys, remote)))
+        return outputs[0]
+
+    def _load_output(self, task_uuid: str) -> Optional[Dict[str, Any]]:
+        # Read the output of a task missing from the caches from the database, and write it back to them
+        task = Task.get(self.db_manager, canonical_uuid(task_uuid))
+        if task is None:
+            logger.warning("Task not found in database: %s", task_uuid)
+        outputs: List[Optional[Dict[str, Any]]] = [None]
+        self._cache_loaded(*self.output_lookup.apply_loaded(outputs, {task_uuid: [0]}, {task_uuid: task} if task else {}))
+        return outputs[0]
+
+    def get_task_output(self, task_uuid: str) -> Optional[Dict[str, Any]]:
+        # Get the status and output of a task based on the task UUID
+        # First, try the in-process cache of finished tasks, then Redis, and finally the database
+        # Redis holds the results of finished tasks and, for a short time, the state of unfinished and unknown ones,
+        # both read with one MGET. Concurrent misses of the same task share a single query
+        logger.info("Fetching output for task: %s", task_uuid)
+
+        keys, outputs, remote = self.output_lookup.lookup_local([task_uuid])
+        if not remote:
+            return outputs[0]
+
+        values = self.cache_manager.get_many(cache_keys(keys, remote))
+        if not self.output_lookup.apply_cached(keys, outputs, remote, values):
+            return outputs[0]
+
+        return self._single_flight.do(keys[0], lambda: self._load_output(keys[0]))
+
+    def wait_for_task_output(self, task_uuid: str, timeout: float) -> Optional[Dict[str, Any]]:
+        # Get the output of a task, waiting up to timeout seconds for it to finish if it is still pending
+        # The wait blocks on the completion channel rather than re-querying, and holds no DB connection meanwhile
+        event = self.completion_listener.subscribe(task_uuid)
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                output = self.get_task_output(task_uuid)
+                if output is None or output['status'] in TERMINAL_STATUSES:
+                    return output
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not event.wait(remaining):
+                    return output
+                event.clear()
+        finally:
+            self.completion_listener.unsubscribe(task_uuid, event)
+
+    def get_task_outputs(self, task_uuids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        # Get the status and output of several tasks, in the order of the UUIDs provided
+        # All UUIDs are looked up with a single MGET, and only the cache misses are fetched from the database
+        # with a single query, tasks that don't exist are returned as None
+        if len(task_uuids) > self.config['MAX_BATCH_SIZE']:
+            raise ValueError(f"Batch size exceeds the limit of {self.config['MAX_BATCH_SIZE']} tasks")
+
+        keys, outputs, remote = self.output_lookup.lookup_local(task_uuids)
+        misses = self.output_lookup.apply_cached(keys, outputs, remote,
+                                                 self.cache_manager.get_many(cache_keys(keys, remote)))
+        if misses:
+            tasks = Task.get_many(self.db_manager, list(misses))
+            self._cache_loaded(*self.output_lookup.apply_loaded(outputs, misses, tasks))
+
+        logger.info("Fetched outputs for %d tasks, %d cache misses", len(task_uuids), len(misses))
+        return outputs
@@ -1,45 +1,254 @@
-from typing import Optional, Dict, Any
-import json
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, NamedTuple, Tuple
+from datetime import datetime
+import uuid
 from ..core.database_manager import DatabaseManager
+from ..core.codec import json_dumps
+
+if TYPE_CHECKING:
+    from ..core.async_database_manager import AsyncDatabaseManager
+
+# Statuses after which a task's output never changes
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED', 'ERROR')
+
+
+def canonical_uuid(value: Any) -> Optional[str]:
+    # The canonical form of a task UUID, or None if it isn't well formed and so can't match any task
+    try:
+        return str(uuid.UUID(value))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class DuplicateSubmissionError(Exception):
+    # Raised by Task.create when the deduplication key of the submission is owned by another task
+    def __init__(self, owner: str) -> None:
+        super().__init__(f"Duplicate of task {owner}")
+        self.owner: str = owner
+
+
+class OutboxMessage(NamedTuple):
+    # Broker message of a task, committed together with its row and published by the outbox relay
+    celery_name: str
+    args: List[Any]
+    options: Dict[str, Any]
 
 
 class Task:
-    def __init__(self, uuid: str, name: str, parameters: Dict[str, Any], status: str, output: Optional[Dict[str, Any]] = None) -> None:
+    def __init__(self, uuid: str, name: str, parameters: Dict[str, Any], status: str, output: Optional[Dict[str, Any]] = None,
+                 created_at: Optional[datetime] = None, finished_at: Optional[datetime] = None) -> None:
         self.uuid: str = uuid
         self.name: str = name
         self.parameters: Dict[str, Any] = parameters
         self.status: str = status
         self.output: Optional[Dict[str, Any]] = output
+        self.created_at: Optional[datetime] = created_at
+        self.finished_at: Optional[datetime] = finished_at
 
     @classmethod
-    def create(cls, db_manager: DatabaseManager, task_uuid: str, name: str, parameters: Dict[str, Any]) -> 'Task':
+    def create(cls, db_manager: DatabaseManager, task_uuid: str, name: str, parameters: Dict[str, Any],
+               message: Optional[OutboxMessage] = None, dedup: Optional[Tuple[str, int]] = None) -> 'Task':
         # Create a new task in the database with the provided UUID, name, and parameters
-        db_manager.execute(
-            "INSERT INTO tasks (uuid, name, parameters, status) VALUES (%s, %s, %s, %s)",
-            (task_uuid, name, json.dumps(parameters), 'PENDING')
-        )
+        # With a message, its outbox entry is inserted by the same statement, so both are committed together
+        # With dedup, a (key, window in seconds) pair, the deduplication key is claimed in the same transaction,
+        # so the task owning a key always has a row. Raises DuplicateSubmissionError if another task owns it
+        if message is None:
+            query = "INSERT INTO tasks (uuid, name, parameters, status) VALUES (%s, %s, %s, %s)"
+            params: tuple = (task_uuid, name, json_dumps(parameters), 'PENDING')
+        else:
+            query = ("WITH task AS (INSERT INTO tasks (uuid, name, parameters, status) VALUES (%s, %s, %s, %s) "
+                     "RETURNING uuid) "
+                     "INSERT INTO task_outbox (task_uuid, celery_name, args, options) SELECT uuid, %s, %s, %s FROM task")
+            params = (task_uuid, name, json_dumps(parameters), 'PENDING',
+                      message.celery_name, json_dumps(message.args), json_dumps(message.options))
+        if dedup is None:
+            db_manager.execute(query, params)
+            return cls(task_uuid, name, parameters, 'PENDING')
+
+        with db_manager.get_connection() as conn:
+            with conn.cursor() as cur:
+                owner = cls._claim_dedup_key(cur, dedup[0], task_uuid, dedup[1])
+                if owner != task_uuid:
+                    conn.rollback()
+                    raise DuplicateSubmissionError(owner)
+                cur.execute(query, params)
+            conn.commit()
         return cls(task_uuid, name, parameters, 'PENDING')
 
+    @classmethod
+    def create_many(cls, db_manager: DatabaseManager, tasks: List[Tuple[str, str, Dict[str, Any]]],
+                    messages: Optional[List[OutboxMessage]] = None) -> List['Task']:
+        # Create several tasks from (uuid, name, parameters) tuples with a single multi-row INSERT
+        # With messages (one per task), their outbox entries are inserted by the same statement
+        if messages is None:
+            db_manager.execute_values(
+                "INSERT INTO tasks (uuid, name, parameters, status) VALUES %s",
+                [(task_uuid, name, json_dumps(parameters), 'PENDING') for task_uuid, name, parameters in tasks]
+            )
+        else:
+            db_manager.execute_values(
+                """
+                WITH v (uuid, name, parameters, celery_name, args, options) AS (VALUES %s),
+                task AS (
+                    INSERT INTO tasks (uuid, name, parameters, status)
+                    SELECT uuid::uuid, name, parameters::jsonb, 'PENDING' FROM v
+                )
+                INSERT INTO task_outbox (task_uuid, celery_name, args, options)
+                SELECT uuid::uuid, celery_name, args::jsonb, options::jsonb FROM v
+                """,
+                [(task_uuid, name, json_dumps(parameters), message.celery_name, json_dumps(message.args),
+                  json_dumps(message.options)) for (task_uuid, name, parameters), message in zip(tasks, messages)]
+            )
+        return [cls(task_uuid, name, parameters, 'PENDING') for task_uuid, name, parameters in tasks]
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any], task_uuid: Optional[str] = None) -> 'Task':
+        # Build a task from a row of the tasks table, keeping the UUID as requested rather than as stored
+        return cls(
+            row['uuid'] if task_uuid is None else task_uuid,
+            row['name'],
+            row['parameters'],
+            row['status'],
+            row['output'] if row['output'] else None,
+            row.get('created_at'),
+            row.get('finished_at')
+        )
+
+    @staticmethod
+    def _normalize_uuids(task_uuids: List[str]) -> Dict[str, List[str]]:
+        # The UUIDs requested by their canonical form, UUIDs that aren't well formed can't exist in the table
+        # and are skipped rather than failing the query
+        normalized: Dict[str, List[str]] = {}
+        for task_uuid in task_uuids:
+            canonical = canonical_uuid(task_uuid)
+            if canonical is not None:
+                normalized.setdefault(canonical, []).append(task_uuid)
+        return normalized
+
     @classmethod
     def get(cls, db_manager: DatabaseManager, task_uuid: str) -> Optional['Task']:
         # Get a task from the database based on the task UUID
         result = db_manager.execute("SELECT * FROM tasks WHERE uuid = %s", (task_uuid, ))
-        if result:
-            task = result[0]
-            return cls(
-                task['uuid'],
-                task['name'],
-                task['parameters'],
-                task['status'],
-                task['output'] if task['output'] else None
-            )
-        return None
+        return cls.from_row(result[0]) if result else None
+
+    @classmethod
+    def get_many(cls, db_manager: DatabaseManager, task_uuids: List[str]) -> Dict[str, 'Task']:
+        # Get several tasks from the database with a single query, keyed by the UUIDs provided
+        normalized = cls._normalize_uuids(task_uuids)
+        if not normalized:
+            return {}
+
+        result = db_manager.execute("SELECT * FROM tasks WHERE uuid = ANY(%s::uuid[])", (list(normalized), ))
+        return {task_uuid: cls.from_row(row, task_uuid) for row in result or []
+                for task_uuid in normalized[str(row['uuid'])]}
+
+    @classmethod
+    async def get_async(cls, db_manager: 'AsyncDatabaseManager', task_uuid: str) -> Optional['Task']:
+        # get() on the asyncio database manager of the ASGI app
+        result = await db_manager.execute("SELECT * FROM tasks WHERE uuid = %s", (task_uuid, ))
+        return cls.from_row(result[0]) if result else None
+
+    @classmethod
+    async def get_many_async(cls, db_manager: 'AsyncDatabaseManager', task_uuids: List[str]) -> Dict[str, 'Task']:
+        # get_many() on the asyncio database manager of the ASGI app
+        normalized = cls._normalize_uuids(task_uuids)
+        if not normalized:
+            return {}
+
+        result = await db_manager.execute("SELECT * FROM tasks WHERE uuid = ANY(%s::uuid[])", (list(normalized), ))
+        return {task_uuid: cls.from_row(row, task_uuid) for row in result or []
+                for task_uuid in normalized[str(row['uuid'])]}
+
+    @classmethod
+    def list_page(cls, db_manager: DatabaseManager, name: Optional[str] = None, status: Optional[str] = None,
+                  limit: int = 50, after: Optional[Tuple[str, str]] = None) -> List['Task']:
+        # List tasks from the most recent, optionally filtered by name and status, without parameters and output
+        # Pages are read by keyset: after is the (created_at, uuid) of the last task of the previous page, so each
+        # page is an index range scan whatever its depth, where OFFSET would scan all the rows before it
+        conditions: List[str] = []
+        params: List[Any] = []
+        if name is not None:
+            conditions.append("name = %s")
+            params.append(name)
+        if status is not None:
+            conditions.append("status = %s")
+            params.append(status)
+        if after is not None:
+            conditions.append("(created_at, uuid) < (%s::timestamptz, %s::uuid)")
+            params.extend(after)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        result = db_manager.execute(
+            f"SELECT uuid, name, status, created_at, finished_at FROM tasks{where} "
+            f"ORDER BY created_at DESC, uuid DESC LIMIT %s",
+            (*params, limit)
+        )
+        return [cls(str(task['uuid']), task['name'], None, task['status'], None, task['created_at'], task['finished_at'])
+                for task in result or []]
 
     def update_status(self, db_manager: DatabaseManager, status: str, output: Optional[Dict[str, Any]] = None) -> None:
         # Update the status and output of the task in the database based on the provided values
         db_manager.execute(
-            "UPDATE tasks SET status = %s, output = %s WHERE uuid = %s",
-            (status, json.dumps(output) if output else None, self.uuid)
+            "UPDATE tasks SET status = %s, output = %s, finished_at = CASE WHEN %s THEN now() END WHERE uuid = %s",
+            (status, json_dumps(output) if output else None, status in TERMINAL_STATUSES, self.uuid)
         )
         self.status = status
         self.output = output
+
+    @classmethod
+    def mark_finished(cls, db_manager: DatabaseManager, task_uuid: str, status: str,
+                      output: Optional[Any] = None) -> bool:
+        # Set the final status and output of a task in a single round trip
+        # Returns False if the task doesn't exist, which replaces a separate existence check
+        result = db_manager.execute(
+            "UPDATE tasks SET status = %s, output = %s, finished_at = now() WHERE uuid = %s RETURNING uuid",
+            (status, json_dumps(output) if output is not None else None, task_uuid)
+        )
+        return bool(result)
+
+    @staticmethod
+    def _claim_dedup_key(cur, dedup_key: str, task_uuid: str, window: int) -> str:
+        # Claim a deduplication key for a task for window seconds, an expired claim is taken over
+        # Returns the UUID of the task owning the key, which is task_uuid if the claim succeeded
+        cur.execute(
+            """
+            INSERT INTO task_dedup (dedup_key, task_uuid, expires_at)
+            VALUES (%s, %s, now() + %s * interval '1 second')
+            ON CONFLICT (dedup_key) DO UPDATE SET task_uuid = EXCLUDED.task_uuid, expires_at = EXCLUDED.expires_at
+            WHERE task_dedup.expires_at <= now()
+            RETURNING task_uuid
+            """,
+            (dedup_key, task_uuid, window)
+        )
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("SELECT task_uuid FROM task_dedup WHERE dedup_key = %s", (dedup_key, ))
+            row = cur.fetchone()
+        return str(row['task_uuid']) if row else task_uuid
+
+    @staticmethod
+    def release_dedup_key(db_manager: DatabaseManager, dedup_key: str, task_uuid: str) -> None:
+        # Release a deduplication key claimed by a task that couldn't be submitted
+        db_manager.execute("DELETE FROM task_dedup WHERE dedup_key = %s AND task_uuid = %s", (dedup_key, task_uuid))
+
+    @staticmethod
+    def delete_expired_dedup_keys(db_manager: DatabaseManager) -> int:
+        # Delete the expired deduplication keys, returns how many were deleted
+        result = db_manager.execute(
+            "WITH deleted AS (DELETE FROM task_dedup WHERE expires_at <= now() RETURNING 1) "
+            "SELECT count(*) AS count FROM deleted"
+        )
+        return result[0]['count'] if result else 0
+
+    @classmethod
+    def update_status_many(cls, db_manager: DatabaseManager,
+                           updates: List[Tuple[str, str, Optional[Any]]]) -> None:
+        # Update the status and output of several tasks from (uuid, status, output) tuples with a single
+        # UPDATE ... FROM (VALUES ...) statement, UUIDs without a row are ignored
+        db_manager.execute_values(
+            """
+            UPDATE tasks SET status = v.status, output = v.output::jsonb, finished_at = now()
+            FROM (VALUES %s) AS v (uuid, status, output)
+            WHERE tasks.uuid = v.uuid::uuid
+            """,
+            [(task_uuid, status, json_dumps(output) if output is not None else None)
+             for task_uuid, status, output in updates]
+        )
@@ -0,0 +1,142 @@
+from typing import List, NamedTuple, Optional
+from datetime import date, datetime, timedelta, timezone
+import gzip
+import logging
+import os
+import re
+
+from ..core.database_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+# The tasks table is partitioned by range of created_at. Partitions are named after their bounds in UTC days,
+# tasks_<start>_<end> (end excluded), the rows from before the partitioning are in tasks_min_<end>
+# The rows outside all of them (when the maintenance job hasn't created their partition in time) go to tasks_default
+_PARTITION_NAME = re.compile(r'tasks_(min|\d{8})_(\d{8})')
+_EPOCH = date(1970, 1, 1)
+DEFAULT_PARTITION = 'tasks_default'
+
+
+class Partition(NamedTuple):
+    name: str
+    start: Optional[date]
+    end: date
+
+
+def partition_name(start: Optional[date], end: date) -> str:
+    return f"tasks_{start.strftime('%Y%m%d') if start else 'min'}_{end.strftime('%Y%m%d')}"
+
+
+def period_start(day: date, days: int) -> date:
+    # Start of the period of the given length holding the day, periods are aligned on the epoch
+    return _EPOCH + timedelta(days=(day - _EPOCH).days // days * days)
+
+
+def _utc(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def list_partitions(db_manager: DatabaseManager) -> List[Partition]:
+    # The partitions of the tasks table, oldest first
+    result = db_manager.execute(
+        "SELECT c.relname AS name FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'tasks'::regclass"
+    )
+    partitions = []
+    for row in result or []:
+        match = _PARTITION_NAME.fullmatch(row['name'])
+        if match is None:
+            continue
+        start, end = match.groups()
+        partitions.append(Partition(
+            row['name'],
+            None if start == 'min' else datetime.strptime(start, '%Y%m%d').date(),
+            datetime.strptime(end, '%Y%m%d').date()
+        ))
+    return sorted(partitions, key=lambda partition: partition.end)
+
+
+def create_partitions(db_manager: DatabaseManager, days: int, ahead: int, today: Optional[date] = None) -> List[str]:
+    # Create the partition holding today and the next ahead ones, unless existing partitions already cover them
+    # A period partly covered (e.g. after changing the partition length) gets a partition for the rest of it,
+    # and the periods missed since the last partition (the job didn't run) get theirs for the rows in tasks_default
+    existing = list_partitions(db_manager)
+    covered_until = existing[-1].end if existing else None
+    start = period_start(today or _today(), days)
+    until = start + timedelta(days=days * (ahead + 1))
+    if covered_until is not None and covered_until < start:
+        start = period_start(covered_until, days)
+    created = []
+    while start < until:
+        end = start + timedelta(days=days)
+        if covered_until is None or end > covered_until:
+            partition_start = start if covered_until is None else max(start, covered_until)
+            name = partition_name(partition_start, end)
+            create_partition(db_manager, name, partition_start, end)
+            covered_until = end
+            created.append(name)
+        start = end
+    return created
+
+
+def create_partition(db_manager: DatabaseManager, name: str, start: date, end: date) -> None:
+    # Postgres refuses to create a partition for rows already in the default partition. Those rows are moved
+    # to the new partition, with the default partition detached meanwhile, in a single transaction
+    bounds = (_utc(start), _utc(end))
+    create = f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF tasks FOR VALUES FROM (%s) TO (%s)"
+    stray = db_manager.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s) AS stray",
+        bounds
+    )
+    if not stray[0]['stray']:
+        db_manager.execute(create, bounds)
+        return
+    with db_manager.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE tasks DETACH PARTITION {DEFAULT_PARTITION}")
+            cur.execute(create, bounds)
+            cur.execute(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s "
+                f"RETURNING *) INSERT INTO {name} SELECT * FROM moved",
+                bounds
+            )
+            moved = cur.rowcount
+            cur.execute(f"ALTER TABLE tasks ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+        conn.commit()
+    logger.warning("Moved %d tasks from %s to the new partition %s", moved, DEFAULT_PARTITION, name)
+
+
+def archive_partition(db_manager: DatabaseManager, name: str, archive_dir: str) -> str:
+    # Export the rows of a partition to a gzipped CSV file with COPY, streamed without loading them
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'{name}.csv.gz')
+    with db_manager.get_connection() as conn:
+        with conn.cursor() as cur, gzip.open(path, 'wb', compresslevel=6) as file:
+            cur.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", file)
+        conn.rollback()
+    return path
+
+
+def retire_partitions(db_manager: DatabaseManager, retention_days: int, drop: bool = True,
+                      archive_dir: Optional[str] = None, today: Optional[date] = None) -> List[str]:
+    # Detach the partitions whose tasks are all older than the retention period, archiving them first if
+    # archive_dir is set, and drop them unless drop is False. The current partition is never retired
+    cutoff = (today or _today()) - timedelta(days=retention_days)
+    partitions = list_partitions(db_manager)
+    retired = []
+    for partition in partitions[:-1]:
+        if partition.end > cutoff:
+            break
+        if archive_dir:
+            path = archive_partition(db_manager, partition.name, archive_dir)
+            logger.info("Archived partition %s to %s", partition.name, path)
+        db_manager.execute(f"ALTER TABLE tasks DETACH PARTITION {partition.name}")
+        if drop:
+            db_manager.execute(f"DROP TABLE {partition.name}")
+        logger.info("Retired partition %s", partition.name)
+        retired.append(partition.name)
+    return retired
@@ -1,64 +1,90 @@
-import json
-from typing import Any
-from celery.signals import task_success, task_failure
-from dotenv import load_dotenv
+from typing import Any, Optional
+from celery.signals import task_success, task_failure, worker_process_shutdown, worker_shutdown
+import atexit
+import logging
 
 from app.models.task import Task
 from app.core.database_manager import DatabaseManager
-from app.core.cache_manager import CacheManager
+from app.core.cache_manager import CacheManager, result_key, state_key, build_result_meta
+from app.core.metrics import CALLBACK_DURATION
+from app.tasks.registry import registry, DEFAULT_RESULT_TTL
+from app.tasks.status_buffer import StatusUpdateBuffer
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 
 class TaskCallbackManager:
-    def __init__(self, db_manager: DatabaseManager, cache_manager: CacheManager):
+    def __init__(self, db_manager: DatabaseManager, cache_manager: CacheManager,
+                 status_buffer: Optional[StatusUpdateBuffer] = None):
         self.db_manager = db_manager
         self.cache_manager = cache_manager
+        # In write-behind mode the result goes to the cache right away and the database update is buffered
+        self.status_buffer = status_buffer
 
     def initialize_callbacks(self):
         # Connect the task success and failure signals to the respective handlers
         task_success.connect(self.task_success_handler)
         task_failure.connect(self.task_failure_handler)
+        if self.status_buffer:
+            # Flush the buffered status updates when a prefork child or the worker itself shuts down
+            worker_process_shutdown.connect(self.shutdown_handler, weak=False)
+            worker_shutdown.connect(self.shutdown_handler, weak=False)
+            atexit.register(self.shutdown_handler)
+
+    def shutdown_handler(self, sender=None, **kwargs):
+        if self.status_buffer:
+            try:
+                self.status_buffer.close()
+            except Exception:
+                pass
 
+    @CALLBACK_DURATION.time('success')
     def task_success_handler(self, sender=None, result=None, **kwargs):
         # Update the task status in the database and cache in case of success
-        print(f"Task {sender.request.id} completed successfully")
+        logger.info("Task %s completed successfully", sender.request.id)
         task_id = sender.request.id
-        task = Task.get(self.db_manager, task_id)
-        if task:
-            task.update_status(self.db_manager, 'COMPLETED', result)
-            self._update_cache(task_id, 'SUCCESS', result)
-
+        if self.status_buffer:
+            self._update_cache(task_id, 'SUCCESS', result, ttl=self._result_ttl(sender))
+            self.status_buffer.add(task_id, 'COMPLETED', result)
+            return
+        if Task.mark_finished(self.db_manager, task_id, 'COMPLETED', result):
+            self._update_cache(task_id, 'SUCCESS', result, ttl=self._result_ttl(sender))
+
+    @CALLBACK_DURATION.time('failure')
     def task_failure_handler(self, sender=None, exception=None, **kwargs):
         # Update the task status in the database and cache in case of failure
-        print(f"Task {sender.request.id} failed: {str(exception)}")
+        logger.info("Task %s failed: %s", sender.request.id, exception)
         task_id = sender.request.id
-        task = Task.get(self.db_manager, task_id)
-        if task:
-            error = str(exception)
-            task.update_status(self.db_manager, 'FAILED', {'error': error})
-            self._update_cache(task_id, 'FAILURE', error)
-
-    def _update_cache(self, task_id: str, status: str, result: Any):
+        error = str(exception)
+        traceback = getattr(kwargs.get('einfo'), 'traceback', None)
+        if self.status_buffer:
+            self._update_cache(task_id, 'FAILURE', error, traceback, ttl=self._result_ttl(sender))
+            self.status_buffer.add(task_id, 'FAILED', {'error': error})
+            return
+        if Task.mark_finished(self.db_manager, task_id, 'FAILED', {'error': error}):
+            self._update_cache(task_id, 'FAILURE', error, traceback, ttl=self._result_ttl(sender))
+
+    @staticmethod
+    def _result_ttl(sender) -> int:
+        # How long the result of this task should stay in the cache, as declared in the task registry
+        spec = registry.get_by_celery_name(getattr(sender, 'name', None))
+        return spec.result_ttl if spec else DEFAULT_RESULT_TTL
+
+    def _update_cache(self, task_id: str, status: str, result: Any, traceback: Optional[str] = None,
+                      ttl: int = DEFAULT_RESULT_TTL):
         # Update the task status in the cache
-        cache_key = f'celery-task-meta-{task_id}'
-        cache_value = self.cache_manager.get(cache_key)
-
-        if cache_value:
-            try:
-                task_meta = json.loads(cache_value)
-            except json.JSONDecodeError:
-                task_meta = {}
-        else:
-            task_meta = {}
-
-        task_meta.update({
-            'status': status,
-            'result': result,
-            'task_id': task_id,
-        })
+        # The whole meta is written in a single SETEX instead of a GET/merge/SETEX round trip, the fields
+        # mirror the ones the Celery result backend stores so AsyncResult can still read the key
+        cache_key = result_key(task_id)
+        task_meta = build_result_meta(task_id, status, result, traceback)
 
-        self.cache_manager.set(cache_key, json.dumps(task_meta), expire=3600)  # Cache for 1 hour
+        # Drop the cached pending state and announce the completion in the same round trip,
+        # so long-polling clients wake up
+        with self.cache_manager.pipeline() as pipe:
+            pipe.setex(cache_key, ttl, self.cache_manager.codec.encode(task_meta))
+            pipe.delete(state_key(task_id))
+            pipe.publish(self.cache_manager.config['TASK_COMPLETION_CHANNEL'], task_id)
+            pipe.execute()
 
 
 # Create a singleton instance
@@ -67,7 +93,12 @@ callback_manager = None
 
 def initialize_callback_manager(db_manager: DatabaseManager, cache_manager: CacheManager):
     global callback_manager
-    callback_manager = TaskCallbackManager(db_manager, cache_manager)
+    status_buffer = None
+    if db_manager.config['CALLBACK_WRITE_BEHIND']:
+        status_buffer = StatusUpdateBuffer(db_manager,
+                                           flush_interval=db_manager.config['CALLBACK_FLUSH_INTERVAL_MS'] / 1000,
+                                           max_items=db_manager.config['CALLBACK_FLUSH_MAX_ITEMS'])
+    callback_manager = TaskCallbackManager(db_manager, cache_manager, status_buffer)
     callback_manager.initialize_callbacks()
 
 
@@ -0,0 +1,123 @@
+from typing import TYPE_CHECKING, Any, Mapping, Optional
+import hashlib
+import logging
+import os
+import threading
+
+from redis.exceptions import RedisError
+
+from app.core.cache_manager import CacheManager
+from app.core.single_flight import SingleFlight
+
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(__name__)
+
+
+class ChatGPTClient:
+    # Client for the chat completions API with a keep-alive session per process, connect/read timeouts,
+    # retries with jittered backoff on 429/5xx, coalescing of identical in-flight prompts and a result
+    # cache keyed by the prompt hash. It is thread and greenlet safe, so a worker running the gevent or
+    # threads pool keeps many requests in flight from one process.
+    def __init__(self, config: Mapping[str, Any], cache_manager: Optional[CacheManager] = None) -> None:
+        self.url: str = config['OPENAI_API_URL']
+        self.model: str = config['OPENAI_MODEL']
+        self.timeout = (config['OPENAI_CONNECT_TIMEOUT'], config['OPENAI_READ_TIMEOUT'])
+        self.max_retries: int = config['OPENAI_MAX_RETRIES']
+        self.backoff_factor: float = config['OPENAI_BACKOFF_FACTOR']
+        self.pool_size: int = config['OPENAI_POOL_SIZE']
+        self.result_ttl: int = config['OPENAI_RESULT_CACHE_TTL']
+        self.cache_manager: Optional[CacheManager] = cache_manager
+        self._single_flight = SingleFlight()
+        self._pid: int = 0
+        self._session: Optional['requests.Session'] = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> 'requests.Session':
+        # One session per process, a session inherited through fork() would share its sockets with the parent
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._create_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def _create_session(self) -> 'requests.Session':
+        # requests is imported on first use, it is slow to import and only the workers querying ChatGPT need it
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            backoff_jitter=self.backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'POST'}),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=self.pool_size)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def result_key(self, prompt: str) -> str:
+        # Content-addressed cache key of a prompt's response
+        digest = hashlib.sha256(f'{self.model}\0{prompt}'.encode()).hexdigest()
+        return f'chatgpt-result-{digest}'
+
+    def complete(self, prompt: str, api_key: str) -> str:
+        # Return the response to a prompt, from the cache if it was answered recently
+        key = self.result_key(prompt)
+        cached = self._get_cached(key)
+        if cached is not None:
+            logger.info("ChatGPT result cache hit")
+            return cached
+        return self._single_flight.do(key, lambda: self._request(key, prompt, api_key))
+
+    def _request(self, key: str, prompt: str, api_key: str) -> str:
+        response = self.session.post(
+            self.url,
+            json={'model': self.model, 'messages': [{'role': 'user', 'content': prompt}]},
+            headers={'Authorization': f"Bearer {api_key}"},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        content = response.json()['choices'][0]['message']['content']
+        self._set_cached(key, content)
+        return content
+
+    def _get_cached(self, key: str) -> Optional[str]:
+        if self.cache_manager is None or not self.result_ttl:
+            return None
+        try:
+            return self.cache_manager.get_object(key)
+        except RedisError:
+            logger.warning("Failed to read the ChatGPT result cache", exc_info=True)
+            return None
+
+    def _set_cached(self, key: str, content: str) -> None:
+        if self.cache_manager is None or not self.result_ttl:
+            return
+        try:
+            self.cache_manager.set_object(key, content, expire=self.result_ttl)
+        except RedisError:
+            logger.warning("Failed to write the ChatGPT result cache", exc_info=True)
+
+
+_client: Optional[ChatGPTClient] = None
+_client_lock = threading.Lock()
+
+
+def get_chatgpt_client(config: Mapping[str, Any]) -> ChatGPTClient:
+    # Return the client of this worker, created on first use from the Celery app config
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ChatGPTClient(config, CacheManager(config))
+    return _client
@@ -0,0 +1,103 @@
+from typing import Any, Mapping, Optional
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+
+from celery import Task as CeleryTask
+from celery.exceptions import Ignore
+from redis import Redis
+from redis.exceptions import RedisError
+
+from app.core.cache_manager import CacheManager
+
+logger = logging.getLogger(__name__)
+
+# Drops the expired leases, then takes a slot if fewer than ARGV[2] leases remain
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+"""
+
+
+class ConcurrencyLimiter:
+    # Limits how many tasks of a kind run at once across all workers, with a Redis sorted set of leases
+    # scored by their expiry time, so slots held by crashed workers free themselves after lease seconds
+    def __init__(self, cache_manager: CacheManager, lease: float) -> None:
+        self.cache_manager: CacheManager = cache_manager
+        self.lease: float = lease
+        self._acquire_script = Redis(connection_pool=cache_manager.pool).register_script(_ACQUIRE_SCRIPT)
+
+    @staticmethod
+    def key(task_name: str) -> str:
+        return f'task-concurrency-{task_name}'
+
+    def acquire(self, task_name: str, limit: int) -> Optional[str]:
+        # Take a slot in a single round trip, returns the lease token, or None if all slots are taken
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self.cache_manager.get_connection() as redis:
+            acquired = self._acquire_script(keys=[self.key(task_name)],
+                                            args=[now, limit, now + self.lease, token, math.ceil(self.lease)],
+                                            client=redis)
+        return token if acquired else None
+
+    def release(self, task_name: str, token: str) -> None:
+        with self.cache_manager.get_connection() as redis:
+            redis.zrem(self.key(task_name), token)
+
+
+_limiter: Optional[ConcurrencyLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_concurrency_limiter(config: Mapping[str, Any]) -> ConcurrencyLimiter:
+    # Return the limiter of this worker, created on first use from the Celery app config
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = ConcurrencyLimiter(CacheManager(config), config['TASK_CONCURRENCY_LEASE'])
+    return _limiter
+
+
+class ConcurrencyLimitedTask(CeleryTask):
+    # Base class of the registered tasks, a task with a limit in TASK_CONCURRENCY_LIMITS holds a slot while
+    # it runs. When all slots are taken the message is published again with a jittered delay instead of
+    # blocking the worker process. Redis errors let the task run, the limit is a protection, not a lock
+    public_name: Optional[str] = None
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        limit = self.app.conf.get('TASK_CONCURRENCY_LIMITS', {}).get(self.public_name)
+        if not limit or self.request.called_directly:
+            return super().__call__(*args, **kwargs)
+
+        limiter = get_concurrency_limiter(self.app.conf)
+        try:
+            token = limiter.acquire(self.public_name, limit)
+        except RedisError:
+            logger.warning("Failed to acquire a concurrency slot for task: %s", self.request.id, exc_info=True)
+            return super().__call__(*args, **kwargs)
+
+        if token is None:
+            delay = self.app.conf['TASK_CONCURRENCY_RETRY_DELAY'] * (1 + random.random())
+            # The arguments of the message rather than the ones the task runs with, which subclasses may have
+            # resolved (e.g. blob references loaded, or config values appended)
+            self.signature_from_request(self.request, self.request.args, self.request.kwargs,
+                                        countdown=delay).apply_async()
+            raise Ignore()
+
+        try:
+            return super().__call__(*args, **kwargs)
+        finally:
+            try:
+                limiter.release(self.public_name, token)
+            except RedisError:
+                logger.warning("Failed to release the concurrency slot of task: %s", self.request.id, exc_info=True)
@@ -0,0 +1,68 @@
+from typing import Any, Mapping
+from datetime import datetime
+import logging
+import time
+
+from celery.signals import (before_task_publish, task_prerun, task_postrun, worker_process_shutdown,
+                            after_setup_logger, after_setup_task_logger)
+
+from app.core.metrics import metrics, TASK_QUEUE_WAIT, TASK_RUN_DURATION
+from app.core.log_setup import install_queue_logging, stop_queue_logging
+
+logger = logging.getLogger(__name__)
+
+
+def _task_name(task) -> str:
+    # The public name of the registered tasks, the Celery name of the others
+    return getattr(task, 'public_name', None) or task.name
+
+
+def stamp_published_at(headers=None, **kwargs):
+    # Stamp each message with the time it is published, the worker computes the queue wait from it
+    if headers is not None:
+        headers['published_at'] = time.time()
+
+
+def task_started_handler(task=None, **kwargs):
+    request = task.request
+    published_at = getattr(request, 'published_at', None)
+    if published_at:
+        # A task published with a countdown only starts waiting once it is due
+        eta = getattr(request, 'eta', None)
+        if eta:
+            published_at = max(published_at, datetime.fromisoformat(eta).timestamp())
+        TASK_QUEUE_WAIT.observe(max(time.time() - published_at, 0), _task_name(task))
+    request.metrics_started_at = time.perf_counter()
+
+
+def task_finished_handler(task=None, state=None, **kwargs):
+    # The run time includes the completion callbacks, which are also timed on their own
+    started_at = getattr(task.request, 'metrics_started_at', None)
+    if started_at is not None:
+        TASK_RUN_DURATION.observe(time.perf_counter() - started_at, _task_name(task), state or 'UNKNOWN')
+
+
+def flush_metrics_handler(**kwargs):
+    # Prefork children exit without running the atexit handlers, flush what they recorded before
+    try:
+        metrics.flush()
+    except Exception:
+        logger.warning("Failed to flush the metrics on shutdown", exc_info=True)
+
+
+def connect_task_metrics():
+    before_task_publish.connect(stamp_published_at, weak=False)
+    task_prerun.connect(task_started_handler, weak=False)
+    task_postrun.connect(task_finished_handler, weak=False)
+    worker_process_shutdown.connect(flush_metrics_handler, weak=False)
+
+
+def connect_worker_logging(config: Mapping[str, Any]) -> None:
+    # Celery sets up the log handlers of the worker, their writes are then moved to a background thread
+    # with the truncation and sampling of the web processes. Prefork children write their queued records on exit
+    def queue_logging_handler(logger=None, **kwargs):
+        install_queue_logging(logger, config)
+
+    after_setup_logger.connect(queue_logging_handler, weak=False)
+    after_setup_task_logger.connect(queue_logging_handler, weak=False)
+    worker_process_shutdown.connect(lambda **kwargs: stop_queue_logging(), weak=False)
@@ -0,0 +1,57 @@
+from typing import Any, Dict, Mapping, Optional
+from datetime import timedelta
+import logging
+import threading
+
+from celery import shared_task
+
+from app.core.database_manager import DatabaseManager
+from app.models.task import Task
+from app.models.task_partitions import create_partitions, retire_partitions
+
+logger = logging.getLogger(__name__)
+
+_db_manager: Optional[DatabaseManager] = None
+_db_manager_lock = threading.Lock()
+
+
+def _get_db_manager(config: Mapping[str, Any]) -> DatabaseManager:
+    # Return the database manager of this worker, created on first use from the Celery app config
+    global _db_manager
+    if _db_manager is None:
+        with _db_manager_lock:
+            if _db_manager is None:
+                _db_manager = DatabaseManager(config)
+    return _db_manager
+
+
+@shared_task(bind=True, name='app.tasks.maintenance.maintain_tasks_table', ignore_result=True)
+def maintain_tasks_table(self) -> Dict[str, Any]:
+    # Periodic upkeep of the tasks table: create the upcoming partitions, retire the ones past the retention
+    # period (TASK_RETENTION_DAYS, 0 keeps them forever) and delete the expired deduplication keys
+    config = self.app.conf
+    db_manager = _get_db_manager(config)
+
+    created = create_partitions(db_manager, config['TASK_PARTITION_DAYS'], config['TASK_PARTITIONS_AHEAD'])
+    retired = []
+    if config['TASK_RETENTION_DAYS']:
+        retired = retire_partitions(db_manager, config['TASK_RETENTION_DAYS'],
+                                    drop=config['TASK_RETENTION_ACTION'] == 'drop',
+                                    archive_dir=config['TASK_ARCHIVE_DIR'] or None)
+    expired_keys = Task.delete_expired_dedup_keys(db_manager)
+
+    logger.info("Tasks table maintenance: created %s, retired %s, deleted %s expired deduplication keys",
+                created, retired, expired_keys)
+    return {'created': created, 'retired': retired, 'expired_dedup_keys': expired_keys}
+
+
+def beat_schedule(config: Mapping[str, Any]) -> Dict[str, Any]:
+    # Celery beat settings running the maintenance, in the old uppercase format like the rest of the config
+    return {
+        'CELERYBEAT_SCHEDULE': {
+            'maintain-tasks-table': {
+                'task': maintain_tasks_table.name,
+                'schedule': timedelta(seconds=config['TASK_MAINTENANCE_INTERVAL']),
+            },
+        },
+    }
@@ -0,0 +1,47 @@
+from typing import Any, Iterator, Tuple
+
+from app.core.blob_store import BlobStore, blob_id_of, get_blob_store
+from .concurrency import ConcurrencyLimitedTask
+
+
+class Blob:
+    # Lazy handle on a text parameter stored in the blob store, passed to the tasks that stream their input
+    def __init__(self, store: BlobStore, blob_id: str) -> None:
+        self.store: BlobStore = store
+        self.blob_id: str = blob_id
+
+    def iter_text(self) -> Iterator[str]:
+        return self.store.iter_text(self.blob_id)
+
+    def read(self) -> str:
+        return self.store.get_text(self.blob_id)
+
+
+class OffloadingTask(ConcurrencyLimitedTask):
+    # Base class of the registered tasks, resolves the parameters passed by reference to the blob store and
+    # offloads large text results to it, so Celery, the callbacks and the tasks table only see a reference
+    # Parameters at the stream_args positions are passed as a Blob handle instead of being loaded whole
+    # The values of the config_args keys are appended to the arguments from the worker's config
+    stream_args: Tuple[int, ...] = ()
+    config_args: Tuple[str, ...] = ()
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        if any(blob_id_of(arg) for arg in args):
+            store = get_blob_store(self.app.conf)
+            args = tuple(self._resolve(store, index, arg) for index, arg in enumerate(args))
+        if self.config_args:
+            args += tuple(self.app.conf[key] for key in self.config_args)
+
+        result = super().__call__(*args, **kwargs)
+
+        threshold = self.app.conf.get('BLOB_THRESHOLD', 0)
+        if isinstance(result, str) and len(result) * 4 >= threshold > 0 and not self.request.called_directly:
+            result = get_blob_store(self.app.conf).offload_text(result, threshold)
+        return result
+
+    def _resolve(self, store: BlobStore, index: int, arg: Any) -> Any:
+        blob_id = blob_id_of(arg)
+        if blob_id is None:
+            return arg
+        blob = Blob(store, blob_id)
+        return blob if index in self.stream_args else blob.read()
@@ -0,0 +1,107 @@
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+from celery import shared_task
+
+from .validation import compile_validator
+from .offload import OffloadingTask
+
+DEFAULT_RESULT_TTL = 3600  # Seconds a task result is kept in the cache
+
+
+class TaskSpec:
+    # Everything needed to dispatch a task by its public name, resolved once at registration time
+    def __init__(self,
+                 name: str,
+                 celery_name: str,
+                 params: Dict[str, type],
+                 queue: Optional[str] = None,
+                 priority: Optional[int] = None,
+                 result_ttl: int = DEFAULT_RESULT_TTL,
+                 deterministic: bool = False) -> None:
+        self.name: str = name
+        self.celery_name: str = celery_name
+        self.params: Dict[str, type] = dict(params)
+        self.param_names: Tuple[str, ...] = tuple(params)
+        self.queue: Optional[str] = queue
+        self.priority: Optional[int] = priority
+        self.result_ttl: int = result_ttl
+        # Deterministic tasks return the same output for the same parameters, so identical submissions can be deduplicated
+        self.deterministic: bool = deterministic
+        self.validate: Callable[[Any], None] = compile_validator(self.params)
+        # Publish options passed to send_task, only the ones that are set so Celery's defaults apply otherwise
+        self.options: Dict[str, Any] = {key: value for key, value in (('queue', queue), ('priority', priority))
+                                        if value is not None}
+
+    def compile_validator(self, limits: Optional[Mapping[str, int]] = None) -> None:
+        # Recompile the parameter validator with the size limits from the config
+        self.validate = compile_validator(self.params, limits)
+
+    def build_args(self, task_parameters: Mapping[str, Any]) -> List[Any]:
+        # Build the positional arguments of the Celery task, raises KeyError for a missing parameter
+        # The config_args of the task are appended by the worker, so they are never part of the message
+        return [task_parameters[name] for name in self.param_names]
+
+
+class TaskRegistry:
+    def __init__(self) -> None:
+        self._by_name: Dict[str, TaskSpec] = {}
+        self._by_celery_name: Dict[str, TaskSpec] = {}
+
+    def register(self, spec: TaskSpec) -> None:
+        if spec.name in self._by_name:
+            raise ValueError(f"Task already registered: {spec.name}")
+        self._by_name[spec.name] = spec
+        self._by_celery_name[spec.celery_name] = spec
+
+    def get(self, name: str) -> Optional[TaskSpec]:
+        return self._by_name.get(name)
+
+    def get_by_celery_name(self, celery_name: str) -> Optional[TaskSpec]:
+        return self._by_celery_name.get(celery_name)
+
+    def names(self) -> List[str]:
+        return list(self._by_name)
+
+    def compile_validators(self, limits: Mapping[str, Mapping[str, int]]) -> None:
+        # Compile the validators of all tasks once at startup, limits maps task names to parameter size limits
+        unknown_tasks = set(limits) - set(self._by_name)
+        if unknown_tasks:
+            raise ValueError(f"Limits set for unknown tasks: {', '.join(sorted(unknown_tasks))}")
+        for name, spec in self._by_name.items():
+            spec.compile_validator(limits.get(name))
+
+
+# The registry is filled when app.tasks.task_functions is imported
+registry = TaskRegistry()
+
+
+def register_task(params: Dict[str, type],
+                  name: Optional[str] = None,
+                  config_args: Tuple[str, ...] = (),
+                  queue: Optional[str] = None,
+                  priority: Optional[int] = None,
+                  result_ttl: int = DEFAULT_RESULT_TTL,
+                  deterministic: bool = False,
+                  stream_params: Tuple[str, ...] = (),
+                  **celery_options: Any) -> Callable:
+    # Declare a Celery shared task and register it under its public name (the function name by default)
+    # params maps each API parameter to its type, in the order the task function takes them,
+    # config_args are config keys whose values the worker appends to the arguments from its own config (e.g. API keys),
+    # so secrets are never written to the broker or the task outbox,
+    # stream_params are text parameters passed as a Blob handle when they were offloaded to the blob store
+    def decorator(fun: Callable) -> Any:
+        task_name = name or fun.__name__
+        stream_args = tuple(index for index, param in enumerate(params) if param in stream_params)
+        celery_task = shared_task(**{'base': OffloadingTask, **celery_options},
+                                  public_name=task_name, stream_args=stream_args,
+                                  config_args=tuple(config_args))(fun)
+        registry.register(TaskSpec(
+            task_name,
+            celery_options.get('name') or f'{fun.__module__}.{fun.__name__}',
+            params,
+            queue=queue,
+            priority=priority,
+            result_ttl=result_ttl,
+            deterministic=deterministic
+        ))
+        return celery_task
+    return decorator
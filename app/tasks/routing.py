@@ -0,0 +1,58 @@
+from typing import Any, Dict, List, Mapping, Optional
+from kombu import Queue
+
+from .registry import registry
+
+# Priority levels of the Redis broker, which emulates priorities with one list per level (0 is the highest)
+PRIORITY_STEPS = list(range(10))
+
+
+def _celery_name(task_name: str) -> str:
+    spec = registry.get(task_name)
+    if spec is None:
+        raise ValueError(f"Routing set for unknown task: {task_name}")
+    return spec.celery_name
+
+
+def celery_settings(config: Mapping[str, Any]) -> Dict[str, Any]:
+    # Celery settings for the queues, priorities and rate limits of the tasks, applied by both the producers
+    # and the workers. They use Celery's old uppercase names like the rest of the config, as Celery refuses
+    # to mix both formats. Routes are resolved by Celery itself, so send_task calls don't have to pass them
+    routes: Dict[str, Dict[str, Any]] = {}
+    for task_name, route in config['TASK_ROUTES'].items():
+        routes.setdefault(_celery_name(task_name), {}).update(route)
+    for task_name, priority in config['TASK_PRIORITIES'].items():
+        routes.setdefault(_celery_name(task_name), {})['priority'] = priority
+
+    annotations = {_celery_name(task_name): {'rate_limit': rate_limit}
+                   for task_name, rate_limit in config['TASK_RATE_LIMITS'].items() if rate_limit}
+
+    return {
+        'CELERY_DEFAULT_QUEUE': config['TASK_DEFAULT_QUEUE'],
+        'CELERY_ROUTES': routes,
+        'CELERY_ANNOTATIONS': annotations,
+        'BROKER_TRANSPORT_OPTIONS': {
+            'priority_steps': PRIORITY_STEPS,
+            'sep': ':',
+            'queue_order_strategy': 'priority',
+        },
+    }
+
+
+def worker_settings(config: Mapping[str, Any], queues: Optional[List[str]] = None) -> Dict[str, Any]:
+    # Celery settings of a worker consuming the given queues, or all queues if None
+    # A worker serving several queues takes the smallest prefetch and the largest concurrency among them
+    if not queues:
+        queues = list(dict.fromkeys([config['TASK_DEFAULT_QUEUE'], *config['TASK_QUEUES']]))
+    queue_options = [config['TASK_QUEUES'].get(queue, {}) for queue in queues]
+
+    settings: Dict[str, Any] = {
+        'CELERY_QUEUES': [Queue(queue, max_priority=PRIORITY_STEPS[-1]) for queue in queues],
+    }
+    prefetch = [options['prefetch_multiplier'] for options in queue_options if 'prefetch_multiplier' in options]
+    if prefetch:
+        settings['CELERYD_PREFETCH_MULTIPLIER'] = min(prefetch)
+    concurrency = [options['concurrency'] for options in queue_options if options.get('concurrency')]
+    if concurrency:
+        settings['CELERYD_CONCURRENCY'] = max(concurrency)
+    return settings
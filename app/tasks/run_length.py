@@ -0,0 +1,122 @@
+from concurrent.futures import Executor
+from functools import reduce
+from typing import Any, Iterable, Iterator, NamedTuple, Optional
+
+_NOT_LOADED = object()
+_numpy: Any = _NOT_LOADED
+
+
+def _load_numpy() -> Any:
+    # The numpy module, or None if it isn't installed (it is optional, see requirements-worker.txt)
+    # It is imported on first use rather than with this module, which every web and worker process imports
+    # through the task registry, as it would add tens of milliseconds to their start time
+    global _numpy
+    if _numpy is _NOT_LOADED:
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+# Characters scanned at once, bounds the temporary arrays of the NumPy engine (about 13 bytes per character)
+CHUNK_SIZE = 1 << 20
+
+
+class Runs(NamedTuple):
+    # Run-length summary of a piece of text: its length, its longest run and its first and last runs,
+    # which is all that is needed to merge it with the pieces next to it
+    length: int
+    longest: int
+    first_char: str
+    first_run: int
+    last_char: str
+    last_run: int
+
+
+EMPTY = Runs(0, 0, '', 0, '', 0)
+
+
+def _summarize_python(text: str) -> Runs:
+    max_len = 0
+    current_len = 0
+    previous_char = ''
+    first_run = 0
+
+    for char in text:
+        if char == previous_char:
+            current_len += 1
+        else:
+            if not first_run and previous_char:
+                first_run = current_len
+            current_len = 1
+        if current_len > max_len:
+            max_len = current_len
+        previous_char = char
+
+    return Runs(len(text), max_len, text[0], first_run or current_len, text[-1], current_len)
+
+
+def _summarize_numpy(text: str) -> Runs:
+    # Compare every character with the next one over the code points, the run boundaries are where they differ
+    # ASCII text is compared as bytes, anything else as UTF-32 code points, lone surrogates included
+    numpy = _load_numpy()
+    if text.isascii():
+        codes = numpy.frombuffer(text.encode('ascii'), dtype=numpy.uint8)
+    else:
+        codes = numpy.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=numpy.uint32)
+    ends = numpy.flatnonzero(codes[1:] != codes[:-1])
+    length = len(text)
+    if not ends.size:
+        return Runs(length, length, text[0], length, text[-1], length)
+    longest = max(int(ends[0]) + 1, length - 1 - int(ends[-1]))
+    if ends.size > 1:
+        longest = max(longest, int(numpy.diff(ends).max()))
+    return Runs(length, longest, text[0], int(ends[0]) + 1, text[-1], length - 1 - int(ends[-1]))
+
+
+def summarize(text: str) -> Runs:
+    # Summarize a piece of text with NumPy when available, and the plain loop otherwise
+    if not text:
+        return EMPTY
+    if _load_numpy() is not None:
+        return _summarize_numpy(text)
+    return _summarize_python(text)
+
+
+def merge(left: Runs, right: Runs) -> Runs:
+    # Summary of two adjacent pieces of text, a run spanning the boundary is joined
+    # The merge is associative, so pieces can be summarized in any order or in parallel and merged in order
+    if not left.length:
+        return right
+    if not right.length:
+        return left
+    longest = max(left.longest, right.longest)
+    first_run = left.first_run
+    last_run = right.last_run
+    if left.last_char == right.first_char:
+        joined = left.last_run + right.first_run
+        longest = max(longest, joined)
+        if left.first_run == left.length:
+            first_run = joined
+        if right.last_run == right.length:
+            last_run = joined
+    return Runs(left.length + right.length, longest, left.first_char, first_run, right.last_char, last_run)
+
+
+def longest_run_of_chunks(chunks: Iterable[str], executor: Optional[Executor] = None) -> int:
+    # Length of the longest run of identical characters in the text made of the chunks, in order
+    # The chunks are summarized one at a time, or in parallel on the executor
+    summaries = executor.map(summarize, chunks) if executor is not None else map(summarize, chunks)
+    return reduce(merge, summaries, EMPTY).longest
+
+
+def iter_chunks(text: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
+
+
+def longest_run(text: str, chunk_size: int = CHUNK_SIZE) -> int:
+    # Length of the longest run of identical characters in the text
+    return longest_run_of_chunks(iter_chunks(text, chunk_size))
+
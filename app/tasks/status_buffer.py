@@ -0,0 +1,84 @@
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import os
+import threading
+
+from app.models.task import Task
+from app.core.database_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+
+class StatusUpdateBuffer:
+    # Write-behind buffer for task status updates, flushed to the database as a single UPDATE statement
+    # every flush_interval seconds or as soon as max_items updates are pending, whichever comes first.
+    # These two values bound how many updates a hard crash of the worker can lose.
+    def __init__(self, db_manager: DatabaseManager, flush_interval: float, max_items: int) -> None:
+        self.db_manager: DatabaseManager = db_manager
+        self.flush_interval: float = flush_interval
+        self.max_items: int = max_items
+        self._init_state()
+
+    def _init_state(self) -> None:
+        self._pid: int = os.getpid()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._pending: Dict[str, Tuple[str, Optional[Any]]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, task_uuid: str, status: str, output: Optional[Any]) -> None:
+        # Queue a status update, a later update for the same task replaces the pending one
+        if self._pid != os.getpid():
+            # The flusher thread doesn't survive fork(), each prefork child starts its own
+            self._init_state()
+        with self._lock:
+            self._pending[task_uuid] = (status, output)
+            pending = len(self._pending)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='status-update-flusher', daemon=True)
+                self._thread.start()
+        if pending >= self.max_items:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        # Write all pending updates to the database, failed updates are kept for the next flush
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            updates: List[Tuple[str, str, Optional[Any]]] = [
+                (task_uuid, status, output) for task_uuid, (status, output) in pending.items()
+            ]
+            try:
+                Task.update_status_many(self.db_manager, updates)
+            except Exception:
+                logger.exception("Failed to flush %d task status updates, will retry", len(updates))
+                with self._lock:
+                    # Updates queued meanwhile are newer and take precedence over the failed ones
+                    pending.update(self._pending)
+                    self._pending = pending
+                raise
+            return len(updates)
+
+    def close(self) -> None:
+        # Stop the flusher thread and write the remaining updates, called on worker shutdown
+        if self._pid != os.getpid():
+            return
+        self._closed.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Already logged, the updates stay pending until the database is reachable again
+                pass
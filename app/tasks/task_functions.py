@@ -1,51 +1,40 @@
-from celery import shared_task
-import requests
+from typing import Union
 import logging
 
 from . import callbacks
+from .registry import register_task
+from .chatgpt_client import get_chatgpt_client
+from .run_length import longest_run, longest_run_of_chunks
+from .offload import Blob
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task()
+@register_task(params={'a': int, 'b': int}, deterministic=True)
 def sum_two_numbers(a: int, b: int) -> int:
     # This is a simple task that returns the sum of two numbers
-    logger.info(f"Summing numbers: {a} + {b}")
+    logger.info("Summing numbers: %s + %s", a, b)
     return a + b
 
 
-@shared_task()
-def query_chatgpt(prompt: str, api_key: str) -> str:
+@register_task(params={'prompt': str}, config_args=('OPENAI_API_KEY', ), bind=True)
+def query_chatgpt(self, prompt: str, api_key: str) -> str:
     # This task queries the ChatGPT API with a given prompt and returns the response
-    logger.info(f"Querying ChatGPT with prompt: {prompt}")
+    import requests  # Imported on first use to keep it out of the worker start time
+    logger.info("Querying ChatGPT with prompt: %s", prompt)
     try:
-        response = requests.post(
-            'https://api.openai.com/v1/chat/completions', 
-            json={'model': 'gpt-3.5-turbo', 'messages': [{'role': 'user', 'content': prompt}]},
-            headers={'Authorization': f"Bearer {api_key}"}
-        )
-        response.raise_for_status()
-        return response.json()['choices'][0]['message']['content']
+        return get_chatgpt_client(self.app.conf).complete(prompt, api_key)
     except requests.RequestException as e:
-        logger.error(f"Error querying ChatGPT: {str(e)}")
+        logger.error("Error querying ChatGPT: %s", e)
         raise
 
 
-@shared_task()
-def find_longest_consecutive_letters(string: str) -> int:
+@register_task(params={'string': str}, deterministic=True, stream_params=('string', ))
+def find_longest_consecutive_letters(string: Union[str, Blob]) -> int:
     # This task return the length of the longest consecutive letters in a string
-    logger.info(f"Finding longest consecutive letters in string: {string}")
-    max_len = 0
-    current_len = 0
-    previous_char = ''
-
-    for char in string:
-        if char == previous_char:
-            current_len += 1
-        else:
-            current_len = 1
-        if current_len > max_len:
-            max_len = current_len
-        previous_char = char
-
-    return max_len
+    # Strings offloaded to the blob store are streamed in chunks instead of being loaded whole
+    if isinstance(string, Blob):
+        logger.info("Finding longest consecutive letters in blob: %s", string.blob_id)
+        return longest_run_of_chunks(string.iter_text())
+    logger.info("Finding longest consecutive letters in string of length: %d", len(string))
+    return longest_run(string)
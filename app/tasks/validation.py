@@ -0,0 +1,61 @@
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+# Accepted runtime types for each declared parameter type, matched with type() so bool never passes as int
+_ACCEPTED_TYPES: Dict[type, Tuple[type, ...]] = {
+    int: (int, ),
+    float: (int, float),
+    str: (str, ),
+    bool: (bool, ),
+    list: (list, ),
+    dict: (dict, ),
+}
+
+_TYPE_NAMES: Dict[type, str] = {
+    int: 'an integer',
+    float: 'a number',
+    str: 'a string',
+    bool: 'a boolean',
+    list: 'a list',
+    dict: 'an object',
+}
+
+
+class ValidationError(ValueError):
+    pass
+
+
+def compile_validator(params: Mapping[str, type],
+                      limits: Optional[Mapping[str, int]] = None) -> Callable[[Any], None]:
+    # Build a validator for task parameters, all lookups are resolved here so a call only does
+    # a few type() checks and len() calls. limits maps parameter names to their maximum length.
+    limits = limits or {}
+    unknown_limits = set(limits) - set(params)
+    if unknown_limits:
+        raise ValueError(f"Limits set for unknown parameters: {', '.join(sorted(unknown_limits))}")
+
+    checks = tuple(
+        (name, frozenset(_ACCEPTED_TYPES.get(param_type, (param_type, ))),
+         f"Parameter '{name}' must be {_TYPE_NAMES.get(param_type, param_type.__name__)}",
+         limits.get(name))
+        for name, param_type in params.items()
+    )
+    names = frozenset(params)
+    expected_count = len(names)
+
+    def validate(task_parameters: Any) -> None:
+        if type(task_parameters) is not dict:
+            raise ValidationError("Task parameters must be an object")
+        for name, accepted_types, type_error, max_length in checks:
+            try:
+                value = task_parameters[name]
+            except KeyError:
+                raise ValidationError(f"Missing parameter: {name}") from None
+            if type(value) not in accepted_types:
+                raise ValidationError(type_error)
+            if max_length is not None and len(value) > max_length:
+                raise ValidationError(f"Parameter '{name}' exceeds the maximum length of {max_length}")
+        if len(task_parameters) != expected_count:
+            unexpected = ', '.join(sorted(str(name) for name in task_parameters if name not in names))
+            raise ValidationError(f"Unexpected parameters: {unexpected}")
+
+    return validate
@@ -0,0 +1,61 @@
+# Database round trips per completed task in the success callback, before and after Task.mark_finished
+# Runs against a counting stand-in for the database connection, no PostgreSQL needed
+# Run from the project root: python -m benchmarks.bench_callbacks
+from collections import Counter
+from unittest.mock import MagicMock
+
+from config.testing import TestingConfig
+from app.core.database_manager import DatabaseManager
+from app.models.task import Task
+
+TASK_ROW = {'uuid': 'test-uuid', 'name': 'sum_two_numbers', 'parameters': {'a': 1, 'b': 2},
+            'status': 'PENDING', 'output': None}
+
+
+def make_db_manager(counts: Counter) -> DatabaseManager:
+    def connect():
+        counts['connections'] += 1
+        connection = MagicMock()
+        connection.closed = 0
+        cursor = connection.cursor.return_value.__enter__.return_value
+
+        def execute(query, params=None):
+            counts['statements'] += 1
+            cursor.description = [('uuid', )] if 'SELECT' in query or 'RETURNING' in query else None
+
+        cursor.execute.side_effect = execute
+        cursor.fetchall.return_value = [TASK_ROW]
+        connection.commit.side_effect = lambda: counts.update(['commits'])
+        return connection
+
+    config = {key: getattr(TestingConfig, key) for key in dir(TestingConfig) if key.isupper()}
+    db_manager = DatabaseManager(config)
+    # Open a connection per checkout, as before pooling, so connections count round trips to connect
+    db_manager.pool.acquire = connect
+    db_manager.pool.release = lambda connection, discard=False: None
+    return db_manager
+
+
+def get_then_update(db_manager: DatabaseManager) -> None:
+    task = Task.get(db_manager, 'test-uuid')
+    if task:
+        task.update_status(db_manager, 'COMPLETED', 3)
+
+
+def mark_finished(db_manager: DatabaseManager) -> None:
+    Task.mark_finished(db_manager, 'test-uuid', 'COMPLETED', 3)
+
+
+def main(completions: int = 1000) -> None:
+    print(f"{'path':<20}{'connections':>14}{'statements':>14}{'commits':>10}   (per completion)")
+    for name, path in (('get + update', get_then_update), ('mark_finished', mark_finished)):
+        counts: Counter = Counter()
+        db_manager = make_db_manager(counts)
+        for _ in range(completions):
+            path(db_manager)
+        print(f"{name:<20}{counts['connections'] / completions:>14.1f}"
+              f"{counts['statements'] / completions:>14.1f}{counts['commits'] / completions:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
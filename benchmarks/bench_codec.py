@@ -0,0 +1,62 @@
+# Encode/decode time and stored size of a cached task result for each codec
+# Pass a Redis URL to also measure the memory Redis uses per cached result (MEMORY USAGE)
+# Run from the project root: python -m benchmarks.bench_codec [redis://localhost:6379/0]
+import json
+import sys
+import timeit
+
+from app.core import codec as codec_module
+from app.core.cache_manager import build_result_meta
+from app.core.codec import Codec
+
+PAYLOADS = {
+    'sum_two_numbers': 3,
+    'longest_letters': 42,
+    'chatgpt_short': 'Why did the chicken cross the road? To get to the other side.',
+    'chatgpt_long': ' '.join(f'Paragraph {i}: the quick brown fox jumps over the lazy dog.' for i in range(400)),
+}
+
+
+class StdlibJsonCodec:
+    # The serialization used before the codec layer, for comparison
+    def encode(self, value):
+        return json.dumps(value).encode()
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+def codecs():
+    yield 'json (stdlib)', StdlibJsonCodec()
+    yield 'json' + (' (orjson)' if codec_module.orjson else ''), Codec('json')
+    yield 'json + zlib > 1KB', Codec('json', compress_threshold=1024)
+    if codec_module.msgpack is not None:
+        yield 'msgpack', Codec('msgpack')
+        yield 'msgpack + zlib > 1KB', Codec('msgpack', compress_threshold=1024)
+
+
+def main(redis_url: str = None, number: int = 2000) -> None:
+    redis = None
+    if redis_url:
+        from redis import Redis
+        redis = Redis.from_url(redis_url)
+
+    header = f"{'payload':<18}{'codec':<24}{'encode us':>11}{'decode us':>11}{'bytes':>9}"
+    print(header + (f"{'redis bytes':>13}" if redis else ''))
+    for payload_name, result in PAYLOADS.items():
+        meta = build_result_meta('0b6b1f1e-8f5e-4a53-9b5e-3d1f0c6f2a11', 'SUCCESS', result)
+        for codec_name, codec in codecs():
+            encoded = codec.encode(meta)
+            encode_time = min(timeit.repeat(lambda: codec.encode(meta), number=number, repeat=5)) / number
+            decode_time = min(timeit.repeat(lambda: codec.decode(encoded), number=number, repeat=5)) / number
+            line = f"{payload_name:<18}{codec_name:<24}{encode_time * 1e6:>11.2f}{decode_time * 1e6:>11.2f}{len(encoded):>9}"
+            if redis:
+                key = 'bench-codec-result'
+                redis.set(key, encoded)
+                line += f"{redis.memory_usage(key):>13}"
+                redis.delete(key)
+            print(line)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,73 @@
+# Per-call cost of the logging done on the request and task hot paths, as seen by the calling thread:
+# the synchronous FileHandler of logging.basicConfig with f-string messages (before), against the queue handler
+# with lazy %-style messages, argument truncation and sampling of app.log_setup (after)
+# Run from the project root: python -m benchmarks.bench_logging [number of calls]
+from typing import Any, Callable, Dict
+import logging
+import os
+import sys
+import tempfile
+import timeit
+
+from app.core.log_setup import LOG_FORMAT, install_queue_logging, stop_queue_logging
+from app.core.metrics import LOG_RECORDS_DROPPED
+from config.base import BaseConfig
+
+TASK_UUID = '7d4b3c1e-2f6a-4e8b-9c0d-1a2b3c4d5e6f'
+PROMPT_16K = 'Tell me a joke. ' * 1000
+PROMPT_1M = 'Tell me a joke. ' * 65536
+# Sampling is off by default (LOG_SAMPLE_RATE = 1), measured at the rate a deployment opting into it could use
+SAMPLE_RATE = 0.1
+
+# The log calls of the hot paths, as they were (f-strings) and as they are (%-style), with how many times to make them
+CASES: Dict[str, Any] = {
+    'get_task_output': (lambda logger: logger.info(f"Fetching output for task: {TASK_UUID}"),
+                        lambda logger: logger.info("Fetching output for task: %s", TASK_UUID), 1),
+    'query_chatgpt 16 KB prompt': (lambda logger: logger.info(f"Querying ChatGPT with prompt: {PROMPT_16K}"),
+                                   lambda logger: logger.info("Querying ChatGPT with prompt: %s", PROMPT_16K), 10),
+    'query_chatgpt 1 MB prompt': (lambda logger: logger.info(f"Querying ChatGPT with prompt: {PROMPT_1M}"),
+                                  lambda logger: logger.info("Querying ChatGPT with prompt: %s", PROMPT_1M), 1000),
+}
+
+
+def make_logger(name: str, path: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = logging.FileHandler(path, mode='a')
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger.addHandler(handler)
+    return logger
+
+
+def measure(log: Callable[[logging.Logger], None], logger: logging.Logger, number: int) -> float:
+    # Microseconds per call in the calling thread, the queued records are written before returning
+    seconds = timeit.timeit(lambda: log(logger), number=number)
+    stop_queue_logging()
+    for handler in logger.handlers:
+        handler.close()
+    return seconds / number * 1e6
+
+
+def main(number: int = 20_000) -> None:
+    config = {'LOG_QUEUE_SIZE': number, 'LOG_MAX_ARG_LENGTH': BaseConfig.LOG_MAX_ARG_LENGTH,
+              'LOG_MAX_MESSAGE_LENGTH': BaseConfig.LOG_MAX_MESSAGE_LENGTH}
+    print(f"{'log call':<30}{'before us':>12}{'queue us':>12}{'sampled us':>12}{'MB/call':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for index, (name, (before, after, divisor)) in enumerate(CASES.items()):
+            calls = max(number // divisor, 10)
+            path = os.path.join(directory, f'{index}.log')
+
+            timings = [measure(before, make_logger(f'before{index}', path + '.before'), calls)]
+            for setup, rate in (('queue', 1.0), ('sampled', SAMPLE_RATE)):
+                logger = make_logger(f'{setup}{index}', f'{path}.{setup}')
+                install_queue_logging(logger, dict(config, LOG_SAMPLE_RATES={logger.name: rate}))
+                timings.append(measure(after, logger, calls))
+
+            written = os.path.getsize(path + '.before') / calls / 1e6
+            print(f"{name:<30}" + ''.join(f"{timing:>12.2f}" for timing in timings) + f"{written:>12.3f}")
+    print(f"records dropped: {int(LOG_RECORDS_DROPPED.snapshot().get((), [0])[0])}")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
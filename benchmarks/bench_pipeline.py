@@ -0,0 +1,371 @@
+# Load test of the submit/poll pipeline: virtual users submit tasks to /run-task and poll /get-task-output
+# until they finish, reporting throughput, p50/p99 latency per endpoint, end-to-end completion latency and
+# the database and Redis calls per task (read from /metrics, so they include the workers' calls)
+# Runs against a deployment with real Celery workers (--url), or in process against the PostgreSQL and Redis
+# of the config (--config), where the tasks run in threads standing in for the workers unless --no-eager is given
+# Results are saved as JSON with the commit they were measured on, compare two runs with --compare
+# To compare the Flask and ASGI stacks, run the same load against each server with a --label
+# Run from the project root:
+#   python -m benchmarks.bench_pipeline --url http://localhost:5000 --users 32 --tasks 2000
+#   python -m benchmarks.bench_pipeline --url http://localhost:8000 --users 2000 --label asgi
+#   python -m benchmarks.bench_pipeline --config development --mix sum_two_numbers=8,find_longest_consecutive_letters=2
+#   python -m benchmarks.bench_pipeline --compare benchmarks/results/old.json benchmarks/results/new.json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from unittest import mock
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import string
+import subprocess
+import threading
+import time
+import uuid
+
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED')
+ENDPOINTS = ('run-task', 'get-task-output')
+
+# Parameters of each task of the mix, drawn at random
+TASK_PARAMETERS: Dict[str, Callable[[random.Random], Dict[str, Any]]] = {
+    'sum_two_numbers': lambda rng: {'a': rng.randint(0, 1000), 'b': rng.randint(0, 1000)},
+    'find_longest_consecutive_letters': lambda rng: {
+        'string': ''.join(rng.choice(string.ascii_lowercase[:4]) * rng.randint(1, 8) for _ in range(200))
+    },
+    'query_chatgpt': lambda rng: {'prompt': f'Reply with the number {rng.randint(0, 1000)}'},
+}
+
+# Call counts of the database and Redis histograms of /metrics
+_CALL_COUNTS = {
+    'db': re.compile(r'^tasker_db_query_duration_seconds_count(?:\{.*\})? (\S+)$', re.M),
+    'redis': re.compile(r'^tasker_redis_command_duration_seconds_count(?:\{.*\})? (\S+)$', re.M),
+}
+
+
+class HttpClient:
+    # Client of a deployment, one keep-alive session per thread
+    def __init__(self, url: str) -> None:
+        import requests
+        self.url: str = url.rstrip('/')
+        self._requests = requests
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Tuple[int, bytes]:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        response = session.request(method, self.url + path, json=body, timeout=60)
+        return response.status_code, response.content
+
+
+class InProcessClient:
+    # Client of an app created in this process, one test client per thread
+    def __init__(self, app) -> None:
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Tuple[int, bytes]:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        return response.status_code, response.data
+
+
+@contextmanager
+def eager_workers(concurrency: int):
+    # Run the published tasks in a thread pool of this process instead of sending them to the broker
+    # A task starts once the request that published it has returned, as it would be picked up by a worker,
+    # and goes through the Celery tracer so the completion callbacks run as on a worker
+    from celery import Celery
+    from celery.result import AsyncResult
+    from flask import after_this_request, has_request_context
+
+    executor = ThreadPoolExecutor(concurrency, thread_name_prefix='eager-worker')
+
+    def send_task(self, name, args=None, kwargs=None, task_id=None, producer=None, **options):
+        task_id = task_id or str(uuid.uuid4())
+        task = self.tasks[name]
+
+        def run() -> None:
+            task.apply(args=args, kwargs=kwargs, task_id=task_id)
+
+        if has_request_context():
+            @after_this_request
+            def start(response):
+                executor.submit(run)
+                return response
+        else:
+            executor.submit(run)
+        return AsyncResult(task_id, app=self)
+
+    with mock.patch.object(Celery, 'send_task', send_task):
+        try:
+            yield
+        finally:
+            executor.shutdown(wait=True)
+
+
+def parse_mix(mix: str) -> List[Tuple[str, int]]:
+    # sum_two_numbers=8,find_longest_consecutive_letters=2 -> [(name, weight), ...]
+    entries = []
+    for entry in mix.split(','):
+        name, _, weight = entry.partition('=')
+        if name not in TASK_PARAMETERS:
+            raise SystemExit(f"Unknown task in the mix: {name}")
+        entries.append((name, int(weight or 1)))
+    return entries
+
+
+def call_counts(client) -> Optional[Dict[str, float]]:
+    # Total database and Redis calls reported by /metrics, or None if the endpoint isn't available
+    try:
+        status, body = client.request('GET', '/metrics')
+    except Exception:
+        return None
+    if status != 200:
+        return None
+    text = body.decode()
+    return {name: sum(float(value) for value in pattern.findall(text)) for name, pattern in _CALL_COUNTS.items()}
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    # Nearest-rank percentile of sorted values
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def summarize(latencies: List[float], duration: float) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'throughput': len(latencies) / duration if duration else None,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else None,
+        'p50_ms': _ms(percentile(latencies, 0.5)),
+        'p90_ms': _ms(percentile(latencies, 0.9)),
+        'p99_ms': _ms(percentile(latencies, 0.99)),
+        'max_ms': _ms(latencies[-1] if latencies else None),
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class VirtualUser:
+    # Submits a task, polls its output until it finishes or times out, and starts over until all tasks are sent
+    def __init__(self, client, tasks: Callable[[], Optional[Tuple[str, Dict[str, Any]]]],
+                 poll_interval: float, timeout: float) -> None:
+        self.client = client
+        self.tasks = tasks
+        self.poll_interval: float = poll_interval
+        self.timeout: float = timeout
+        self.latencies: Dict[str, List[float]] = {endpoint: [] for endpoint in ENDPOINTS}
+        self.end_to_end: List[float] = []
+        self.outcomes: Counter = Counter()
+
+    def _call(self, endpoint: str, method: str, path: str,
+              body: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        start = time.perf_counter()
+        try:
+            status, data = self.client.request(method, path, body)
+        except Exception:
+            self.outcomes[f'{endpoint} error'] += 1
+            return None
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if status != 200:
+            self.outcomes[f'{endpoint} {status}'] += 1
+            return None
+        return json.loads(data)
+
+    def run(self) -> None:
+        while True:
+            task = self.tasks()
+            if task is None:
+                return
+            task_name, task_parameters = task
+            submitted_at = time.perf_counter()
+            result = self._call('run-task', 'POST', '/run-task',
+                                {'task_name': task_name, 'task_parameters': task_parameters})
+            if result is None:
+                continue
+            path = f"/get-task-output?task_uuid={result['task_uuid']}"
+            while True:
+                output = self._call('get-task-output', 'GET', path)
+                status = output['task_output']['status'] if output else None
+                if status in TERMINAL_STATUSES:
+                    self.end_to_end.append(time.perf_counter() - submitted_at)
+                    self.outcomes[status] += 1
+                    break
+                if time.perf_counter() - submitted_at > self.timeout:
+                    self.outcomes['timed out'] += 1
+                    break
+                time.sleep(self.poll_interval)
+
+
+def run(client, mix: List[Tuple[str, int]], users: int, tasks: int, poll_interval: float, timeout: float,
+        seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    names, weights = zip(*mix)
+    # The whole sequence of tasks is drawn upfront so runs with the same seed send the same tasks
+    sequence = [(name, TASK_PARAMETERS[name](rng)) for name in rng.choices(names, weights, k=tasks)]
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def next_task() -> Optional[Tuple[str, Dict[str, Any]]]:
+        with lock:
+            index = next(counter)
+        return sequence[index] if index < len(sequence) else None
+
+    virtual_users = [VirtualUser(client, next_task, poll_interval, timeout) for _ in range(users)]
+    calls_before = call_counts(client)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(users) as executor:
+        for future in [executor.submit(user.run) for user in virtual_users]:
+            future.result()
+    duration = time.perf_counter() - start
+    calls_after = call_counts(client)
+
+    latencies = {endpoint: [latency for user in virtual_users for latency in user.latencies[endpoint]]
+                 for endpoint in ENDPOINTS}
+    outcomes = sum((user.outcomes for user in virtual_users), Counter())
+    requests = sum(len(values) for values in latencies.values())
+    round_trips = None
+    if calls_before is not None and calls_after is not None:
+        # Include the calls of the workers and of any other traffic of the deployment at the same time
+        round_trips = {}
+        for name in _CALL_COUNTS:
+            calls = calls_after[name] - calls_before[name]
+            round_trips[f'{name}_per_task'] = round(calls / tasks, 3)
+            round_trips[f'{name}_per_request'] = round(calls / requests, 3) if requests else None
+
+    return {
+        'duration_s': round(duration, 3),
+        'tasks_per_s': round(outcomes['COMPLETED'] / duration, 3) if duration else None,
+        'requests': {endpoint: summarize(values, duration) for endpoint, values in latencies.items()},
+        'end_to_end': summarize([value for user in virtual_users for value in user.end_to_end], duration),
+        'outcomes': dict(outcomes),
+        'round_trips': round_trips,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline_path: str, current_path: str) -> None:
+    # Print the change of the main figures between two result files
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    with open(current_path) as file:
+        current = json.load(file)
+    print(f"{_run_name(baseline)} -> {_run_name(current)}")
+    rows = [('tasks/s', ('results', 'tasks_per_s'))]
+    for section in ('run-task', 'get-task-output'):
+        for figure in ('p50_ms', 'p99_ms'):
+            rows.append((f'{section} {figure}', ('results', 'requests', section, figure)))
+    for figure in ('p50_ms', 'p99_ms'):
+        rows.append((f'end-to-end {figure}', ('results', 'end_to_end', figure)))
+    for figure in ('db_per_task', 'redis_per_task'):
+        rows.append((figure, ('results', 'round_trips', figure)))
+    for label, path in rows:
+        before, after = _lookup(baseline, path), _lookup(current, path)
+        change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else ''
+        print(f"{label:<26}{_format(before):>12}{_format(after):>12}{change:>10}")
+
+
+def _run_name(report: Dict[str, Any]) -> str:
+    name = (report['commit'] or '?')[:10]
+    return f"{name} ({report['label']})" if report.get('label') else name
+
+
+def _lookup(result: Dict[str, Any], path: Tuple[str, ...]) -> Optional[float]:
+    for key in path:
+        if not isinstance(result, dict):
+            return None
+        result = result.get(key)
+    return result
+
+
+def _format(value: Optional[float]) -> str:
+    return '-' if value is None else f'{value:.3f}'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of the submit/poll pipeline")
+    parser.add_argument('--url', help="Base URL of a deployment, the app runs in process if not given")
+    parser.add_argument('--config', default='development', help="Config of the in-process app")
+    parser.add_argument('--no-eager', action='store_true', help="Send the tasks of the in-process app to the broker")
+    parser.add_argument('--eager-workers', type=int, default=8, help="Threads running the tasks in eager mode")
+    parser.add_argument('--users', type=int, default=16, help="Concurrent virtual users")
+    parser.add_argument('--tasks', type=int, default=1000, help="Tasks submitted in total")
+    parser.add_argument('--mix', default='sum_two_numbers=8,find_longest_consecutive_letters=2',
+                        help="Task names with their weights")
+    parser.add_argument('--poll-interval', type=float, default=0.02, help="Seconds between output polls")
+    parser.add_argument('--timeout', type=float, default=60, help="Seconds before a task is counted as timed out")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label', help="Name of the setup measured (e.g. flask or asgi), kept in the result file")
+    parser.add_argument('--output', help="Result file, benchmarks/results/pipeline-<commit>-<time>.json by default")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help="Compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    mix = parse_mix(args.mix)
+    if args.url:
+        client, eager = HttpClient(args.url), False
+        results = run(client, mix, args.users, args.tasks, args.poll_interval, args.timeout, args.seed)
+    else:
+        from app import create_app
+        client, eager = InProcessClient(create_app(args.config)), not args.no_eager
+        if eager:
+            with eager_workers(args.eager_workers):
+                results = run(client, mix, args.users, args.tasks, args.poll_interval, args.timeout, args.seed)
+        else:
+            results = run(client, mix, args.users, args.tasks, args.poll_interval, args.timeout, args.seed)
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'label': args.label,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'target': args.url or f'in-process ({args.config})',
+        'eager': eager,
+        'users': args.users,
+        'tasks': args.tasks,
+        'mix': dict(mix),
+        'poll_interval': args.poll_interval,
+        'seed': args.seed,
+        'results': results,
+    }
+    output = args.output or os.path.join(
+        'benchmarks', 'results',
+        f"pipeline-{(commit or 'unknown')[:10]}{'-' + args.label if args.label else ''}-{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    print(f"{'endpoint':<18}{'count':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, stats in list(results['requests'].items()) + [('end-to-end', results['end_to_end'])]:
+        print(f"{name:<18}{stats['count']:>8}{_format(stats['throughput']):>10}"
+              f"{_format(stats['p50_ms']):>10}{_format(stats['p99_ms']):>10}")
+    print(f"tasks/s: {_format(results['tasks_per_s'])}, outcomes: {results['outcomes']}")
+    if results['round_trips']:
+        print(f"calls per task: {results['round_trips']}")
+    print(f"Saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
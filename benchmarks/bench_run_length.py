@@ -0,0 +1,58 @@
+# Time of find_longest_consecutive_letters engines against the original per-character loop
+# Run from the project root: python -m benchmarks.bench_run_length [size in characters]
+import random
+import sys
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+from app.tasks import run_length
+from app.tasks.run_length import longest_run, longest_run_of_chunks, iter_chunks, _summarize_python
+
+
+def original_loop(string: str) -> int:
+    # The implementation before the run-length engine, for comparison
+    max_len = 0
+    current_len = 0
+    previous_char = ''
+    for char in string:
+        if char == previous_char:
+            current_len += 1
+        else:
+            current_len = 1
+        if current_len > max_len:
+            max_len = current_len
+        previous_char = char
+    return max_len
+
+
+def inputs(size: int):
+    rng = random.Random(0)
+    yield 'random ascii', ''.join(rng.choice('abcdefghij') for _ in range(size))
+    yield 'long runs', ''.join(rng.choice('ACGT') * rng.randint(1, 50) for _ in range(size // 25))[:size]
+    yield 'single run', 'a' * size
+    yield 'random unicode', ''.join(rng.choice('αβγδ') for _ in range(size))
+
+
+def engines():
+    yield 'original loop', original_loop
+    yield 'python engine', lambda string: _summarize_python(string).longest if string else 0
+    if run_length._load_numpy() is not None:
+        yield 'numpy engine', longest_run
+        executor = ThreadPoolExecutor(4)
+        yield 'numpy, 4 threads', lambda string: longest_run_of_chunks(iter_chunks(string), executor)
+
+
+def main(size: int = 5_000_000) -> None:
+    print(f"{'input':<16}{'engine':<20}{'ms':>10}{'speedup':>9}")
+    for input_name, string in inputs(size):
+        expected = original_loop(string)
+        baseline = None
+        for engine_name, engine in engines():
+            assert engine(string) == expected, engine_name
+            elapsed = min(timeit.repeat(lambda: engine(string), number=1, repeat=3))
+            baseline = baseline or elapsed
+            print(f"{input_name:<16}{engine_name:<20}{elapsed * 1000:>10.1f}{baseline / elapsed:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000)
@@ -0,0 +1,50 @@
+# Start-up time of the web and worker entry points, measured in fresh interpreters
+# Reports the wall time of importing each entry point, and the slowest top-level imports from python -X importtime
+# Run from the project root: python -m benchmarks.bench_startup [runs]
+from typing import Dict, List, Tuple
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = {'web': 'run', 'worker': 'celery_worker'}
+HEAVY_MODULES = ('flask', 'requests', 'numpy')
+
+
+def import_time(module: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', f'import {module}'], check=True)
+    return time.perf_counter() - start
+
+
+def import_profile(module: str) -> Tuple[List[Tuple[int, str]], List[str]]:
+    # Cumulative microseconds of the imports directly under the entry point, and the heavy modules it loaded
+    check = f"import {module}, sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', check], check=True,
+                            capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented by two spaces per level below the entry point
+        if cumulative.strip().isdigit() and name.startswith('   ') and not name.startswith('     '):
+            imports.append((int(cumulative), name.strip()))
+    loaded = [name for name in result.stdout.strip().split(',') if name]
+    return sorted(imports, reverse=True), loaded
+
+
+def main(runs: int = 5) -> None:
+    results: Dict[str, float] = {}
+    for name, module in ENTRY_POINTS.items():
+        times = [import_time(module) for _ in range(runs)]
+        results[name] = statistics.median(times)
+        imports, loaded = import_profile(module)
+        print(f"{name} ({module}): median {results[name] * 1000:.0f} ms, min {min(times) * 1000:.0f} ms "
+              f"over {runs} runs, loads {', '.join(loaded) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+        for cumulative, imported in imports[:8]:
+            print(f"    {cumulative / 1000:>8.1f} ms  {imported}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,23 @@
+# Microbenchmark of the precompiled task parameter validators
+# Run from the project root: python -m benchmarks.bench_validation
+import timeit
+
+from app.tasks.validation import compile_validator
+
+CASES = {
+    'sum_two_numbers': ({'a': int, 'b': int}, None, {'a': 5, 'b': 10}),
+    'query_chatgpt': ({'prompt': str}, {'prompt': 16_000}, {'prompt': 'Tell me a joke.'}),
+    'find_longest_consecutive_letters': ({'string': str}, {'string': 1_000_000}, {'string': 'aaabbccccdd' * 1000}),
+}
+
+
+def main(number: int = 200_000) -> None:
+    print(f"{'task':<36}{'us/call':>10}")
+    for name, (params, limits, parameters) in CASES.items():
+        validate = compile_validator(params, limits)
+        seconds = min(timeit.repeat(lambda: validate(parameters), number=number, repeat=5))
+        print(f"{name:<36}{seconds / number * 1e6:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
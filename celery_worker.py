@@ -1,13 +1,43 @@
-from app import create_app
-from celery import Celery
-from app.tasks import task_functions
-from app.tasks import callbacks
+import os
 
-app = create_app('development')
-celery = Celery(app.name,
-                broker=app.config['CELERY_BROKER_URL'])
+from dotenv import load_dotenv
 
-celery.conf.update(app.config)
+# The config reads the environment when imported, so .env is loaded first
+load_dotenv()
+
+from celery import Celery  # noqa: E402
+
+from config import config_name, load_config  # noqa: E402
+from app.core.database_manager import DatabaseManager  # noqa: E402
+from app.core.cache_manager import CacheManager  # noqa: E402
+from app.core.metrics import metrics  # noqa: E402
+from app.tasks import task_functions  # noqa: E402, F401 - registers the tasks in the task registry
+from app.tasks import maintenance  # noqa: E402
+from app.tasks.callbacks import initialize_callback_manager  # noqa: E402
+from app.tasks.instrumentation import connect_task_metrics, connect_worker_logging  # noqa: E402
+from app.tasks.routing import celery_settings, worker_settings  # noqa: E402
+
+# The worker only needs the config, the managers used by the callbacks and the task registry, not the Flask app
+# The config is chosen with APP_CONFIG (or FLASK_ENV)
+config = load_config(config_name())
+
+db_manager = DatabaseManager(config)
+cache_manager = CacheManager(config)
+initialize_callback_manager(db_manager, cache_manager)
+metrics.configure(cache_manager, config['METRICS_KEY'], config['METRICS_FLUSH_INTERVAL'])
+connect_task_metrics()
+connect_worker_logging(config)
+
+celery = Celery('app',
+                broker=config['CELERY_BROKER_URL'])
+
+celery.conf.update(config)
+celery.conf.update(celery_settings(config))
+celery.conf.update(maintenance.beat_schedule(config))
+
+# Queues this worker consumes, comma separated (all queues by default), with their prefetch and concurrency
+worker_queues = [queue for queue in os.environ.get('CELERY_WORKER_QUEUES', '').split(',') if queue]
+celery.conf.update(worker_settings(config, worker_queues))
 
 # This line ensures that task modules are loaded
 celery.autodiscover_tasks(['app.tasks'], force=True)
@@ -0,0 +1,14 @@
+from typing import Any, Dict
+import importlib
+import os
+
+
+def config_name() -> str:
+    # Name of the config to load: APP_CONFIG, or FLASK_ENV as set by the existing deployments, development by default
+    return os.environ.get('APP_CONFIG') or os.environ.get('FLASK_ENV') or 'development'
+
+
+def load_config(name: str) -> Dict[str, Any]:
+    # The uppercase settings of config.<name>.<Name>Config, as Flask loads them, for the entry points without an app
+    config_class = getattr(importlib.import_module(f'config.{name}'), f'{name.capitalize()}Config')
+    return {key: getattr(config_class, key) for key in dir(config_class) if key.isupper()}
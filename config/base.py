@@ -10,17 +10,146 @@ class BaseConfig:
     DB_NAME = os.environ.get('DB_NAME', 'taskdb')
     DB_USER = os.environ.get('DB_USER', 'taskuser')
     DB_PASSWORD = os.environ.get('DB_PASSWORD', 'password')
-    
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))  # Max connections per process
+    DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 300))  # Seconds before an idle connection is recycled
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))  # Seconds to wait for a free connection
+    DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', 30))  # Ping idle connections older than this on checkout
+
     # Redis
     REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
     REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+    REDIS_POOL_SIZE = int(os.environ.get('REDIS_POOL_SIZE', 50))  # Max connections per process
+    REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 10))  # Seconds to wait for a free connection
+    # Encoding of cached task results: 'json' (orjson when installed) or 'msgpack', compressed with zlib above
+    # CACHE_COMPRESS_THRESHOLD bytes (0 disables it). Only plain JSON is readable by Celery's AsyncResult.
+    CACHE_CODEC = os.environ.get('CACHE_CODEC', 'json')
+    CACHE_COMPRESS_THRESHOLD = int(os.environ.get('CACHE_COMPRESS_THRESHOLD', 0))
     
     # Celery
     CELERY_BROKER_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/0'
     CELERY_RESULT_BACKEND = f'redis://{REDIS_HOST}:{REDIS_PORT}/0'
     
+    # Tasks
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 32 * 1024 * 1024))  # Max request body in bytes
+    # Maximum length of task parameters, checked before the task is sent to the broker
+    TASK_PARAMETER_LIMITS = {
+        'find_longest_consecutive_letters': {'string': int(os.environ.get('MAX_STRING_LENGTH', 1_000_000))},
+        'query_chatgpt': {'prompt': int(os.environ.get('MAX_PROMPT_LENGTH', 16_000))},
+    }
+    MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 1000))  # Max tasks per /run-tasks request
+    TASK_LIST_DEFAULT_LIMIT = int(os.environ.get('TASK_LIST_DEFAULT_LIMIT', 50))  # Tasks per GET /tasks page
+    TASK_LIST_MAX_LIMIT = int(os.environ.get('TASK_LIST_MAX_LIMIT', 500))
+    TASK_COMPLETION_CHANNEL = 'task-completions'  # Redis pub/sub channel the callbacks announce finished tasks on
+    LONG_POLL_MAX_WAIT = float(os.environ.get('LONG_POLL_MAX_WAIT', 30))  # Max ?wait= seconds for /get-task-output
+    SSE_MAX_DURATION = float(os.environ.get('SSE_MAX_DURATION', 300))  # Max seconds a /task-events stream stays open
+    SSE_HEARTBEAT_INTERVAL = float(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))  # Seconds between keep-alive comments
+
+    # Queues
+    # Tasks are routed by name so a backlog of slow tasks doesn't starve the fast ones, each queue can be
+    # served by its own worker pool (see CELERY_WORKER_QUEUES in celery_worker.py)
+    TASK_DEFAULT_QUEUE = os.environ.get('TASK_DEFAULT_QUEUE', 'default')
+    TASK_ROUTES = {
+        'sum_two_numbers': {'queue': 'fast'},
+        'find_longest_consecutive_letters': {'queue': 'fast'},
+        'query_chatgpt': {'queue': 'chatgpt'},
+    }
+    # Default priority of each task, 0 (highest) to 9 (lowest) with the Redis broker
+    TASK_PRIORITIES = {}
+    # Worker settings per queue: prefetch_multiplier is how many messages each worker process reserves,
+    # keep it at 1 for long tasks so they don't wait behind each other, and concurrency the worker processes
+    TASK_QUEUES = {
+        'default': {'prefetch_multiplier': 4},
+        'fast': {'prefetch_multiplier': 64},
+        'chatgpt': {'prefetch_multiplier': 1, 'concurrency': int(os.environ.get('CHATGPT_WORKER_CONCURRENCY', 8))},
+    }
+    # Per-worker rate limits in Celery's format (e.g. '100/m'), and limits of the tasks running at once
+    # across all workers, tasks over the limit are retried after TASK_CONCURRENCY_RETRY_DELAY seconds
+    TASK_RATE_LIMITS = {'query_chatgpt': os.environ.get('OPENAI_RATE_LIMIT')}
+    TASK_CONCURRENCY_LIMITS = {'query_chatgpt': int(os.environ.get('OPENAI_MAX_CONCURRENCY', 16))}
+    TASK_CONCURRENCY_LEASE = int(os.environ.get('TASK_CONCURRENCY_LEASE', 300))  # Max seconds a task holds a slot
+    TASK_CONCURRENCY_RETRY_DELAY = float(os.environ.get('TASK_CONCURRENCY_RETRY_DELAY', 1))
+
+    # Retention
+    # The tasks table is partitioned by creation time, a periodic Celery beat job creates the partitions ahead
+    # and retires the ones whose tasks are all older than TASK_RETENTION_DAYS (0 keeps them forever),
+    # dropping them or only detaching them from the table, after exporting them to TASK_ARCHIVE_DIR if set
+    # Tasks are kept forever unless a retention is configured, and dropping them has to be asked for explicitly
+    TASK_PARTITION_DAYS = int(os.environ.get('TASK_PARTITION_DAYS', 7))  # Days of tasks per partition
+    TASK_PARTITIONS_AHEAD = int(os.environ.get('TASK_PARTITIONS_AHEAD', 2))  # Partitions created in advance
+    TASK_RETENTION_DAYS = int(os.environ.get('TASK_RETENTION_DAYS', 0))
+    TASK_RETENTION_ACTION = os.environ.get('TASK_RETENTION_ACTION', 'detach')  # 'detach' or 'drop'
+    TASK_ARCHIVE_DIR = os.environ.get('TASK_ARCHIVE_DIR', '')  # Gzipped CSV exports of retired partitions
+    TASK_MAINTENANCE_INTERVAL = int(os.environ.get('TASK_MAINTENANCE_INTERVAL', 3600))  # Seconds between runs
+
+    # Publishing of the submitted tasks, always after their row is inserted: 'outbox' commits the message with the row
+    # and a relay thread publishes the pending messages in batches of up to OUTBOX_BATCH_SIZE, checking for the ones
+    # left by other processes every OUTBOX_POLL_INTERVAL seconds, 'direct' publishes it in the request
+    # The relay of each web process starts with the app (OUTBOX_RELAY_AT_STARTUP), otherwise on its first submission
+    TASK_PUBLISH_MODE = os.environ.get('TASK_PUBLISH_MODE', 'outbox')
+    OUTBOX_RELAY_AT_STARTUP = os.environ.get('OUTBOX_RELAY_AT_STARTUP', 'true').lower() == 'true'
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 500))
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 1))
+
+    # Deduplication of task submissions: 'off', 'key' to honour the Idempotency-Key header of /run-task,
+    # or 'content' to also deduplicate identical submissions of deterministic tasks without a key
+    TASK_DEDUP_MODE = os.environ.get('TASK_DEDUP_MODE', 'key')
+    TASK_DEDUP_WINDOW = int(os.environ.get('TASK_DEDUP_WINDOW', 600))  # Seconds a submission is remembered
+    # Seconds a claimed task is reported as PENDING to its duplicates before its row is inserted
+    TASK_DEDUP_PENDING_TTL = int(os.environ.get('TASK_DEDUP_PENDING_TTL', 30))
+
+    # Text parameters and results of at least BLOB_THRESHOLD bytes (0 disables it) are stored once in the blob store,
+    # 'redis' (kept BLOB_TTL seconds, 0 keeps them forever) or 'file' (under BLOB_DIR, shared by all nodes),
+    # and passed by reference. Redis only keeps a blob for as long as it is needed by default: while its task waits
+    # in the queue (up to TASK_MAX_QUEUE_WAIT) and then as long as the result is cached (an hour by default),
+    # after which /get-task-output answers 410. The file store is the one to use to keep them with the tasks
+    TASK_MAX_QUEUE_WAIT = int(os.environ.get('TASK_MAX_QUEUE_WAIT', 6 * 3600))  # Seconds
+    BLOB_STORE = os.environ.get('BLOB_STORE', 'redis')
+    BLOB_DIR = os.environ.get('BLOB_DIR', 'blobs')
+    BLOB_TTL = int(os.environ.get('BLOB_TTL', TASK_MAX_QUEUE_WAIT + 3600))
+    BLOB_THRESHOLD = int(os.environ.get('BLOB_THRESHOLD', 256 * 1024))
+
+    # Seconds the state of unfinished (PENDING) and unknown tasks read from the database is cached in Redis,
+    # so repeated polls don't each query it (0 disables it). The completion callbacks drop it with the result write
+    TASK_PENDING_CACHE_TTL = int(os.environ.get('TASK_PENDING_CACHE_TTL', 1))
+    TASK_MISSING_CACHE_TTL = int(os.environ.get('TASK_MISSING_CACHE_TTL', 2))
+
+    # In-process cache of finished task outputs, in front of Redis
+    LOCAL_RESULT_CACHE_MAX_BYTES = int(os.environ.get('LOCAL_RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    LOCAL_RESULT_CACHE_TTL = float(os.environ.get('LOCAL_RESULT_CACHE_TTL', 3600))
+
+    # Callbacks
+    # In write-behind mode task results are cached immediately and the database status updates are batched,
+    # a hard crash of a worker can lose up to CALLBACK_FLUSH_MAX_ITEMS updates or CALLBACK_FLUSH_INTERVAL_MS of them
+    CALLBACK_WRITE_BEHIND = os.environ.get('CALLBACK_WRITE_BEHIND', 'false').lower() == 'true'
+    CALLBACK_FLUSH_INTERVAL_MS = int(os.environ.get('CALLBACK_FLUSH_INTERVAL_MS', 200))
+    CALLBACK_FLUSH_MAX_ITEMS = int(os.environ.get('CALLBACK_FLUSH_MAX_ITEMS', 500))
+
+    # Metrics, served by GET /metrics in the Prometheus text format. Every web and worker process adds its values
+    # to the METRICS_KEY Redis hash every METRICS_FLUSH_INTERVAL seconds (0 keeps them per process)
+    METRICS_KEY = os.environ.get('METRICS_KEY', 'tasker-metrics')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
     # Logging
+    # Records are written to LOG_FILE by a background thread, from a queue of up to LOG_QUEUE_SIZE records which drops
+    # them when it is full. The info lines of the LOG_SAMPLE_RATES loggers, logged on every request or task, are only
+    # kept at LOG_SAMPLE_RATE: all of them by default, deployments logging too much can lower it (e.g. 0.1 keeps one
+    # in ten). Warnings and errors are always kept
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FILE = os.environ.get('LOG_FILE', 'logs/app.log')
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    LOG_MAX_ARG_LENGTH = int(os.environ.get('LOG_MAX_ARG_LENGTH', 200))  # Longer string arguments are truncated
+    LOG_MAX_MESSAGE_LENGTH = int(os.environ.get('LOG_MAX_MESSAGE_LENGTH', 8192))  # Message template and traceback, each
+    LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 1.0))
+    LOG_SAMPLE_RATES = dict.fromkeys(('app.core.task_manager', 'app.tasks.task_functions', 'app.tasks.callbacks'),
+                                     LOG_SAMPLE_RATE)
     
     # ChatGPT
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', 'your-api-key')
+    OPENAI_API_URL = os.environ.get('OPENAI_API_URL', 'https://api.openai.com/v1/chat/completions')
+    OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-3.5-turbo')
+    OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 5))
+    OPENAI_READ_TIMEOUT = float(os.environ.get('OPENAI_READ_TIMEOUT', 60))
+    OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 3))  # Retries on connection errors, 429 and 5xx
+    OPENAI_BACKOFF_FACTOR = float(os.environ.get('OPENAI_BACKOFF_FACTOR', 0.5))  # Exponential backoff base, plus jitter
+    OPENAI_POOL_SIZE = int(os.environ.get('OPENAI_POOL_SIZE', 100))  # Keep-alive connections per worker process
+    OPENAI_RESULT_CACHE_TTL = int(os.environ.get('OPENAI_RESULT_CACHE_TTL', 3600))  # Seconds, 0 disables the cache
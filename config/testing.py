@@ -8,3 +8,7 @@ class TestingConfig(BaseConfig):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     # Use in-memory Redis for testing
     REDIS_URL = 'memory://'
+    # Keep the metrics in process, /metrics then doesn't need Redis
+    METRICS_FLUSH_INTERVAL = 0
+    # The outbox relay only starts when a test submits a task, rather than polling the database in every app
+    OUTBOX_RELAY_AT_STARTUP = False
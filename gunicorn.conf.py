@@ -0,0 +1,9 @@
+# Gunicorn settings of the web service, loaded by default from the working directory (gunicorn -c gunicorn.conf.py)
+
+
+def post_fork(server, worker):
+    # psycopg2 waits on libpq in C, which blocks the gevent hub: a slow query would stall every greenlet of the
+    # worker. With psycogreen it waits through gevent, so the other requests of the worker keep being served
+    if 'gevent' in server.cfg.worker_class_str:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
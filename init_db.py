@@ -1,23 +1,148 @@
-from app import create_app
-from app.core.database_manager import DatabaseManager
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Mapping
 
-app = create_app('development')
+from dotenv import load_dotenv
+
+# The config reads the environment when imported, so .env is loaded first
+load_dotenv()
+
+from config import config_name, load_config  # noqa: E402
+from app.core.database_manager import DatabaseManager  # noqa: E402
+from app.models.task_partitions import create_partitions, partition_name, period_start  # noqa: E402
+
+
+def partition_tasks_table(config: Mapping[str, Any]) -> List[str]:
+    # Turn tasks into a table partitioned by range of created_at. The existing table becomes the partition
+    # of all the rows until the end of the current period, its indexes are reused as the partitions' ones
+    # and the primary key includes created_at, as partitioned tables require, lookups by UUID still work
+    end = period_start(datetime.now(timezone.utc).date(), config['TASK_PARTITION_DAYS']) + \
+        timedelta(days=config['TASK_PARTITION_DAYS'])
+    legacy = partition_name(None, end)
+    return [
+        f"ALTER TABLE tasks RENAME TO {legacy}",
+        f"ALTER INDEX tasks_pkey RENAME TO {legacy}_pkey",
+        f"ALTER INDEX tasks_created_at_idx RENAME TO {legacy}_created_at_idx",
+        f"ALTER INDEX tasks_name_created_at_idx RENAME TO {legacy}_name_created_at_idx",
+        f"ALTER INDEX tasks_unfinished_created_at_idx RENAME TO {legacy}_unfinished_created_at_idx",
+        """
+        CREATE TABLE tasks (
+            uuid UUID NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            parameters JSONB NOT NULL,
+            status VARCHAR(50) NOT NULL,
+            output JSONB,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            finished_at TIMESTAMPTZ,
+            PRIMARY KEY (uuid, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        "CREATE INDEX tasks_created_at_idx ON tasks (created_at DESC, uuid DESC)",
+        "CREATE INDEX tasks_name_created_at_idx ON tasks (name, created_at DESC, uuid DESC)",
+        "CREATE INDEX tasks_unfinished_created_at_idx ON tasks (status, created_at DESC, uuid DESC) "
+        "WHERE status <> 'COMPLETED'",
+        f"ALTER TABLE tasks ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO ('{end.isoformat()} 00:00:00+00')",
+    ]
+
+
+# Schema migrations, applied in order once each and recorded in schema_migrations
+# Indexes on existing tables are built CONCURRENTLY so the migration doesn't block writes on a large table,
+# which can't run inside a transaction, so those migrations run in autocommit mode
+# Statements can also be given by a function of the config
+MIGRATIONS = [
+    (1, False, [
+        """
+        CREATE TABLE IF NOT EXISTS tasks (
+            uuid UUID PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            parameters JSONB NOT NULL,
+            status VARCHAR(50) NOT NULL,
+            output JSONB
+        )
+        """,
+    ]),
+    (2, False, [
+        # Deduplication keys of recent submissions, only written when Redis is unavailable
+        """
+        CREATE TABLE IF NOT EXISTS task_dedup (
+            dedup_key TEXT PRIMARY KEY,
+            task_uuid UUID NOT NULL,
+            expires_at TIMESTAMPTZ NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS task_dedup_expires_at_idx ON task_dedup (expires_at)",
+    ]),
+    (3, False, [
+        # Existing rows get the time of the migration, the constant default doesn't rewrite the table
+        "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+        "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS finished_at TIMESTAMPTZ",
+    ]),
+    (4, True, [
+        # Keyset pagination of GET /tasks, most recent first, unfiltered and by name
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_created_at_idx ON tasks (created_at DESC, uuid DESC)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_name_created_at_idx "
+        "ON tasks (name, created_at DESC, uuid DESC)",
+        # Filtering by status, partial as completed tasks are most of the table and are dense enough
+        # in tasks_created_at_idx, while the pending backlog and the failures stay small
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_unfinished_created_at_idx "
+        "ON tasks (status, created_at DESC, uuid DESC) WHERE status <> 'COMPLETED'",
+    ]),
+    (5, False, partition_tasks_table),
+    (6, False, [
+        # Broker messages of the submitted tasks, inserted with their task and deleted once published by the relay
+        """
+        CREATE TABLE IF NOT EXISTS task_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            task_uuid UUID NOT NULL,
+            celery_name TEXT NOT NULL,
+            args JSONB NOT NULL,
+            options JSONB NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+    ]),
+    (7, False, [
+        # Catches the tasks created past the last partition instead of failing their insert,
+        # the maintenance job moves them out when it creates their partition
+        "CREATE TABLE IF NOT EXISTS tasks_default PARTITION OF tasks DEFAULT",
+    ]),
+]
+
+
+def migrate(db_manager: DatabaseManager) -> None:
+    db_manager.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+    applied = {row['version'] for row in db_manager.execute("SELECT version FROM schema_migrations") or []}
+    for version, concurrent, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        if callable(statements):
+            statements = statements(db_manager.config)
+        with db_manager.get_connection() as conn:
+            conn.autocommit = concurrent
+            try:
+                with conn.cursor() as cur:
+                    for statement in statements:
+                        cur.execute(statement)
+                    cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version, ))
+                if not concurrent:
+                    conn.commit()
+            finally:
+                conn.autocommit = False
+        print(f"Applied migration {version}")
+
+    # The partitions of the coming periods, afterwards the Celery beat maintenance job keeps creating them
+    create_partitions(db_manager, db_manager.config['TASK_PARTITION_DAYS'], db_manager.config['TASK_PARTITIONS_AHEAD'])
 
 
 def init_db():
-    # Initialize the tasks table in the database
-    with app.app_context():
-        db_manager = DatabaseManager(app.config)
-        db_manager.execute("""
-            CREATE TABLE IF NOT EXISTS tasks (
-                uuid UUID PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                parameters JSONB NOT NULL,
-                status VARCHAR(50) NOT NULL,
-                output JSONB
-            )
-        """)
-        print("Database initialized successfully")
+    # Create or upgrade the database schema, with the config chosen by APP_CONFIG (or FLASK_ENV)
+    db_manager = DatabaseManager(load_config(config_name()))
+    migrate(db_manager)
+    print("Database initialized successfully")
 
 
 if __name__ == "__main__":
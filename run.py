@@ -1,6 +1,12 @@
-from app import create_app
+from dotenv import load_dotenv
 
-app = create_app('development')
+# The config reads the environment when imported, so .env is loaded first
+load_dotenv()
+
+from app import create_app  # noqa: E402
+
+# The config is chosen with APP_CONFIG (or FLASK_ENV)
+app = create_app()
 
 if __name__ == '__main__':
     app.run()
@@ -0,0 +1,9 @@
+from dotenv import load_dotenv
+
+# The config reads the environment when imported, so .env is loaded first
+load_dotenv()
+
+from app import create_asgi_app  # noqa: E402
+
+# The asyncio variant of run.py, served with an ASGI server: hypercorn run_asgi:app
+app = create_asgi_app()
@@ -1,4 +1,6 @@
+import asyncio
 import pytest
+from unittest.mock import AsyncMock
 from app import create_app
 from app.core.database_manager import DatabaseManager
 from app.core.cache_manager import CacheManager
@@ -11,9 +13,72 @@ def app():
     return app
 
 
+class ASGIResponse:
+    # A Quart test response read to the end, with the attributes of a Flask one the tests use
+    # The test client always buffers the body, so is_streamed is taken from the response the route returned
+    def __init__(self, response, body: bytes, is_streamed: bool) -> None:
+        self.response = response
+        self.data = body
+        self.is_streamed = is_streamed
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def get_data(self, as_text: bool = False):
+        return self.data.decode() if as_text else self.data
+
+
+class ASGIClient:
+    # The Quart test client behind the interface of the Flask one, so the API tests run against both apps
+    def __init__(self, app) -> None:
+        from quart.wrappers.response import DataBody
+        self.client = app.test_client()
+        self.streamed = False
+
+        @app.after_request
+        async def record_body(response):
+            self.streamed = not isinstance(response.response, DataBody)
+            return response
+
+    def request(self, method: str, path: str, **kwargs) -> ASGIResponse:
+        async def send():
+            self.streamed = False
+            response = await getattr(self.client, method)(path, **kwargs)
+            return ASGIResponse(response, await response.get_data(), self.streamed)
+        return asyncio.run(send())
+
+    def get(self, path: str, **kwargs) -> ASGIResponse:
+        return self.request('get', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> ASGIResponse:
+        return self.request('post', path, **kwargs)
+
+
+@pytest.fixture(params=['flask', 'asgi'])
+def api(request):
+    # The app serving the API: the Flask one, and the ASGI one if the packages of requirements-async.txt are installed
+    if request.param == 'asgi':
+        pytest.importorskip('quart')
+        pytest.importorskip('psycopg_pool')
+    return request.param
+
+
+@pytest.fixture
+def client(api, app):
+    if api == 'flask':
+        return app.test_client()
+    from app import create_asgi_app
+    return ASGIClient(create_asgi_app('testing'))
+
+
 @pytest.fixture
-def client(app):
-    return app.test_client()
+def mock_lookup(api, mocker):
+    # Patch a status lookup of the task manager serving the client, which the ASGI app makes on its event loop
+    def patch(name: str, **kwargs):
+        if api == 'flask':
+            return mocker.patch(f'app.core.task_manager.TaskManager.{name}', **kwargs)
+        return mocker.patch(f'app.core.async_task_manager.AsyncTaskManager.{name}', AsyncMock(**kwargs))
+    return patch
 
 
 @pytest.fixture
@@ -32,3 +32,116 @@ def test_get_task_output_integration(client, task_manager, db_manager, cache_man
     data = json.loads(response.data)
     assert (data == {'task_output': {'error': None, 'status': 'PENDING', 'result': None}} or
             data == {'task_output': {'error': None, 'status': 'COMPLETED', 'result': 3}})
+
+
+def test_run_tasks_integration(client, mocker):
+    # Submit a batch of tasks, per-item errors are returned in place
+    mocker.patch('app.core.task_manager.TaskManager.create_tasks',
+                 return_value=[{'task_uuid': 'uuid-1'}, {'error': 'Invalid task name'}])
+    response = client.post('/run-tasks', json={'tasks': [
+        {'task_name': 'sum_two_numbers', 'task_parameters': {'a': 1, 'b': 2}},
+        {'task_name': 'unknown', 'task_parameters': {}}
+    ]})
+
+    assert response.status_code == 200
+    assert json.loads(response.data) == {'results': [{'task_uuid': 'uuid-1'}, {'error': 'Invalid task name'}]}
+
+    response = client.post('/run-tasks', json={'tasks': 'not-a-list'})
+    assert response.status_code == 400
+
+
+def test_run_task_idempotency_key_integration(client, mocker):
+    # The Idempotency-Key header is passed through and duplicates return the existing task
+    mock_submit = mocker.patch('app.core.task_manager.TaskManager.submit_task',
+                               return_value={'task_uuid': 'uuid-1', 'deduplicated': True})
+    response = client.post('/run-task', json={'task_name': 'sum_two_numbers', 'task_parameters': {'a': 1, 'b': 2}},
+                           headers={'Idempotency-Key': 'retry-key'})
+
+    assert response.status_code == 200
+    assert json.loads(response.data) == {'task_uuid': 'uuid-1', 'deduplicated': True}
+    mock_submit.assert_called_once_with('sum_two_numbers', {'a': 1, 'b': 2}, 'retry-key')
+
+
+def test_get_task_output_streams_blob_results_integration(client, mock_lookup, mocker):
+    # Results stored in the blob store are streamed back as the same JSON document
+    mock_lookup('get_task_output', return_value={'status': 'COMPLETED', 'result': {'$blob': 'a' * 64}, 'error': None})
+    mocker.patch('app.core.task_manager.TaskManager.iter_result_text', return_value=iter(['"quoted" ', 'αβ\n']))
+    response = client.get('/get-task-output?task_uuid=uuid-1')
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert json.loads(response.data) == {'task_output': {'status': 'COMPLETED', 'result': '"quoted" αβ\n', 'error': None}}
+
+
+def test_list_tasks_integration(client, mocker):
+    # Filters and the cursor are passed through, invalid limits are rejected
+    mock_list = mocker.patch('app.core.task_manager.TaskManager.list_tasks',
+                             return_value={'tasks': [], 'next_cursor': None})
+    response = client.get('/tasks?status=FAILED&limit=10&cursor=abc')
+
+    assert response.status_code == 200
+    assert json.loads(response.data) == {'tasks': [], 'next_cursor': None}
+    mock_list.assert_called_once_with(None, 'FAILED', 10, 'abc')
+
+    assert client.get('/tasks?limit=ten').status_code == 400
+
+
+def test_get_task_outputs_integration(client, mock_lookup):
+    # Outputs are returned in request order with not-found markers
+    mock_lookup('get_task_outputs', return_value=[{'status': 'PENDING', 'result': None, 'error': None}, None])
+    response = client.post('/get-task-outputs', json={'task_uuids': ['uuid-1', 'uuid-2']})
+
+    assert response.status_code == 200
+    assert json.loads(response.data) == {'task_outputs': [
+        {'task_uuid': 'uuid-1', 'task_output': {'status': 'PENDING', 'result': None, 'error': None}},
+        {'task_uuid': 'uuid-2', 'error': 'Task not found'}
+    ]}
+
+
+def test_get_task_output_long_poll_integration(client, mock_lookup):
+    # With ?wait= the request blocks on the task completion instead of returning the pending state
+    mock_wait = mock_lookup('wait_for_task_output', return_value={'status': 'COMPLETED', 'result': 3, 'error': None})
+    response = client.get('/get-task-output?task_uuid=test-uuid&wait=5')
+
+    assert response.status_code == 200
+    assert json.loads(response.data) == {'task_output': {'status': 'COMPLETED', 'result': 3, 'error': None}}
+    mock_wait.assert_called_once_with('test-uuid', 5.0)
+
+    response = client.get('/get-task-output?task_uuid=test-uuid&wait=-1')
+    assert response.status_code == 400
+
+
+def test_task_events_integration(client, mock_lookup):
+    # The stream sends the current status, then the final one, and closes
+    mock_lookup('get_task_output', return_value={'status': 'PENDING', 'result': None, 'error': None})
+    mock_lookup('wait_for_task_output', return_value={'status': 'COMPLETED', 'result': 3, 'error': None})
+    response = client.get('/task-events?task_uuid=test-uuid')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = [line for line in response.get_data(as_text=True).split('\n') if line.startswith('data: ')]
+    assert [json.loads(line[len('data: '):])['task_output']['status'] for line in events] == ['PENDING', 'COMPLETED']
+
+
+def test_run_task_invalid_input_integration(client, mocker):
+    # Malformed payloads are rejected with a 400 before any broker or database work
+    mock_send_task = mocker.patch('celery.Celery.send_task')
+    assert client.post('/run-task', json={'task_name': 'sum_two_numbers'}).status_code == 400
+    assert client.post('/run-task', json={'task_name': 'unknown', 'task_parameters': {}}).status_code == 400
+    response = client.post('/run-task', json={'task_name': 'sum_two_numbers', 'task_parameters': {'a': 1}})
+    assert response.status_code == 400
+    assert json.loads(response.data) == {'error': 'Missing parameter: b'}
+    mock_send_task.assert_not_called()
+
+
+def test_metrics_integration(client, mocker):
+    # Request durations are labelled by route pattern and served in the Prometheus text format
+    mocker.patch('app.core.task_manager.TaskManager.list_tasks', return_value={'tasks': [], 'next_cursor': None})
+    client.get('/tasks')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    body = response.data.decode()
+    assert '# TYPE tasker_http_request_duration_seconds histogram' in body
+    assert 'tasker_http_request_duration_seconds_count{method="GET",route="/tasks",status="200"}' in body
@@ -0,0 +1,48 @@
+import json
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from app.api.common import (run_task_args, run_tasks_args, task_uuids_arg, limit_arg, wait_arg, sse_timeout_arg,
+                            status_event, task_outputs_body, output_stream_start, output_stream_chunk,
+                            OUTPUT_STREAM_END)
+from app.tasks.validation import ValidationError
+
+CONFIG = {'LONG_POLL_MAX_WAIT': 30, 'SSE_MAX_DURATION': 300}
+
+
+def test_request_validation():
+    # Both blueprints answer the ValidationError of an invalid request with a 400
+    assert run_task_args({'task_name': 'sum_two_numbers', 'task_parameters': {'a': 1}}) == ('sum_two_numbers', {'a': 1})
+    assert run_tasks_args({'tasks': []}) == []
+    assert task_uuids_arg({'task_uuids': ['uuid-1']}) == ['uuid-1']
+    for parse, payload in ((run_task_args, {'task_name': 'sum_two_numbers'}), (run_tasks_args, {'tasks': {}}),
+                           (task_uuids_arg, {'task_uuids': [1]}), (task_uuids_arg, None)):
+        with pytest.raises(ValidationError):
+            parse(payload)
+
+
+def test_query_args():
+    assert limit_arg(MultiDict()) is None
+    assert limit_arg(MultiDict({'limit': '10'})) == 10
+    assert wait_arg(MultiDict({'wait': '60'}), CONFIG) == 30
+    assert wait_arg(MultiDict(), CONFIG) == 0
+    assert sse_timeout_arg(MultiDict({'timeout': '5'}), CONFIG) == 5
+    assert sse_timeout_arg(MultiDict(), CONFIG) == 300
+    with pytest.raises(ValidationError):
+        limit_arg(MultiDict({'limit': 'ten'}))
+    for wait in ('-1', 'nan', 'abc', ''):
+        with pytest.raises(ValidationError):
+            wait_arg(MultiDict({'wait': wait}), CONFIG)
+
+
+def test_response_bodies():
+    output = {'status': 'COMPLETED', 'result': 3, 'error': None}
+    assert task_outputs_body(['uuid-1', 'uuid-2'], [output, None]) == {'task_outputs': [
+        {'task_uuid': 'uuid-1', 'task_output': output},
+        {'task_uuid': 'uuid-2', 'error': 'Task not found'},
+    ]}
+    assert status_event(output) == f"event: status\ndata: {json.dumps({'task_output': output})}\n\n"
+    assert status_event(None).startswith("event: error\n")
+    # The streamed document is the same as the inline one
+    streamed = output_stream_start(output) + output_stream_chunk('"a"\n') + output_stream_chunk('β') + OUTPUT_STREAM_END
+    assert json.loads(streamed) == {'task_output': dict(output, result='"a"\nβ')}
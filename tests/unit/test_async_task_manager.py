@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+from app.core.async_cache_manager import AsyncCacheManager
+from app.core.async_task_manager import AsyncTaskManager
+from app.models.task import Task
+
+
+@pytest.fixture
+def async_task_manager(task_manager):
+    # The asyncio database manager needs psycopg 3, its queries are mocked through Task.get_async
+    return AsyncTaskManager(task_manager, MagicMock(), AsyncCacheManager(task_manager.config))
+
+
+TASK_UUID = '7d4b3c1e-2f6a-4e8b-9c0d-1a2b3c4d5e6f'
+
+
+def test_async_task_manager_get_task_output(async_task_manager, mocker):
+    # A finished task read from the database is written back to Redis and served locally afterwards
+    mock_get_many = mocker.patch.object(async_task_manager.cache_manager, 'get_many',
+                                        AsyncMock(return_value=[None, None]))
+    mock_set_many = mocker.patch.object(async_task_manager.cache_manager, 'set_many', AsyncMock())
+    mock_task = Task(TASK_UUID, 'sum_two_numbers', {'a': 1, 'b': 2}, 'COMPLETED', 3)
+    mock_get = mocker.patch('app.models.task.Task.get_async', AsyncMock(return_value=mock_task))
+
+    result = asyncio.run(async_task_manager.get_task_output(TASK_UUID))
+    assert result == {'status': 'COMPLETED', 'result': 3, 'error': None}
+    mock_get_many.assert_awaited_once_with([f'celery-task-meta-{TASK_UUID}', f'task-state-{TASK_UUID}'])
+    assert list(mock_set_many.call_args[0][0]) == [f'celery-task-meta-{TASK_UUID}']
+    assert asyncio.run(async_task_manager.get_task_output(TASK_UUID)) == result
+    mock_get.assert_awaited_once_with(async_task_manager.db_manager, TASK_UUID)
+    # The local cache is the one of the sync task manager
+    assert async_task_manager.task_manager.local_cache.get(TASK_UUID) == result
+
+
+def test_async_task_manager_get_task_output_coalesces_misses(async_task_manager, mocker):
+    # Concurrent misses of the same task share a single query, and its pending state is cached
+    mocker.patch.object(async_task_manager.cache_manager, 'get_many', AsyncMock(return_value=[None, None]))
+    mock_set_many = mocker.patch.object(async_task_manager.cache_manager, 'set_many', AsyncMock())
+    mock_get = mocker.patch('app.models.task.Task.get_async', AsyncMock(
+        return_value=Task(TASK_UUID, 'sum_two_numbers', {'a': 1, 'b': 2}, 'PENDING')))
+
+    async def poll():
+        return await asyncio.gather(*[async_task_manager.get_task_output(TASK_UUID) for _ in range(5)])
+
+    assert asyncio.run(poll()) == [{'status': 'PENDING', 'result': None, 'error': None}] * 5
+    mock_get.assert_awaited_once()
+    assert list(mock_set_many.call_args[0][0]) == [f'task-state-{TASK_UUID}']
+    assert asyncio.run(async_task_manager.get_task_output('not-a-uuid')) is None
+
+
+def test_async_task_manager_get_task_outputs(async_task_manager, mocker):
+    # Results and cached states are read with one MGET, misses are fetched together from the database
+    uuids = [str(uuid.UUID(int=index)) for index in range(1, 4)]
+    mock_get_many = mocker.patch.object(async_task_manager.cache_manager, 'get_many', AsyncMock(
+        return_value=[b'{"status": "SUCCESS", "result": 3}', None, None, None, None, None]))
+    mocker.patch.object(async_task_manager.cache_manager, 'set_many', AsyncMock())
+    mock_db_get_many = mocker.patch('app.models.task.Task.get_many_async', AsyncMock(
+        return_value={uuids[1]: MagicMock(status='PENDING', output=None)}))
+
+    result = asyncio.run(async_task_manager.get_task_outputs(uuids))
+    assert result == [
+        {'status': 'COMPLETED', 'result': 3, 'error': None},
+        {'status': 'PENDING', 'result': None, 'error': None},
+        None,
+    ]
+    mock_get_many.assert_awaited_once_with([f'celery-task-meta-{task_uuid}' for task_uuid in uuids] +
+                                           [f'task-state-{task_uuid}' for task_uuid in uuids])
+    mock_db_get_many.assert_awaited_once_with(async_task_manager.db_manager, uuids[1:])
+
+
+def test_async_task_manager_wait_for_task_output(async_task_manager, mocker):
+    # A pending task is re-read once its completion is announced, and the current state returned on timeout
+    listener = async_task_manager.completion_listener
+    mocker.patch.object(listener, '_ensure_running', AsyncMock())
+    pending = {'status': 'PENDING', 'result': None, 'error': None}
+    completed = {'status': 'COMPLETED', 'result': 3, 'error': None}
+    mocker.patch.object(async_task_manager, 'get_task_output', AsyncMock(side_effect=[pending, completed]))
+
+    async def wait_and_complete():
+        waiter = asyncio.ensure_future(async_task_manager.wait_for_task_output('test-uuid', 5))
+        await asyncio.sleep(0)
+        listener._notify('test-uuid')
+        return await waiter
+
+    assert asyncio.run(wait_and_complete()) == completed
+    assert listener._waiters == {}
+
+    mocker.patch.object(async_task_manager, 'get_task_output', AsyncMock(return_value=pending))
+    assert asyncio.run(async_task_manager.wait_for_task_output('test-uuid', 0.01)) == pending
+
+
+def test_async_task_manager_submissions_use_task_manager(async_task_manager, mocker):
+    # Submissions run the sync task manager in a thread
+    mock_submit = mocker.patch.object(async_task_manager.task_manager, 'submit_task',
+                                      return_value={'task_uuid': 'uuid-1'})
+
+    result = asyncio.run(async_task_manager.submit_task('sum_two_numbers', {'a': 1, 'b': 2}, 'key'))
+    assert result == {'task_uuid': 'uuid-1'}
+    mock_submit.assert_called_once_with('sum_two_numbers', {'a': 1, 'b': 2}, 'key')
@@ -0,0 +1,75 @@
+import pytest
+from unittest.mock import MagicMock
+
+from app.core.blob_store import (BlobStore, FileBlobStore, RedisBlobStore, BlobNotFoundError, blob_id_of, blob_ref,
+                                 create_blob_store)
+from app.tasks.registry import DEFAULT_RESULT_TTL
+
+
+def test_file_blob_store(tmp_path):
+    store = FileBlobStore(str(tmp_path))
+    text = 'αβγ' * 1000
+    blob_id = store.put_text(text)
+    assert store.put_text(text) == blob_id
+    assert store.get_text(blob_id) == text
+    # Multi-byte characters split across chunks are decoded whole
+    assert ''.join(store.iter_text(blob_id, chunk_size=5)) == text
+
+    with pytest.raises(BlobNotFoundError):
+        store.iter_text('0' * 64)
+
+
+def test_redis_blob_store(cache_manager, mocker):
+    data = {}
+    mock_redis = MagicMock()
+    mock_redis.strlen.side_effect = lambda key: len(data.get(key, b''))
+    mock_redis.getrange.side_effect = lambda key, start, end: data[key][start:end + 1]
+    mocker.patch.object(cache_manager, 'get_connection', return_value=MagicMock(__enter__=MagicMock(return_value=mock_redis)))
+    mocker.patch.object(cache_manager, 'set', side_effect=lambda key, value, expire: data.__setitem__(key, value))
+
+    store = RedisBlobStore(cache_manager, ttl=60)
+    blob_id = store.put_text('x' * 100)
+    assert list(store.iter_text(blob_id, chunk_size=40)) == ['x' * 40, 'x' * 40, 'x' * 20]
+
+    with pytest.raises(BlobNotFoundError):
+        store.get_text('0' * 64)
+
+
+def test_offload_text(tmp_path):
+    store = FileBlobStore(str(tmp_path))
+    assert store.offload_text('short', 100) == 'short'
+    assert store.offload_text('x' * 200, 0) == 'x' * 200
+    assert store.offload_text(12345, 1) == 12345
+    ref = store.offload_text('x' * 200, 100)
+    assert store.get_text(blob_id_of(ref)) == 'x' * 200
+    # The threshold is in UTF-8 bytes
+    assert blob_id_of(store.offload_text('α' * 60, 100)) is not None
+
+
+def test_blob_refs():
+    assert blob_id_of(blob_ref('a' * 64)) == 'a' * 64
+    assert blob_id_of({'$blob': '../etc/passwd'}) is None
+    assert blob_id_of({'$blob': 'a' * 64, 'other': 1}) is None
+    assert blob_id_of('a' * 64) is None
+
+
+def test_blob_store_needs_a_backend():
+    # A store missing one of the backend methods fails when it is built, rather than on first use
+    class PutOnly(BlobStore):
+        def _put(self, blob_id, data):
+            pass
+
+    with pytest.raises(TypeError):
+        PutOnly()
+
+
+def test_create_blob_store(app, tmp_path):
+    assert isinstance(create_blob_store(dict(app.config, BLOB_STORE='file', BLOB_DIR=str(tmp_path))), FileBlobStore)
+    assert isinstance(create_blob_store(app.config), RedisBlobStore)
+    with pytest.raises(ValueError):
+        create_blob_store(dict(app.config, BLOB_STORE='s3'))
+
+
+def test_redis_blobs_are_bounded(app):
+    # Redis keeps a blob while its task is queued and its result cached, not as long as the tasks are kept
+    assert app.config['BLOB_TTL'] == app.config['TASK_MAX_QUEUE_WAIT'] + DEFAULT_RESULT_TTL
@@ -23,3 +23,29 @@ def test_cache_manager_set(cache_manager, mocker):
 
     cache_manager.set('test_key', 'test_value')
     mock_redis.set.assert_called_once_with('test_key', 'test_value')
+
+
+def test_cache_manager_get_many(cache_manager, mocker):
+    # All keys should be fetched with a single MGET
+    mock_redis = MagicMock()
+    mock_redis.mget.return_value = [b'a', None]
+    mocker.patch.object(cache_manager, 'get_connection', return_value=MagicMock(__enter__=MagicMock(return_value=mock_redis)))
+
+    assert cache_manager.get_many(['k1', 'k2']) == [b'a', None]
+    mock_redis.mget.assert_called_once_with(['k1', 'k2'])
+    assert cache_manager.get_many([]) == []
+
+
+def test_cache_manager_set_many(cache_manager, mocker):
+    # Keys with an expiration time should be written through one pipeline
+    mock_pipe = MagicMock()
+    mocker.patch.object(cache_manager, 'pipeline', return_value=MagicMock(__enter__=MagicMock(return_value=mock_pipe)))
+
+    cache_manager.set_many({'k1': 'v1', 'k2': 'v2'}, expire=60)
+    assert mock_pipe.setex.call_count == 2
+    mock_pipe.execute.assert_called_once()
+
+
+def test_cache_managers_share_connection_pool(app):
+    from app.core.cache_manager import CacheManager
+    assert CacheManager(app.config).pool is CacheManager(app.config).pool
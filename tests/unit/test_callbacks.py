@@ -0,0 +1,63 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+
+from app.tasks.callbacks import TaskCallbackManager
+
+
+@pytest.fixture
+def callback_manager(db_manager, cache_manager):
+    return TaskCallbackManager(db_manager, cache_manager)
+
+
+def test_update_cache_single_round_trip(callback_manager, mocker):
+    # The result meta should be written and the completion announced without reading the previous value first
+    mock_get = mocker.patch.object(callback_manager.cache_manager, 'get')
+    mock_pipe = MagicMock()
+    mocker.patch.object(callback_manager.cache_manager, 'pipeline',
+                        return_value=MagicMock(__enter__=MagicMock(return_value=mock_pipe)))
+
+    callback_manager._update_cache('test-uuid', 'SUCCESS', 3)
+
+    mock_get.assert_not_called()
+    mock_pipe.execute.assert_called_once()
+    mock_pipe.publish.assert_called_once_with('task-completions', 'test-uuid')
+    # The cached pending state is dropped with the result write
+    mock_pipe.delete.assert_called_once_with('task-state-test-uuid')
+    key, expire, value = mock_pipe.setex.call_args[0]
+    assert key == 'celery-task-meta-test-uuid'
+    meta = json.loads(value)
+    assert meta['status'] == 'SUCCESS'
+    assert meta['result'] == 3
+    assert meta['task_id'] == 'test-uuid'
+
+
+def test_success_handler_write_behind(db_manager, cache_manager, mocker):
+    # In write-behind mode the result is cached right away and the database update is buffered
+    status_buffer = MagicMock()
+    callback_manager = TaskCallbackManager(db_manager, cache_manager, status_buffer)
+    mock_get = mocker.patch('app.models.task.Task.get')
+    mock_update_cache = mocker.patch.object(callback_manager, '_update_cache')
+    sender = MagicMock()
+    sender.request.id = 'test-uuid'
+
+    callback_manager.task_success_handler(sender, 3)
+
+    mock_get.assert_not_called()
+    mock_update_cache.assert_called_once()
+    status_buffer.add.assert_called_once_with('test-uuid', 'COMPLETED', 3)
+
+
+def test_failure_handler_single_statement(callback_manager, mocker):
+    # The task is marked as failed without a prior SELECT, and the cache is only updated if it exists
+    mock_get = mocker.patch('app.models.task.Task.get')
+    mock_mark_finished = mocker.patch('app.models.task.Task.mark_finished', return_value=False)
+    mock_update_cache = mocker.patch.object(callback_manager, '_update_cache')
+    sender = MagicMock()
+    sender.request.id = 'test-uuid'
+
+    callback_manager.task_failure_handler(sender, Exception('boom'))
+
+    mock_get.assert_not_called()
+    mock_mark_finished.assert_called_once_with(callback_manager.db_manager, 'test-uuid', 'FAILED', {'error': 'boom'})
+    mock_update_cache.assert_not_called()
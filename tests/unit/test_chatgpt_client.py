@@ -0,0 +1,71 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+
+from app.tasks.chatgpt_client import ChatGPTClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Local stand-in for the chat completions API, fails with the queued status codes before answering
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server.requests.append(body)
+        status = server.statuses.pop(0) if server.statuses else 200
+        payload = {'choices': [{'message': {'content': f"echo: {body['messages'][0]['content']}"}}]}
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = []
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(app, stub_server):
+    config = dict(app.config)
+    config.update(OPENAI_API_URL=f'http://127.0.0.1:{stub_server.server_port}/v1/chat/completions',
+                  OPENAI_BACKOFF_FACTOR=0, OPENAI_MAX_RETRIES=2)
+    return ChatGPTClient(config)
+
+
+def test_client_retries_server_errors(client, stub_server):
+    stub_server.statuses = [503, 429]
+    assert client.complete('hello', 'key') == 'echo: hello'
+    assert len(stub_server.requests) == 3
+
+
+def test_client_gives_up_after_max_retries(client, stub_server):
+    stub_server.statuses = [500, 500, 500]
+    with pytest.raises(requests.HTTPError):
+        client.complete('hello', 'key')
+
+
+def test_client_uses_cached_result(client, mocker):
+    cache_manager = mocker.MagicMock()
+    cache_manager.get_object.return_value = 'cached answer'
+    client.cache_manager = cache_manager
+    assert client.complete('hello', 'key') == 'cached answer'
+    cache_manager.get_object.assert_called_once_with(client.result_key('hello'))
+
+
+def test_client_result_key_is_content_addressed(client):
+    assert client.result_key('hello') == client.result_key('hello')
+    assert client.result_key('hello') != client.result_key('hello!')
@@ -0,0 +1,43 @@
+import json
+import pytest
+
+from app.core import codec as codec_module
+from app.core.codec import Codec, json_dumps
+
+VALUE = {'status': 'SUCCESS', 'result': 'x' * 2000, 'task_id': 'test-uuid'}
+
+
+def test_codec_plain_json_is_readable_by_celery():
+    # Uncompressed JSON is stored unframed, as the Celery result backend expects
+    encoded = Codec('json').encode(VALUE)
+    assert json.loads(encoded) == VALUE
+
+
+def test_codec_compresses_above_threshold():
+    codec = Codec('json', compress_threshold=1024)
+    encoded = codec.encode(VALUE)
+    assert len(encoded) < len(json.dumps(VALUE))
+    assert codec.decode(encoded) == VALUE
+    # Values under the threshold stay plain JSON
+    assert json.loads(codec.encode({'a': 1})) == {'a': 1}
+
+
+def test_codec_decodes_values_written_with_other_settings():
+    encoded = Codec('json', compress_threshold=1024).encode(VALUE)
+    assert Codec('json').decode(encoded) == VALUE
+    assert Codec('json').decode(None) is None
+
+
+@pytest.mark.skipif(codec_module.msgpack is None, reason='msgpack is not installed')
+def test_codec_msgpack_round_trip():
+    codec = Codec('msgpack', compress_threshold=1024)
+    assert codec.decode(codec.encode(VALUE)) == VALUE
+
+
+def test_json_dumps_falls_back_for_big_integers():
+    assert json.loads(json_dumps({'result': 2 ** 70})) == {'result': 2 ** 70}
+
+
+def test_codec_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        Codec('xml')
@@ -0,0 +1,55 @@
+import pytest
+from unittest.mock import MagicMock
+from celery import Celery
+from celery.exceptions import Ignore
+
+from app.tasks.concurrency import ConcurrencyLimiter, ConcurrencyLimitedTask
+from app.tasks.task_functions import query_chatgpt, sum_two_numbers
+
+
+def test_registered_tasks_are_concurrency_limited():
+    assert isinstance(query_chatgpt, ConcurrencyLimitedTask)
+    assert query_chatgpt.public_name == 'query_chatgpt'
+    assert sum_two_numbers.public_name == 'sum_two_numbers'
+
+
+def test_concurrency_limiter(cache_manager, mocker):
+    limiter = ConcurrencyLimiter(cache_manager, lease=60)
+    mock_script = mocker.patch.object(limiter, '_acquire_script', return_value=1)
+    token = limiter.acquire('query_chatgpt', 2)
+    assert token is not None
+    assert mock_script.call_args[1]['keys'] == ['task-concurrency-query_chatgpt']
+
+    mock_script.return_value = 0
+    assert limiter.acquire('query_chatgpt', 2) is None
+
+
+def test_limited_task_is_republished_when_all_slots_are_taken(mocker):
+    # A task over its limit is published again with a delay instead of running
+    celery_app = Celery('test')
+    celery_app.conf.update({'TASK_CONCURRENCY_LIMITS': {'add': 1}, 'TASK_CONCURRENCY_RETRY_DELAY': 1})
+
+    @celery_app.task(base=ConcurrencyLimitedTask, public_name='add')
+    def add(a, b):
+        return a + b
+
+    mock_limiter = MagicMock()
+    mock_limiter.acquire.return_value = None
+    mocker.patch('app.tasks.concurrency.get_concurrency_limiter', return_value=mock_limiter)
+    mock_signature = mocker.patch.object(add, 'signature_from_request')
+
+    add.push_request(id='test-uuid', args=[{'$blob': 'a' * 64}, 2], kwargs={}, called_directly=False)
+    try:
+        # The message is published again with its own arguments, not the resolved ones the task was called with
+        with pytest.raises(Ignore):
+            add(1, 2)
+        mock_signature.return_value.apply_async.assert_called_once()
+        assert mock_signature.call_args[0][1:] == ([{'$blob': 'a' * 64}, 2], {})
+        assert 1 <= mock_signature.call_args[1]['countdown'] <= 2
+
+        # With a slot the task runs and releases it
+        mock_limiter.acquire.return_value = 'token'
+        assert add(1, 2) == 3
+        mock_limiter.release.assert_called_once_with('add', 'token')
+    finally:
+        add.pop_request()
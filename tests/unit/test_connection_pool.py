@@ -0,0 +1,57 @@
+import pytest
+from unittest.mock import MagicMock
+
+from app.core.connection_pool import ConnectionPool, PoolTimeoutError
+
+
+def make_pool(**kwargs):
+    options = {'max_size': 2, 'max_idle': 60, 'timeout': 0.05}
+    options.update(kwargs)
+    return ConnectionPool(MagicMock(side_effect=lambda: MagicMock()), **options)
+
+
+def test_pool_reuses_released_connection():
+    pool = make_pool()
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    stats = pool.stats()
+    assert stats['checkouts'] == 2
+    assert stats['connections_opened'] == 1
+
+
+def test_pool_is_bounded():
+    pool = make_pool()
+    pool.acquire()
+    pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_pool_replaces_connections_failing_check():
+    check = MagicMock(return_value=False)
+    pool = make_pool(check=check)
+    conn = pool.acquire()
+    pool.release(conn)
+    new_conn = pool.acquire()
+    assert new_conn is not conn
+    conn.close.assert_called_once()
+    assert pool.stats()['size'] == 1
+
+
+def test_pool_discards_broken_connection_on_release():
+    pool = make_pool()
+    conn = pool.acquire()
+    pool.release(conn, discard=True)
+    conn.close.assert_called_once()
+    assert pool.stats()['size'] == 0
+
+
+def test_pool_resets_after_fork():
+    pool = make_pool()
+    conn = pool.acquire()
+    pool.release(conn)
+    pool._pid = -1  # Simulate running in a forked child
+    assert pool.acquire() is not conn
+    conn.close.assert_not_called()
@@ -14,3 +14,16 @@ def test_database_manager_execute(db_manager, mocker):
     assert result == [{'id': 1, 'name': 'Test'}]
     mock_cursor.execute.assert_called_once_with("SELECT * FROM test", None)
     mock_connection.commit.assert_called_once()
+
+
+def test_database_manager_discards_broken_connection(db_manager, mocker):
+    # A connection that raised an OperationalError must not be returned to the pool
+    import psycopg2
+    mock_connection = MagicMock()
+    mock_connection.cursor.return_value.__enter__.return_value.execute.side_effect = psycopg2.OperationalError()
+    mocker.patch.object(db_manager.pool, 'acquire', return_value=mock_connection)
+    mock_release = mocker.patch.object(db_manager.pool, 'release')
+
+    with pytest.raises(psycopg2.OperationalError):
+        db_manager.execute("SELECT 1")
+    mock_release.assert_called_once_with(mock_connection, discard=True)
@@ -0,0 +1,51 @@
+from app.core.local_cache import LocalCache, _collect_metrics
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(max_bytes=10, ttl=60)
+    cache.set('a', 1, 4)
+    cache.set('b', 2, 4)
+    assert cache.get('a') == 1  # 'b' is now the least recently used
+    cache.set('c', 3, 4)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['bytes'] == 8
+    assert stats['hits'] == 3
+    assert stats['misses'] == 1
+
+
+def test_local_cache_expires_entries():
+    cache = LocalCache(max_bytes=10, ttl=0)
+    cache.set('a', 1, 4)
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_local_cache_skips_oversized_values():
+    cache = LocalCache(max_bytes=10, ttl=60)
+    cache.set('a', 1, 11)
+    assert cache.get('a') is None
+
+
+def test_local_cache_stats_are_exported(mocker):
+    events = mocker.patch('app.core.local_cache.LOCAL_CACHE_EVENTS')
+    held_bytes = mocker.patch('app.core.local_cache.LOCAL_CACHE_BYTES')
+    mocker.patch('app.core.local_cache._caches', set())
+    cache = LocalCache(max_bytes=10, ttl=60)
+    cache.set('a', 1, 4)
+    cache.get('a')
+    cache.get('b')
+
+    _collect_metrics()
+    events.inc.assert_has_calls([mocker.call('hits', amount=1), mocker.call('misses', amount=1)])
+    held_bytes.set.assert_called_once_with(4)
+
+    # Only the events since the previous export are added
+    events.reset_mock()
+    cache.get('a')
+    _collect_metrics()
+    events.inc.assert_called_once_with('hits', amount=1)
@@ -0,0 +1,89 @@
+import logging
+import sys
+import queue
+import pytest
+
+from app.core.log_setup import install_queue_logging, stop_queue_logging, SamplingFilter
+from app.core.metrics import LOG_RECORDS_DROPPED
+
+CONFIG = {'LOG_QUEUE_SIZE': 100, 'LOG_MAX_ARG_LENGTH': 10, 'LOG_MAX_MESSAGE_LENGTH': 60,
+          'LOG_SAMPLE_RATES': {'tasker.sampled': 0}}
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def queue_logger():
+    # A logger of its own writing to a list through the queue, so the root logger is left alone
+    logger = logging.getLogger('tasker')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = ListHandler()
+    logger.addHandler(handler)
+    install_queue_logging(logger, CONFIG)
+    yield logger, handler
+    stop_queue_logging()
+    logger.handlers.clear()
+
+
+def test_queue_logging_truncates_arguments_and_messages(queue_logger):
+    # Records are written by the listener thread, with the long arguments and messages cut
+    logger, handler = queue_logger
+    logger.info("Prompt: %s, tries: %d", 'a' * 1000, 3)
+    logger.info("x" * 100)
+    stop_queue_logging()
+
+    assert handler.messages[0] == "Prompt: aaaaaaaaaa... [1000 chars], tries: 3"
+    assert handler.messages[1] == "x" * 60 + "... [100 chars]"
+    # Installing it again is a no-op
+    install_queue_logging(logger, CONFIG)
+    assert len(logger.handlers) == 1
+
+
+def test_queue_logging_samples_info_records(queue_logger):
+    # The info lines of the sampled loggers and their children are dropped, warnings are always kept
+    logger, handler = queue_logger
+    logging.getLogger('tasker.sampled.child').info("Dropped")
+    logging.getLogger('tasker.sampled').warning("Kept: %s", 1)
+    logging.getLogger('tasker.other').info("Kept: %s", 2)
+    stop_queue_logging()
+
+    assert handler.messages == ["Kept: 1", "Kept: 2"]
+    assert SamplingFilter({'a': 0.5}).rate('a.b.c') == 0.5
+    assert SamplingFilter({'a': 0.5}).rate('ab') == 1.0
+
+
+def test_queue_logging_drops_records_when_full(queue_logger, mocker):
+    # A full queue drops the record rather than blocking the caller
+    logger, _ = queue_logger
+    queue_handler = logger.handlers[0]
+    mocker.patch.object(queue_handler.queue, 'put_nowait', side_effect=queue.Full)
+    dropped = LOG_RECORDS_DROPPED.snapshot().get((), [0])[0]
+    logger.warning("Dropped")
+    assert LOG_RECORDS_DROPPED.snapshot()[()][0] == dropped + 1
+
+
+def test_queue_logging_renders_tracebacks_in_the_caller(queue_logger):
+    # The traceback is rendered before the record is queued, the message is merged by the listener thread
+    logger, _ = queue_logger
+    queue_handler = logger.handlers[0]
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = logger.makeRecord(logger.name, logging.ERROR, __file__, 0, "Failed: %s", ('a' * 20,),
+                                   sys.exc_info())
+    prepared = queue_handler.prepare(record)
+
+    assert prepared.exc_info is None
+    # Cut to LOG_MAX_MESSAGE_LENGTH like the messages
+    assert prepared.exc_text.startswith('Traceback (most recent call last):')
+    assert prepared.exc_text.endswith(' chars]')
+    assert prepared.args == ('a' * 10 + '... [20 chars]',)
+    assert prepared.msg == "Failed: %s"
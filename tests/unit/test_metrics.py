@@ -0,0 +1,149 @@
+import asyncio
+import pytest
+
+from app.core.metrics import Metric, MetricsRegistry
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def test_counter_renders_per_label(registry):
+    lookups = registry.counter('lookups', "Lookups", ('source', ))
+    lookups.inc('local')
+    lookups.inc('local')
+    lookups.inc('redis', amount=3)
+
+    assert registry.exposition() == (
+        '# HELP lookups Lookups\n'
+        '# TYPE lookups counter\n'
+        'lookups_total{source="local"} 2\n'
+        'lookups_total{source="redis"} 3\n'
+    )
+
+
+def test_metric_types_must_render(registry):
+    # A metric type without render fails when it is built, rather than on the first /metrics request
+    class Gauge(Metric):
+        type = 'gauge'
+
+    with pytest.raises(TypeError):
+        Gauge(registry, 'queue_size', "Queue size")
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    duration = registry.histogram('duration_seconds', "Duration", ('route', ), buckets=(0.1, 1))
+    duration.observe(0.05, '/a')
+    duration.observe(0.1, '/a')
+    duration.observe(0.5, '/a')
+    duration.observe(5, '/a')
+
+    lines = registry.exposition().splitlines()
+    assert lines[2:] == [
+        'duration_seconds_bucket{route="/a",le="0.1"} 2',
+        'duration_seconds_bucket{route="/a",le="1"} 3',
+        'duration_seconds_bucket{route="/a",le="+Inf"} 4',
+        'duration_seconds_sum{route="/a"} 5.65',
+        'duration_seconds_count{route="/a"} 4',
+    ]
+
+
+def test_histogram_times_calls(registry, mocker):
+    duration = registry.histogram('call_seconds', "Calls", ('name', ))
+    mocker.patch('app.core.metrics.time.perf_counter', side_effect=[1.0, 1.25, 2.0, 2.5, 3.0, 3.75])
+
+    @duration.time('f')
+    def f():
+        return 42
+
+    # Coroutine functions are timed until they complete rather than until they return a coroutine
+    @duration.time('coroutine')
+    async def coroutine():
+        return 43
+
+    assert f() == 42
+    with duration.time('block'):
+        pass
+    assert asyncio.run(coroutine()) == 43
+    values = duration.snapshot()
+    assert values[('f', )][-1] == 0.25
+    assert values[('block', )][-1] == 0.5
+    assert values[('coroutine', )][-1] == 0.75
+
+
+def test_flush_adds_deltas_to_redis(registry, mocker):
+    # Each flush sends what was recorded since the previous one, the values are aggregated in Redis
+    lookups = registry.counter('lookups', "Lookups", ('source', ))
+    cache_manager = mocker.MagicMock()
+    pipe = cache_manager.get_connection.return_value.__enter__.return_value.pipeline.return_value
+    registry.configure(cache_manager, 'metrics', 60)
+    registry.pending_start = False
+    lookups.inc('local', amount=2)
+
+    registry.flush()
+    pipe.hincrbyfloat.assert_called_once_with('metrics', 'lookups\x1f0\x1flocal', 2.0)
+    pipe.execute.assert_called_once()
+    assert lookups.snapshot() == {}
+
+
+def test_flush_keeps_values_on_failure(registry, mocker):
+    lookups = registry.counter('lookups', "Lookups", ('source', ))
+    cache_manager = mocker.MagicMock()
+    pipe = cache_manager.get_connection.return_value.__enter__.return_value.pipeline.return_value
+    pipe.execute.side_effect = ConnectionError()
+    registry.configure(cache_manager, 'metrics', 60)
+    registry.pending_start = False
+    lookups.inc('local')
+
+    with pytest.raises(ConnectionError):
+        registry.flush()
+    lookups.inc('local')
+    assert lookups.snapshot() == {('local', ): [2.0]}
+
+
+def test_exposition_renders_aggregated_values(registry, mocker):
+    duration = registry.histogram('duration_seconds', "Duration", (), buckets=(1, ))
+    cache_manager = mocker.MagicMock()
+    redis = cache_manager.get_connection.return_value.__enter__.return_value
+    redis.hgetall.return_value = {b'duration_seconds\x1f0\x1f': b'3', b'duration_seconds\x1f1\x1f': b'1',
+                                  b'duration_seconds\x1f2\x1f': b'4.5', b'unknown\x1f0\x1f': b'1'}
+    registry.configure(cache_manager, 'metrics', 60)
+
+    assert registry.exposition().splitlines()[2:] == [
+        'duration_seconds_bucket{le="1"} 3',
+        'duration_seconds_bucket{le="+Inf"} 4',
+        'duration_seconds_sum 4.5',
+        'duration_seconds_count 4',
+    ]
+
+
+def test_fork_drops_inherited_values(registry):
+    # Values recorded before fork() are flushed by the parent, not again by each child
+    lookups = registry.counter('lookups', "Lookups", ('source', ))
+    lookups.inc('local')
+    registry._after_fork()
+    assert lookups.snapshot() == {}
+
+
+def test_gauges_are_set_per_process(registry, mocker):
+    # Each process overwrites its own value, the values of processes that stopped flushing are left out
+    held = registry.gauge('held_bytes', "Held bytes")
+    registry.collector(lambda: held.set(42))
+    cache_manager = mocker.MagicMock()
+    redis = cache_manager.get_connection.return_value.__enter__.return_value
+    pipe = redis.pipeline.return_value
+    registry.configure(cache_manager, 'metrics', 60)
+    registry.pending_start = False
+    mocker.patch('app.core.metrics.time.time', return_value=1000.0)
+    mocker.patch('app.core.metrics.os.getpid', return_value=7)
+
+    registry.flush()
+    pipe.hset.assert_any_call('metrics', 'held_bytes\x1f0\x1f7', 42)
+    pipe.hset.assert_any_call('metrics', 'held_bytes\x1f1\x1f7', 1000.0)
+    pipe.hincrbyfloat.assert_not_called()
+
+    redis.hgetall.return_value = {b'held_bytes\x1f0\x1f7': b'42', b'held_bytes\x1f1\x1f7': b'1000',
+                                  b'held_bytes\x1f0\x1f8': b'5', b'held_bytes\x1f1\x1f8': b'100'}
+    assert registry.exposition().splitlines()[2:] == ['held_bytes{process="7"} 42']
+    redis.hdel.assert_called_once_with('metrics', 'held_bytes\x1f0\x1f8', 'held_bytes\x1f1\x1f8')
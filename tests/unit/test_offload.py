@@ -0,0 +1,44 @@
+from celery import Celery
+
+from app.core.blob_store import FileBlobStore, blob_ref, blob_id_of
+from app.tasks.offload import Blob, OffloadingTask
+from app.tasks.task_functions import find_longest_consecutive_letters
+
+
+def test_offloading_task_resolves_and_offloads(tmp_path, mocker):
+    store = FileBlobStore(str(tmp_path))
+    mocker.patch('app.tasks.offload.get_blob_store', return_value=store)
+    celery_app = Celery('test')
+    celery_app.conf.update({'BLOB_THRESHOLD': 100})
+
+    @celery_app.task(base=OffloadingTask, public_name='echo', stream_args=(1, ))
+    def echo(text, streamed):
+        assert isinstance(streamed, Blob)
+        return text + ''.join(streamed.iter_text())
+
+    ref = blob_ref(store.put_text('a' * 100))
+    echo.push_request(id='test-uuid', called_directly=False)
+    try:
+        # Parameters are resolved, loaded whole or streamed, and the large result is offloaded
+        result = echo(ref, ref)
+        assert store.get_text(blob_id_of(result)) == 'a' * 200
+    finally:
+        echo.pop_request()
+
+
+def test_offloading_task_appends_config_args():
+    # Config values such as API keys come from the worker's config rather than from the message
+    celery_app = Celery('test')
+    celery_app.conf.update({'API_KEY': 'secret'})
+
+    @celery_app.task(base=OffloadingTask, public_name='query', config_args=('API_KEY', ))
+    def query(prompt, api_key):
+        return f'{prompt} {api_key}'
+
+    assert query('hi') == 'hi secret'
+
+
+def test_find_longest_consecutive_letters_streams_blobs(tmp_path):
+    store = FileBlobStore(str(tmp_path))
+    blob = Blob(store, store.put_text('ab' * 100_000 + 'c' * 7))
+    assert find_longest_consecutive_letters(blob) == 7
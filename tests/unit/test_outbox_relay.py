@@ -0,0 +1,73 @@
+import pytest
+import time
+from unittest.mock import MagicMock
+
+from app.core.outbox_relay import OutboxRelay
+
+ENTRIES = [
+    {'id': 1, 'task_uuid': 'uuid-1', 'celery_name': 'app.tasks.task_functions.sum_two_numbers', 'args': [1, 2],
+     'options': {}},
+    {'id': 2, 'task_uuid': 'uuid-2', 'celery_name': 'app.tasks.task_functions.query_chatgpt', 'args': ['hi'],
+     'options': {'queue': 'chatgpt'}},
+]
+
+
+@pytest.fixture
+def relay(db_manager, mocker):
+    mock_connection = MagicMock()
+    mocker.patch.object(db_manager, 'get_connection',
+                        return_value=MagicMock(__enter__=MagicMock(return_value=mock_connection)))
+    return OutboxRelay(db_manager, MagicMock(), batch_size=100, poll_interval=60)
+
+
+def _cursor(relay):
+    return relay.db_manager.get_connection().__enter__().cursor.return_value.__enter__.return_value
+
+
+def test_outbox_relay_publishes_batch(relay):
+    # The pending messages are published over one producer and deleted in the same transaction
+    cursor = _cursor(relay)
+    cursor.fetchall.return_value = ENTRIES
+
+    assert relay.relay_batch() == 2
+    producer = relay.celery.producer_or_acquire.return_value.__enter__.return_value
+    relay.celery.send_task.assert_any_call('app.tasks.task_functions.sum_two_numbers', args=[1, 2], task_id='uuid-1',
+                                           producer=producer)
+    relay.celery.send_task.assert_any_call('app.tasks.task_functions.query_chatgpt', args=['hi'], task_id='uuid-2',
+                                           producer=producer, queue='chatgpt')
+    cursor.execute.assert_called_with("DELETE FROM task_outbox WHERE id = ANY(%s)", ([1, 2], ))
+    relay.db_manager.get_connection().__enter__().commit.assert_called_once()
+
+
+def test_outbox_relay_keeps_unpublished_messages(relay):
+    # On a broker failure only the messages already published are deleted
+    cursor = _cursor(relay)
+    cursor.fetchall.return_value = ENTRIES
+    relay.celery.send_task.side_effect = [None, RuntimeError('broker down')]
+
+    with pytest.raises(RuntimeError):
+        relay.relay_batch()
+    cursor.execute.assert_called_with("DELETE FROM task_outbox WHERE id = ANY(%s)", ([1], ))
+
+
+def test_outbox_relay_empty(relay):
+    _cursor(relay).fetchall.return_value = []
+    assert relay.relay_batch() == 0
+    relay.celery.send_task.assert_not_called()
+
+
+def test_outbox_relay_start_polls_without_submissions(relay, mocker):
+    # Once started the relay publishes the entries left by other processes without being notified
+    relay.poll_interval = 0.01
+    mock_relay_batch = mocker.patch.object(relay, 'relay_batch', return_value=0)
+    relay.start()
+    thread = relay._thread
+    relay.start()
+    assert relay._thread is thread
+
+    deadline = time.monotonic() + 2
+    while not mock_relay_batch.called and time.monotonic() < deadline:
+        time.sleep(0.01)
+    mock_relay_batch.assert_called()
+    # Park the daemon thread for the rest of the session
+    relay.poll_interval = 3600
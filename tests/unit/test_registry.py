@@ -0,0 +1,26 @@
+import pytest
+
+from app.tasks.registry import TaskRegistry, TaskSpec, registry
+
+
+def test_registry_contains_task_functions(app):
+    # The tasks in app.tasks.task_functions register themselves when imported
+    assert set(registry.names()) >= {'sum_two_numbers', 'query_chatgpt', 'find_longest_consecutive_letters'}
+    spec = registry.get('sum_two_numbers')
+    assert spec.celery_name == 'app.tasks.task_functions.sum_two_numbers'
+    assert registry.get_by_celery_name(spec.celery_name) is spec
+
+
+def test_task_spec_build_args():
+    spec = TaskSpec('query', 'tasks.query', {'prompt': str}, queue='llm')
+    assert spec.build_args({'prompt': 'hi'}) == ['hi']
+    assert spec.options == {'queue': 'llm'}
+    with pytest.raises(KeyError):
+        spec.build_args({})
+
+
+def test_registry_rejects_duplicate_names():
+    test_registry = TaskRegistry()
+    test_registry.register(TaskSpec('task', 'tasks.task', {}))
+    with pytest.raises(ValueError):
+        test_registry.register(TaskSpec('task', 'tasks.other', {}))
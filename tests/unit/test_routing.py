@@ -0,0 +1,32 @@
+import pytest
+
+from app.tasks.routing import celery_settings, worker_settings
+
+
+def test_celery_settings_route_tasks_by_name(app):
+    settings = celery_settings(app.config)
+    assert settings['CELERY_DEFAULT_QUEUE'] == 'default'
+    assert settings['CELERY_ROUTES']['app.tasks.task_functions.sum_two_numbers'] == {'queue': 'fast'}
+    assert settings['CELERY_ROUTES']['app.tasks.task_functions.query_chatgpt'] == {'queue': 'chatgpt'}
+
+
+def test_celery_settings_priorities_and_rate_limits(app):
+    config = dict(app.config, TASK_PRIORITIES={'sum_two_numbers': 0}, TASK_RATE_LIMITS={'query_chatgpt': '10/s'})
+    settings = celery_settings(config)
+    assert settings['CELERY_ROUTES']['app.tasks.task_functions.sum_two_numbers'] == {'queue': 'fast', 'priority': 0}
+    assert settings['CELERY_ANNOTATIONS'] == {'app.tasks.task_functions.query_chatgpt': {'rate_limit': '10/s'}}
+
+    with pytest.raises(ValueError):
+        celery_settings(dict(app.config, TASK_ROUTES={'unknown': {'queue': 'fast'}}))
+
+
+def test_worker_settings(app):
+    # A dedicated worker takes the settings of its queue, a worker of all queues the safest of them
+    settings = worker_settings(app.config, ['chatgpt'])
+    assert [queue.name for queue in settings['CELERY_QUEUES']] == ['chatgpt']
+    assert settings['CELERYD_PREFETCH_MULTIPLIER'] == 1
+    assert settings['CELERYD_CONCURRENCY'] == app.config['TASK_QUEUES']['chatgpt']['concurrency']
+
+    settings = worker_settings(app.config)
+    assert [queue.name for queue in settings['CELERY_QUEUES']] == ['default', 'fast', 'chatgpt']
+    assert settings['CELERYD_PREFETCH_MULTIPLIER'] == 1
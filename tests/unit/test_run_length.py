@@ -0,0 +1,64 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.tasks import run_length
+from app.tasks.run_length import longest_run, longest_run_of_chunks, iter_chunks, summarize, merge, _summarize_python
+
+
+def reference(string):
+    # The original per-character loop of find_longest_consecutive_letters
+    max_len = 0
+    current_len = 0
+    previous_char = ''
+    for char in string:
+        if char == previous_char:
+            current_len += 1
+        else:
+            current_len = 1
+        if current_len > max_len:
+            max_len = current_len
+        previous_char = char
+    return max_len
+
+
+def random_strings():
+    rng = random.Random(42)
+    yield ''
+    yield 'a'
+    yield 'a' * 1000
+    yield 'aaabbccccdd'
+    yield 'ααβββγ'
+    # Lone surrogates, which Python strings can hold, e.g. decoded with 'surrogateescape'
+    yield '\ud800\ud800\udfffa'
+    yield b'ab\xff\xff\xffc'.decode('utf-8', 'surrogateescape')
+    for _ in range(50):
+        alphabet = rng.choice(['ab', 'abc', 'aαβ😀', 'abcdefghij'])
+        yield ''.join(rng.choice(alphabet) * rng.randint(1, 8) for _ in range(rng.randint(1, 200)))
+
+
+@pytest.mark.parametrize('engine', ['numpy', 'python'])
+def test_longest_run_matches_reference(engine, mocker):
+    if engine == 'python':
+        mocker.patch.object(run_length, '_numpy', None)
+    elif run_length._load_numpy() is None:
+        pytest.skip('numpy is not installed')
+    for string in random_strings():
+        assert longest_run(string) == reference(string)
+        # Runs spanning chunk boundaries are joined
+        for chunk_size in (1, 2, 3, 7):
+            assert longest_run(string, chunk_size) == reference(string)
+
+
+def test_summaries_merge_in_any_grouping():
+    string = 'aabbbbaaaab'
+    for split in range(len(string) + 1):
+        assert merge(summarize(string[:split]), summarize(string[split:])) == _summarize_python(string)
+
+
+def test_longest_run_of_chunks_in_parallel():
+    string = 'ab' * 1000 + 'c' * 50 + 'ab' * 1000
+    with ThreadPoolExecutor(4) as executor:
+        assert longest_run_of_chunks(iter_chunks(string, 7), executor) == 50
+
@@ -0,0 +1,44 @@
+import threading
+import time
+import pytest
+
+from app.core.single_flight import SingleFlight
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return 42
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(single_flight.do('key', work)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(single_flight.do('key', work))) for _ in range(5)]
+    for follower in followers:
+        follower.start()
+    time.sleep(0.1)  # Let the followers join the call in flight
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert results == [42] * 6
+    assert len(calls) == 1
+
+
+def test_single_flight_propagates_errors():
+    single_flight = SingleFlight()
+
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        single_flight.do('key', fail)
+    assert single_flight.do('key', lambda: 1) == 1
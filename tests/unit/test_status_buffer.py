@@ -0,0 +1,41 @@
+import pytest
+
+from app.tasks.status_buffer import StatusUpdateBuffer
+
+
+@pytest.fixture
+def status_buffer(db_manager):
+    return StatusUpdateBuffer(db_manager, flush_interval=60, max_items=100)
+
+
+def test_status_buffer_flushes_in_one_statement(status_buffer, mocker):
+    # Pending updates are written together, the latest update of a task wins
+    mock_update_many = mocker.patch('app.models.task.Task.update_status_many')
+    status_buffer.add('uuid-1', 'COMPLETED', 3)
+    status_buffer.add('uuid-2', 'FAILED', {'error': 'boom'})
+    status_buffer.add('uuid-1', 'COMPLETED', 4)
+
+    assert status_buffer.flush() == 2
+    mock_update_many.assert_called_once_with(status_buffer.db_manager, [
+        ('uuid-1', 'COMPLETED', 4),
+        ('uuid-2', 'FAILED', {'error': 'boom'}),
+    ])
+    assert status_buffer.flush() == 0
+
+
+def test_status_buffer_keeps_updates_on_failure(status_buffer, mocker):
+    # Updates that failed to be written are retried on the next flush
+    mock_update_many = mocker.patch('app.models.task.Task.update_status_many', side_effect=[Exception(), None])
+    status_buffer.add('uuid-1', 'COMPLETED', 3)
+
+    with pytest.raises(Exception):
+        status_buffer.flush()
+    assert status_buffer.flush() == 1
+    assert mock_update_many.call_count == 2
+
+
+def test_status_buffer_close_flushes(status_buffer, mocker):
+    mock_update_many = mocker.patch('app.models.task.Task.update_status_many')
+    status_buffer.add('uuid-1', 'COMPLETED', 3)
+    status_buffer.close()
+    mock_update_many.assert_called_once()
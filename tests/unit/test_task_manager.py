@@ -1,24 +1,387 @@
 import pytest
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock
 
+from app.models.task import Task, OutboxMessage
+
 
 def test_task_manager_create_task(task_manager, mocker):
-    # Mock the Task.create method and the Celery send_task method
-    mock_task = MagicMock(uuid='test-uuid')
-    mocker.patch('app.models.task.Task.create', return_value=mock_task)
+    # The task and its outbox message are inserted together, the relay publishes the message afterwards
+    mock_create = mocker.patch('app.models.task.Task.create',
+                               side_effect=lambda db, task_uuid, *args, **kwargs: MagicMock(uuid=task_uuid))
+    mock_notify = mocker.patch.object(task_manager.outbox_relay, 'notify')
     mock_celery = MagicMock()
     mocker.patch.object(task_manager, 'celery', mock_celery)
 
     result = task_manager.create_task('sum_two_numbers', {'a': 1, 'b': 2})
-    assert result == 'test-uuid'
-    mock_celery.send_task.assert_called_once_with('app.tasks.task_functions.sum_two_numbers', args=[1, 2])
+    mock_create.assert_called_once_with(task_manager.db_manager, result, 'sum_two_numbers', {'a': 1, 'b': 2},
+                                        OutboxMessage('app.tasks.task_functions.sum_two_numbers', [1, 2], {}), dedup=None)
+    mock_notify.assert_called_once()
+    mock_celery.send_task.assert_not_called()
+
+    # Config values such as the OpenAI API key are added by the worker, they are never stored in the outbox
+    task_manager.create_task('query_chatgpt', {'prompt': 'hi'})
+    assert mock_create.call_args[0][4].args == ['hi']
+
+
+def test_task_manager_create_task_direct_publish(task_manager, mocker):
+    # In direct mode the task is published with its pregenerated ID once inserted, and marked as ERROR on failure
+    mocker.patch.dict(task_manager.config, {'TASK_PUBLISH_MODE': 'direct'})
+    calls = MagicMock()
+    mocker.patch('app.models.task.Task.create', calls.create)
+    mock_mark_finished = mocker.patch('app.models.task.Task.mark_finished')
+    mocker.patch.object(task_manager, 'celery', calls)
+
+    calls.create.side_effect = lambda db, task_uuid, *args, **kwargs: MagicMock(uuid=task_uuid)
+    result = task_manager.create_task('sum_two_numbers', {'a': 1, 'b': 2})
+    assert [call[0] for call in calls.mock_calls] == ['create', 'send_task']
+    calls.send_task.assert_called_once_with('app.tasks.task_functions.sum_two_numbers', args=[1, 2], task_id=result)
+
+    calls.send_task.side_effect = RuntimeError('broker down')
+    with pytest.raises(RuntimeError):
+        task_manager.create_task('sum_two_numbers', {'a': 1, 'b': 2})
+    assert mock_mark_finished.call_args[0][2] == 'ERROR'
+
+
+TASK_UUID = '7d4b3c1e-2f6a-4e8b-9c0d-1a2b3c4d5e6f'
 
 
 def test_task_manager_get_task_output(task_manager, mocker):
-    # Mock the CacheManager get method and the Task.get method
-    mocker.patch.object(task_manager.cache_manager, 'get', return_value=None)
-    mock_task = MagicMock(status='COMPLETED', output=3)
-    mocker.patch('app.models.task.Task.get', return_value=mock_task)
+    # The result and the cached state are read with one MGET, then the task is read from the database
+    mock_get_many = mocker.patch.object(task_manager.cache_manager, 'get_many', return_value=[None, None])
+    mock_set_many = mocker.patch.object(task_manager.cache_manager, 'set_many')
+    mock_task = Task(TASK_UUID, 'sum_two_numbers', {'a': 1, 'b': 2}, 'COMPLETED', 3)
+    mock_get = mocker.patch('app.models.task.Task.get', return_value=mock_task)
+
+    result = task_manager.get_task_output(TASK_UUID)
+    assert result == {'status': 'COMPLETED', 'result': 3, 'error': None}
+    mock_get_many.assert_called_once_with([f'celery-task-meta-{TASK_UUID}', f'task-state-{TASK_UUID}'])
+    # The finished task is written back to Redis and served from the local cache afterwards
+    mock_set_many.assert_called_once()
+    assert list(mock_set_many.call_args[0][0]) == [f'celery-task-meta-{TASK_UUID}']
+    assert task_manager.get_task_output(TASK_UUID) == result
+    mock_get.assert_called_once()
+
+
+def test_task_manager_get_task_output_caches_pending_and_missing(task_manager, mocker):
+    # Pending and unknown tasks are cached as short-lived states rather than results, and served from them
+    mock_get_many = mocker.patch.object(task_manager.cache_manager, 'get_many', return_value=[None, None])
+    mock_set_many = mocker.patch.object(task_manager.cache_manager, 'set_many')
+    mock_get = mocker.patch('app.models.task.Task.get', side_effect=[
+        Task(TASK_UUID, 'sum_two_numbers', {'a': 1, 'b': 2}, 'PENDING'), None])
+
+    pending = {'status': 'PENDING', 'result': None, 'error': None}
+    assert task_manager.get_task_output(TASK_UUID) == pending
+    mock_set_many.assert_called_once_with({f'task-state-{TASK_UUID}': task_manager.cache_manager.codec.encode(pending)},
+                                          expire=task_manager.config['TASK_PENDING_CACHE_TTL'])
+    # The caches are keyed by the canonical form of the UUID, whatever form it was requested in
+    assert task_manager.get_task_output(TASK_UUID.upper()) is None
+    assert mock_get_many.call_args[0][0] == [f'celery-task-meta-{TASK_UUID}', f'task-state-{TASK_UUID}']
+    assert mock_set_many.call_args == (({f'task-state-{TASK_UUID}': b'null'}, ),
+                                       {'expire': task_manager.config['TASK_MISSING_CACHE_TTL']})
+    assert mock_get.call_count == 2
+
+    mock_get_many.return_value = [None, task_manager.cache_manager.codec.encode(pending)]
+    assert task_manager.get_task_output(TASK_UUID) == pending
+    mock_get_many.return_value = [None, b'null']
+    assert task_manager.get_task_output(TASK_UUID) is None
+    assert mock_get.call_count == 2
+    # Pending outputs never go to the local cache
+    assert task_manager.local_cache.get(TASK_UUID) is None
+
+
+def test_task_manager_get_task_output_rejects_malformed_uuids(task_manager, mocker):
+    # A UUID that isn't well formed can't match a task, it is rejected without any lookup
+    mock_get_many = mocker.patch.object(task_manager.cache_manager, 'get_many')
+    mock_get = mocker.patch('app.models.task.Task.get')
+
+    assert task_manager.get_task_output('not-a-uuid') is None
+    assert task_manager.get_task_output(None) is None
+    mock_get_many.assert_not_called()
+    mock_get.assert_not_called()
+
+
+def test_task_manager_get_task_output_coalesces_misses(task_manager, mocker):
+    # Concurrent misses of the same task share a single database query
+    mocker.patch.object(task_manager.cache_manager, 'get_many', return_value=[None, None])
+    mocker.patch.object(task_manager.cache_manager, 'set_many')
+    started, release = threading.Event(), threading.Event()
+
+    def get(db_manager, task_uuid):
+        started.set()
+        release.wait(5)
+        return Task(TASK_UUID, 'sum_two_numbers', {'a': 1, 'b': 2}, 'PENDING')
+
+    mock_get = mocker.patch('app.models.task.Task.get', side_effect=get)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(task_manager.get_task_output, TASK_UUID)
+        started.wait(5)
+        followers = [executor.submit(task_manager.get_task_output, TASK_UUID) for _ in range(3)]
+        time.sleep(0.05)
+        release.set()
+        outputs = [leader.result()] + [follower.result() for follower in followers]
+
+    assert outputs == [{'status': 'PENDING', 'result': None, 'error': None}] * 4
+    mock_get.assert_called_once()
+
+
+def test_task_manager_create_tasks(task_manager, mocker):
+    # Valid specs are inserted with their outbox messages in one batch, invalid ones are reported in place
+    mock_create_many = mocker.patch('app.models.task.Task.create_many')
+    mock_notify = mocker.patch.object(task_manager.outbox_relay, 'notify')
+    mocker.patch('app.core.task_manager.uuid.uuid4', side_effect=['uuid-1', 'uuid-2'])
+
+    results = task_manager.create_tasks([
+        {'task_name': 'sum_two_numbers', 'task_parameters': {'a': 1, 'b': 2}},
+        {'task_name': 'unknown', 'task_parameters': {}},
+        {'task_name': 'sum_two_numbers', 'task_parameters': {'a': 1}},
+        {'task_name': 'find_longest_consecutive_letters', 'task_parameters': {'string': 'aab'}},
+    ])
+
+    assert results == [
+        {'task_uuid': 'uuid-1'},
+        {'error': 'Invalid task name'},
+        {'error': 'Missing parameter: b'},
+        {'task_uuid': 'uuid-2'},
+    ]
+    mock_create_many.assert_called_once_with(task_manager.db_manager, [
+        ('uuid-1', 'sum_two_numbers', {'a': 1, 'b': 2}),
+        ('uuid-2', 'find_longest_consecutive_letters', {'string': 'aab'}),
+    ], [
+        OutboxMessage('app.tasks.task_functions.sum_two_numbers', [1, 2], {}),
+        OutboxMessage('app.tasks.task_functions.find_longest_consecutive_letters', ['aab'], {}),
+    ])
+    mock_notify.assert_called_once()
+
+
+def test_task_manager_create_tasks_direct_publish_failure(task_manager, mocker):
+    # In direct mode the tasks left unpublished by a broker failure are marked as ERROR and reported in place
+    mocker.patch.dict(task_manager.config, {'TASK_PUBLISH_MODE': 'direct'})
+    mocker.patch('app.models.task.Task.create_many')
+    mock_mark_finished = mocker.patch('app.models.task.Task.mark_finished')
+    mock_delete = mocker.patch.object(task_manager.cache_manager, 'delete')
+    mock_celery = MagicMock()
+    mock_celery.send_task.side_effect = [None, RuntimeError('broker down')]
+    mocker.patch.object(task_manager, 'celery', mock_celery)
+    mocker.patch('app.core.task_manager.uuid.uuid4', side_effect=['uuid-1', 'uuid-2', 'uuid-3'])
+
+    results = task_manager.create_tasks([{'task_name': 'sum_two_numbers', 'task_parameters': {'a': 1, 'b': 2}}] * 3)
+    error = 'Failed to publish the task: broker down'
+    assert results == [{'task_uuid': 'uuid-1'}, {'task_uuid': 'uuid-2', 'error': error},
+                       {'task_uuid': 'uuid-3', 'error': error}]
+    assert [call[0][1:3] for call in mock_mark_finished.call_args_list] == [('uuid-2', 'ERROR'), ('uuid-3', 'ERROR')]
+    assert mock_delete.call_count == 2
+
+
+def test_task_manager_create_tasks_batch_limit(task_manager):
+    task_manager.config['MAX_BATCH_SIZE'] = 1
+    with pytest.raises(ValueError):
+        task_manager.create_tasks([{}, {}])
+
+
+def test_task_manager_get_task_outputs(task_manager, mocker):
+    # Results and cached states are read with one MGET, misses are fetched together from the database
+    uuids = [str(uuid.UUID(int=index)) for index in range(1, 5)]
+    pending = {'status': 'PENDING', 'result': None, 'error': None}
+    mock_get_many = mocker.patch.object(task_manager.cache_manager, 'get_many', return_value=[
+        b'{"status": "SUCCESS", "result": 3}', None, None, None,
+        None, None, None, task_manager.cache_manager.codec.encode(pending)])
+    mock_set_many = mocker.patch.object(task_manager.cache_manager, 'set_many')
+    mock_task = MagicMock(status='PENDING', output=None)
+    mock_db_get_many = mocker.patch('app.models.task.Task.get_many', return_value={uuids[1]: mock_task})
+
+    result = task_manager.get_task_outputs(uuids + ['not-a-uuid'])
+    assert result == [
+        {'status': 'COMPLETED', 'result': 3, 'error': None},
+        pending,
+        None,
+        pending,
+        None,
+    ]
+    mock_get_many.assert_called_once_with([f'celery-task-meta-{task_uuid}' for task_uuid in uuids] +
+                                          [f'task-state-{task_uuid}' for task_uuid in uuids])
+    mock_db_get_many.assert_called_once_with(task_manager.db_manager, uuids[1:3])
+    # The states of the pending and unknown tasks read from the database are cached
+    cached = {key for call in mock_set_many.call_args_list for key in call[0][0]}
+    assert cached == {f'task-state-{uuids[1]}', f'task-state-{uuids[2]}'}
+
 
-    result = task_manager.get_task_output('test-uuid')
+def test_task_manager_wait_for_task_output(task_manager, mocker):
+    # A pending task is re-read once its completion is announced
+    event = MagicMock()
+    event.wait.return_value = True
+    mocker.patch.object(task_manager.completion_listener, 'subscribe', return_value=event)
+    mock_unsubscribe = mocker.patch.object(task_manager.completion_listener, 'unsubscribe')
+    mocker.patch.object(task_manager, 'get_task_output', side_effect=[
+        {'status': 'PENDING', 'result': None, 'error': None},
+        {'status': 'COMPLETED', 'result': 3, 'error': None},
+    ])
+
+    result = task_manager.wait_for_task_output('test-uuid', 5)
     assert result == {'status': 'COMPLETED', 'result': 3, 'error': None}
+    event.wait.assert_called_once()
+    mock_unsubscribe.assert_called_once_with('test-uuid', event)
+
+
+def test_task_manager_wait_for_task_output_timeout(task_manager, mocker):
+    # The current state is returned when the task doesn't finish in time
+    event = MagicMock()
+    event.wait.return_value = False
+    mocker.patch.object(task_manager.completion_listener, 'subscribe', return_value=event)
+    mocker.patch.object(task_manager.completion_listener, 'unsubscribe')
+    pending = {'status': 'PENDING', 'result': None, 'error': None}
+    mocker.patch.object(task_manager, 'get_task_output', return_value=pending)
+
+    assert task_manager.wait_for_task_output('test-uuid', 0.01) == pending
+
+
+def test_task_manager_create_task_rejects_invalid_parameters(task_manager, mocker):
+    # Invalid parameters are rejected before anything is sent to the broker or the database
+    from app.tasks.validation import ValidationError
+    mock_create = mocker.patch('app.models.task.Task.create')
+    mock_celery = MagicMock()
+    mocker.patch.object(task_manager, 'celery', mock_celery)
+
+    with pytest.raises(ValidationError):
+        task_manager.create_task('sum_two_numbers', {'a': 1, 'b': 'two'})
+    with pytest.raises(ValidationError):
+        task_manager.create_task('find_longest_consecutive_letters', {'string': 'a' * 2_000_000})
+    mock_celery.send_task.assert_not_called()
+    mock_create.assert_not_called()
+
+
+def test_task_manager_submit_task_idempotency_key(task_manager, mocker):
+    # The first submission claims the key and creates the task, a resubmission returns the same task
+    claims = {}
+
+    def claim(key, value, expire, placeholder=None):
+        owner = claims.setdefault(key, value)
+        return None if owner == value else owner.encode()
+
+    mocker.patch.object(task_manager.cache_manager, 'claim', side_effect=claim)
+    mocker.patch.object(task_manager.cache_manager, 'get_many', return_value=[None, None])
+    mock_delete = mocker.patch.object(task_manager.cache_manager, 'delete')
+    mock_create = mocker.patch('app.models.task.Task.create',
+                               side_effect=lambda db, task_uuid, *args, **kwargs: MagicMock(uuid=task_uuid))
+    mocker.patch.object(task_manager.outbox_relay, 'notify')
+
+    first = task_manager.submit_task('sum_two_numbers', {'a': 1, 'b': 2}, 'retry-key')
+    second = task_manager.submit_task('sum_two_numbers', {'a': 1, 'b': 2}, 'retry-key')
+    assert second == {'task_uuid': first['task_uuid'], 'deduplicated': True}
+    mock_create.assert_called_once()
+    assert mock_create.call_args[0][1] == first['task_uuid']
+    # Until its row is inserted, the claimed task is cached as PENDING for the duplicates polling it
+    placeholder = task_manager.cache_manager.claim.call_args_list[0][0][3]
+    assert placeholder[0] == f"task-state-{first['task_uuid']}"
+    assert task_manager.cache_manager.codec.decode(placeholder[1])['status'] == 'PENDING'
+    # and dropped once the row is inserted, along with any miss cached meanwhile
+    mock_delete.assert_called_once_with(f"task-state-{first['task_uuid']}")
+
+    # Without a key nothing is deduplicated in the default mode
+    task_manager.submit_task('sum_two_numbers', {'a': 1, 'b': 2})
+    assert mock_create.call_count == 2
+
+
+def test_task_manager_submit_task_content_dedup(task_manager, mocker):
+    # In content mode identical deterministic submissions share the task and its finished output
+    mocker.patch.dict(task_manager.config, {'TASK_DEDUP_MODE': 'content'})
+    mocker.patch.object(task_manager.cache_manager, 'claim', return_value=TASK_UUID.encode())
+    task_manager.local_cache.set(TASK_UUID, {'status': 'COMPLETED', 'result': 3, 'error': None}, 1)
+    mock_celery = MagicMock()
+    mocker.patch.object(task_manager, 'celery', mock_celery)
+
+    result = task_manager.submit_task('sum_two_numbers', {'b': 2, 'a': 1})
+    assert result == {'task_uuid': TASK_UUID, 'deduplicated': True,
+                      'task_output': {'status': 'COMPLETED', 'result': 3, 'error': None}}
+    mock_celery.send_task.assert_not_called()
+    # The same local entry serves the UUID in any form
+    mock_get_many = mocker.patch.object(task_manager.cache_manager, 'get_many')
+    assert task_manager.get_task_output(TASK_UUID.upper())['result'] == 3
+    mock_get_many.assert_not_called()
+
+    # Keys don't depend on the order of the parameters, and non-deterministic tasks are never deduplicated
+    spec = task_manager._resolve_task('sum_two_numbers', {'a': 1, 'b': 2})[0]
+    assert task_manager._dedup_key(spec, {'a': 1, 'b': 2}, None) == task_manager._dedup_key(spec, {'b': 2, 'a': 1}, None)
+    spec = task_manager._resolve_task('query_chatgpt', {'prompt': 'hi'})[0]
+    assert task_manager._dedup_key(spec, {'prompt': 'hi'}, None) is None
+
+
+def test_task_manager_submit_task_releases_claim_on_failure(task_manager, mocker):
+    # A failed submission releases its key so the client can retry
+    mocker.patch.object(task_manager.cache_manager, 'claim', return_value=None)
+    mock_delete = mocker.patch.object(task_manager.cache_manager, 'delete')
+    mocker.patch('app.models.task.Task.create', side_effect=RuntimeError('database down'))
+
+    with pytest.raises(RuntimeError):
+        task_manager.submit_task('sum_two_numbers', {'a': 1, 'b': 2}, 'retry-key')
+    # Along with the placeholder state of the task
+    deleted = [call[0][0] for call in mock_delete.call_args_list]
+    assert len(deleted) == 2
+    assert deleted[0].startswith('task-dedup-') and deleted[1].startswith('task-state-')
+
+
+def test_task_manager_submit_task_claims_in_database(task_manager, mocker):
+    # When Redis is down the key is claimed in the database by the insert of the task, in the same transaction
+    from redis.exceptions import ConnectionError
+    from app.models.task import DuplicateSubmissionError
+    mocker.patch.object(task_manager.cache_manager, 'claim', side_effect=ConnectionError())
+    mocker.patch.object(task_manager, '_get_cached_output', return_value=None)
+    mock_release = mocker.patch('app.models.task.Task.release_dedup_key')
+    mock_create = mocker.patch('app.models.task.Task.create',
+                               side_effect=lambda db, task_uuid, *args, **kwargs: MagicMock(uuid=task_uuid))
+    mocker.patch.object(task_manager.outbox_relay, 'notify')
+
+    result = task_manager.submit_task('sum_two_numbers', {'a': 1, 'b': 2}, 'retry-key')
+    spec = task_manager._resolve_task('sum_two_numbers', {'a': 1, 'b': 2})[0]
+    assert mock_create.call_args[1]['dedup'] == (task_manager._dedup_key(spec, {'a': 1, 'b': 2}, 'retry-key'), 600)
+    assert result == {'task_uuid': mock_create.call_args[0][1]}
+
+    mock_create.side_effect = DuplicateSubmissionError('existing-uuid')
+    assert task_manager.submit_task('sum_two_numbers', {'a': 1, 'b': 2}, 'retry-key') == {
+        'task_uuid': 'existing-uuid', 'deduplicated': True}
+
+    mock_create.side_effect = RuntimeError('database down')
+    with pytest.raises(RuntimeError):
+        task_manager.submit_task('sum_two_numbers', {'a': 1, 'b': 2}, 'retry-key')
+    mock_release.assert_called_once()
+
+
+def test_task_manager_offloads_large_parameters(task_manager, mocker):
+    # Large parameters are stored once in the blob store, the broker and the tasks table get a reference
+    mocker.patch.dict(task_manager.config, {'BLOB_THRESHOLD': 100})
+    mocker.patch.object(task_manager.blob_store, 'put_text', return_value='a' * 64)
+    mock_create = mocker.patch('app.models.task.Task.create', return_value=MagicMock(uuid='test-uuid'))
+    mocker.patch.object(task_manager.outbox_relay, 'notify')
+
+    task_manager.create_task('find_longest_consecutive_letters', {'string': 'x' * 1000})
+    assert mock_create.call_args[0][4].args == [{'$blob': 'a' * 64}]
+    assert mock_create.call_args[0][3] == {'string': {'$blob': 'a' * 64}}
+
+    task_manager.create_task('find_longest_consecutive_letters', {'string': 'x' * 10})
+    assert mock_create.call_args[0][4].args == ['x' * 10]
+
+
+def test_task_manager_list_tasks(task_manager, mocker):
+    # A page fetches one extra row to know whether a next cursor is needed, the cursor resumes after the last task
+    from datetime import datetime, timezone
+    from app.tasks.validation import ValidationError
+    tasks = [Task(f'00000000-0000-0000-0000-00000000000{i}', 'sum_two_numbers', None, 'PENDING', None,
+                  datetime(2024, 1, 1, 0, 0, 10 - i, tzinfo=timezone.utc)) for i in range(3)]
+    mock_list = mocker.patch('app.models.task.Task.list_page', return_value=tasks)
+
+    page = task_manager.list_tasks(status='PENDING', limit=2)
+    assert [task['task_uuid'] for task in page['tasks']] == [tasks[0].uuid, tasks[1].uuid]
+    mock_list.assert_called_once_with(task_manager.db_manager, None, 'PENDING', 3, None)
+
+    mock_list.return_value = tasks[2:]
+    page = task_manager.list_tasks(status='PENDING', limit=2, cursor=page['next_cursor'])
+    assert page['next_cursor'] is None
+    assert mock_list.call_args[0][4] == (tasks[1].created_at.isoformat(), tasks[1].uuid)
+
+    with pytest.raises(ValidationError):
+        task_manager.list_tasks(cursor='not-a-cursor')
+    with pytest.raises(ValidationError):
+        task_manager.list_tasks(limit=0)
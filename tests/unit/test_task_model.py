@@ -1,5 +1,6 @@
 import pytest
-from app.models.task import Task
+from app.models.task import Task, DuplicateSubmissionError
+import json
 import uuid
 
 
@@ -39,3 +40,112 @@ def test_task_update_status(db_manager, mocker):
     assert task.status == 'COMPLETED'
     assert task.output == {'result': 42}
     mock_execute.assert_called_once()
+
+
+def test_task_create_many(db_manager, mocker):
+    # All rows should be inserted with a single multi-row statement
+    mock_execute_values = mocker.patch.object(db_manager, 'execute_values')
+    tasks = Task.create_many(db_manager, [('uuid-1', 'test_task', {'a': 1}), ('uuid-2', 'test_task', {'a': 2})])
+    assert [task.uuid for task in tasks] == ['uuid-1', 'uuid-2']
+    assert all(task.status == 'PENDING' for task in tasks)
+    mock_execute_values.assert_called_once()
+    assert len(mock_execute_values.call_args[0][1]) == 2
+
+
+def test_task_get_many(db_manager, mocker):
+    # Only well formed UUIDs are queried, with a single ANY() lookup
+    test_uuid = str(uuid.uuid4())
+    mock_execute = mocker.patch.object(db_manager, 'execute')
+    mock_execute.return_value = [{
+        'uuid': test_uuid,
+        'name': 'test_task',
+        'parameters': {'param': 'value'},
+        'status': 'PENDING',
+        'output': None
+    }]
+
+    tasks = Task.get_many(db_manager, [test_uuid, 'not-a-uuid'])
+    assert list(tasks) == [test_uuid]
+    assert tasks[test_uuid].status == 'PENDING'
+    mock_execute.assert_called_once_with("SELECT * FROM tasks WHERE uuid = ANY(%s::uuid[])", ([test_uuid], ))
+
+
+def test_task_update_status_many(db_manager, mocker):
+    mock_execute_values = mocker.patch.object(db_manager, 'execute_values')
+    Task.update_status_many(db_manager, [('uuid-1', 'COMPLETED', 0), ('uuid-2', 'FAILED', {'error': 'boom'})])
+    mock_execute_values.assert_called_once()
+    rows = mock_execute_values.call_args[0][1]
+    assert [(task_uuid, status, json.loads(output)) for task_uuid, status, output in rows] == [
+        ('uuid-1', 'COMPLETED', 0),
+        ('uuid-2', 'FAILED', {'error': 'boom'}),
+    ]
+
+
+def test_task_mark_finished(db_manager, mocker):
+    # The existence check and the update are a single statement
+    mock_execute = mocker.patch.object(db_manager, 'execute', return_value=[{'uuid': 'test-uuid'}])
+    assert Task.mark_finished(db_manager, 'test-uuid', 'COMPLETED', 0) is True
+    mock_execute.assert_called_once_with(
+        "UPDATE tasks SET status = %s, output = %s, finished_at = now() WHERE uuid = %s RETURNING uuid",
+        ('COMPLETED', '0', 'test-uuid')
+    )
+
+    mock_execute.return_value = []
+    assert Task.mark_finished(db_manager, 'missing-uuid', 'COMPLETED', 0) is False
+
+
+def test_task_create_claims_dedup_key(db_manager, mocker):
+    # The key is claimed and the task inserted in one transaction, rolled back when another task owns the key
+    mock_conn = mocker.MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mocker.patch.object(db_manager, 'get_connection').return_value.__enter__.return_value = mock_conn
+
+    mock_cursor.fetchone.return_value = {'task_uuid': 'new-uuid'}
+    task = Task.create(db_manager, 'new-uuid', 'sum_two_numbers', {'a': 1, 'b': 2}, dedup=('key', 600))
+    assert task.uuid == 'new-uuid'
+    assert 'INSERT INTO task_dedup' in mock_cursor.execute.call_args_list[0][0][0]
+    assert mock_cursor.execute.call_args_list[1][0][0].startswith('INSERT INTO tasks')
+    mock_conn.commit.assert_called_once()
+
+    mock_cursor.reset_mock()
+    mock_cursor.fetchone.side_effect = [None, {'task_uuid': 'old-uuid'}]
+    with pytest.raises(DuplicateSubmissionError) as error:
+        Task.create(db_manager, 'new-uuid', 'sum_two_numbers', {'a': 1, 'b': 2}, dedup=('key', 600))
+    assert error.value.owner == 'old-uuid'
+    assert mock_cursor.execute.call_count == 2
+    mock_conn.rollback.assert_called_once()
+
+
+def test_task_list_page(db_manager, mocker):
+    # Filters and the keyset condition are combined in one query ordered like the indexes
+    from datetime import datetime, timezone
+    created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    mock_execute = mocker.patch.object(db_manager, 'execute', return_value=[{
+        'uuid': uuid.UUID('00000000-0000-0000-0000-000000000001'),
+        'name': 'sum_two_numbers',
+        'status': 'FAILED',
+        'created_at': created_at,
+        'finished_at': None
+    }])
+
+    tasks = Task.list_page(db_manager, status='FAILED', limit=10, after=('2024-01-02T00:00:00+00:00', 'uuid'))
+    assert tasks[0].uuid == '00000000-0000-0000-0000-000000000001'
+    assert tasks[0].created_at == created_at
+    mock_execute.assert_called_once_with(
+        "SELECT uuid, name, status, created_at, finished_at FROM tasks "
+        "WHERE status = %s AND (created_at, uuid) < (%s::timestamptz, %s::uuid) "
+        "ORDER BY created_at DESC, uuid DESC LIMIT %s",
+        ('FAILED', '2024-01-02T00:00:00+00:00', 'uuid', 10)
+    )
+
+
+def test_task_create_with_outbox_message(db_manager, mocker):
+    # The task and its outbox message are inserted by a single statement, so they are committed together
+    from app.models.task import OutboxMessage
+    mock_execute = mocker.patch.object(db_manager, 'execute')
+    Task.create(db_manager, 'uuid-1', 'test_task', {'a': 1}, OutboxMessage('app.tasks.test_task', [1], {'queue': 'fast'}))
+
+    mock_execute.assert_called_once()
+    query, params = mock_execute.call_args[0]
+    assert 'INSERT INTO tasks' in query and 'INSERT INTO task_outbox' in query
+    assert params[4:] == ('app.tasks.test_task', '[1]', '{"queue":"fast"}')
@@ -0,0 +1,95 @@
+from datetime import date
+
+from app.models.task_partitions import (create_partitions, retire_partitions, list_partitions, partition_name,
+                                        period_start)
+
+
+def mock_catalog(db_manager, mocker, names, stray=False):
+    # Answer the catalog query with the given partitions, and whether tasks_default holds rows of a new partition,
+    # and record the other statements
+    statements = []
+
+    def execute(query, params=None):
+        if 'pg_inherits' in query:
+            return [{'name': name} for name in names]
+        if 'tasks_default' in query and query.startswith('SELECT'):
+            return [{'stray': stray}]
+        statements.append((query, params))
+        return None
+    mocker.patch.object(db_manager, 'execute', side_effect=execute)
+    return statements
+
+
+def test_partition_names_and_periods():
+    assert partition_name(date(2024, 1, 4), date(2024, 1, 11)) == 'tasks_20240104_20240111'
+    assert partition_name(None, date(2024, 1, 11)) == 'tasks_min_20240111'
+    # Periods are aligned on the epoch, so every node computes the same bounds
+    assert period_start(date(2024, 1, 10), 7) == date(2024, 1, 4)
+    assert period_start(date(2024, 1, 10), 1) == date(2024, 1, 10)
+
+
+def test_list_partitions(db_manager, mocker):
+    mock_catalog(db_manager, mocker, ['tasks_20240111_20240118', 'tasks_min_20240111', 'unrelated'])
+    assert [(p.name, p.start, p.end) for p in list_partitions(db_manager)] == [
+        ('tasks_min_20240111', None, date(2024, 1, 11)),
+        ('tasks_20240111_20240118', date(2024, 1, 11), date(2024, 1, 18)),
+    ]
+
+
+def test_create_partitions_after_existing_ones(db_manager, mocker):
+    # Periods already covered are skipped, the first one only partly covered starts where the others end
+    statements = mock_catalog(db_manager, mocker, ['tasks_min_20240106'])
+    created = create_partitions(db_manager, 7, 2, today=date(2024, 1, 5))
+    assert created == ['tasks_20240106_20240111', 'tasks_20240111_20240118', 'tasks_20240118_20240125']
+    assert len(statements) == 3
+    assert statements[0][0].startswith("CREATE TABLE IF NOT EXISTS tasks_20240106_20240111 PARTITION OF tasks")
+
+
+def test_create_partitions_after_a_gap(db_manager, mocker):
+    # The periods missed since the last partition get theirs, for the tasks that went to tasks_default meanwhile
+    mock_catalog(db_manager, mocker, ['tasks_20231221_20231228'])
+    created = create_partitions(db_manager, 7, 0, today=date(2024, 1, 5))
+    assert created == ['tasks_20231228_20240104', 'tasks_20240104_20240111']
+
+
+def test_create_partitions_moves_rows_from_the_default_partition(db_manager, mocker):
+    # The rows of the new partition already in tasks_default are moved to it, with tasks_default detached meanwhile
+    statements = mock_catalog(db_manager, mocker, ['tasks_min_20240104'], stray=True)
+    mock_conn = mocker.MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mocker.patch.object(db_manager, 'get_connection').return_value.__enter__.return_value = mock_conn
+
+    assert create_partitions(db_manager, 7, 0, today=date(2024, 1, 5)) == ['tasks_20240104_20240111']
+    assert statements == []
+    queries = [call.args[0] for call in mock_cursor.execute.call_args_list]
+    assert queries[0] == "ALTER TABLE tasks DETACH PARTITION tasks_default"
+    assert queries[1].startswith("CREATE TABLE IF NOT EXISTS tasks_20240104_20240111 PARTITION OF tasks")
+    assert queries[2].startswith("WITH moved AS (DELETE FROM tasks_default")
+    assert queries[2].endswith("INSERT INTO tasks_20240104_20240111 SELECT * FROM moved")
+    assert queries[3] == "ALTER TABLE tasks ATTACH PARTITION tasks_default DEFAULT"
+    mock_conn.commit.assert_called_once()
+
+
+def test_retire_partitions(db_manager, mocker):
+    # Partitions ending before the cutoff are detached and dropped, the current one never is
+    statements = mock_catalog(db_manager, mocker,
+                              ['tasks_min_20240104', 'tasks_20240104_20240111', 'tasks_20240111_20240118'])
+    retired = retire_partitions(db_manager, 30, today=date(2024, 2, 12))
+    assert retired == ['tasks_min_20240104', 'tasks_20240104_20240111']
+    assert [query for query, _ in statements] == [
+        "ALTER TABLE tasks DETACH PARTITION tasks_min_20240104",
+        "DROP TABLE tasks_min_20240104",
+        "ALTER TABLE tasks DETACH PARTITION tasks_20240104_20240111",
+        "DROP TABLE tasks_20240104_20240111",
+    ]
+
+    statements.clear()
+    assert retire_partitions(db_manager, 30, drop=False, today=date(2024, 2, 5)) == ['tasks_min_20240104']
+    assert [query for query, _ in statements] == ["ALTER TABLE tasks DETACH PARTITION tasks_min_20240104"]
+
+
+def test_retire_partitions_archives_first(db_manager, mocker, tmp_path):
+    mock_catalog(db_manager, mocker, ['tasks_min_20240104', 'tasks_20240104_20240111'])
+    mock_archive = mocker.patch('app.models.task_partitions.archive_partition', return_value='archive.csv.gz')
+    retire_partitions(db_manager, 30, archive_dir=str(tmp_path), today=date(2024, 2, 12))
+    mock_archive.assert_called_once_with(db_manager, 'tasks_min_20240104', str(tmp_path))
@@ -0,0 +1,30 @@
+import pytest
+
+from app.tasks.validation import compile_validator, ValidationError
+
+
+@pytest.fixture
+def validate():
+    return compile_validator({'a': int, 'text': str}, {'text': 5})
+
+
+def test_validator_accepts_valid_parameters(validate):
+    validate({'a': 1, 'text': 'abc'})
+
+
+@pytest.mark.parametrize('parameters, message', [
+    ([1, 'abc'], 'Task parameters must be an object'),
+    ({'text': 'abc'}, 'Missing parameter: a'),
+    ({'a': '1', 'text': 'abc'}, "Parameter 'a' must be an integer"),
+    ({'a': True, 'text': 'abc'}, "Parameter 'a' must be an integer"),
+    ({'a': 1, 'text': 'abcdef'}, "Parameter 'text' exceeds the maximum length of 5"),
+    ({'a': 1, 'text': 'abc', 'b': 2}, 'Unexpected parameters: b'),
+])
+def test_validator_rejects_invalid_parameters(validate, parameters, message):
+    with pytest.raises(ValidationError, match=message):
+        validate(parameters)
+
+
+def test_validator_rejects_limits_for_unknown_parameters():
+    with pytest.raises(ValueError):
+        compile_validator({'a': int}, {'b': 1})